@@ -0,0 +1,141 @@
+"""
+Compares the output compression presets of common.COMPRESSION_PRESETS.
+
+Writes the same events with every preset and reports the write time, the
+file size and the time to read all entries back.
+
+By default an existing (NanoML) file is rewritten with every preset;
+its trees are copied entry by entry, so every basket is decompressed
+and compressed again, and only the compression differs between presets:
+
+    python bench_compression.py nanoml.root
+
+With --cmsrun, nanoML_cfg.py runs on the given RECO file once per
+preset, one job at a time; the write time is then the wall and CPU time
+of the whole cmsRun job:
+
+    python bench_compression.py --cmsrun reco.root -n 10
+"""
+from __future__ import print_function
+import os, os.path as osp
+import time
+import json
+
+import ROOT
+
+import common
+import rootio
+
+THIS_DIR = osp.dirname(osp.abspath(__file__))
+
+
+def iter_trees(tfile):
+    names = []
+    for key in tfile.GetListOfKeys():
+        if key.GetName() in names: continue
+        names.append(key.GetName())
+        if key.GetClassName() == 'TTree': yield tfile.Get(key.GetName())
+
+
+def set_branch_compression(branches, settings):
+    for branch in branches:
+        branch.SetCompressionSettings(settings)
+        set_branch_compression(branch.GetListOfBranches(), settings)
+
+
+def rewrite(src, dst, preset):
+    """
+    Copies all trees of `src` to `dst` with the compression of `preset`.
+    Returns (wall, cpu) time.
+    """
+    settings = common.compression_settings(preset)
+    t0, cpu0 = time.time(), time.process_time()
+    with rootio.open_root(src) as fin, rootio.open_root(dst, 'RECREATE') as fout:
+        fout.SetCompressionSettings(settings)
+        for tree in iter_trees(fin):
+            fout.cd()
+            clone = tree.CloneTree(0)
+            set_branch_compression(clone.GetListOfBranches(), settings)
+            # Without the 'fast' option, every basket is recompressed
+            clone.CopyEntries(tree)
+            clone.Write()
+    return time.time() - t0, time.process_time() - cpu0
+
+
+def run_nanoml(rootfile, dst, preset, n_events=None):
+    """
+    Runs nanoML_cfg.py with the compression of `preset`. Returns (wall, cpu)
+    time of the cmsRun job.
+    """
+    cmd = [
+        'cmsRun', osp.join(THIS_DIR, 'nanoML_cfg.py'),
+        'inputFiles=file:' + osp.abspath(common.strip_file_prefix(rootfile)),
+        'out=file:' + dst, 'compression=' + preset,
+        ]
+    if n_events is not None: cmd.append('maxEvents={}'.format(n_events))
+    job = common.Job(cmd, cwd=osp.dirname(dst), log=dst.replace('.root', '.log'), name='nanoml_' + preset)
+    common.Executor(max_jobs=1).run([job])
+    if job.returncode != 0: raise Exception('Status {}! Command: {}'.format(job.returncode, ' '.join(cmd)))
+    return job.resources['wall'], job.resources['user'] + job.resources['sys']
+
+
+def read_back(path):
+    """
+    Reads every entry of every tree. Returns the wall time.
+    """
+    t0 = time.time()
+    with rootio.open_root(path) as f:
+        for tree in iter_trees(f):
+            for i in range(int(tree.GetEntries())):
+                tree.GetEntry(i)
+    return time.time() - t0
+
+
+def bench(rootfile, presets, work_dir, cmsrun=False, n_events=None):
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    for preset in presets:
+        dst = osp.abspath(osp.join(work_dir, preset + '.root'))
+        if cmsrun:
+            wall, cpu = run_nanoml(rootfile, dst, preset, n_events)
+        else:
+            wall, cpu = rewrite(rootfile, dst, preset)
+        algorithm, level = common.compression_preset(preset)
+        results.append(dict(
+            preset = preset, algorithm = algorithm, level = level,
+            write_wall = wall, write_cpu = cpu,
+            size = osp.getsize(dst),
+            read_wall = read_back(dst),
+            ))
+        common.logger.info('%s: %s', preset, results[-1])
+    return results
+
+
+def format_results(results):
+    header = '{:<10} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'preset', 'algorithm', 'write [s]', 'cpu [s]', 'size [MB]', 'read [s]'
+        )
+    lines = [header, '-'*len(header)]
+    for r in results:
+        lines.append('{:<10} {:>10} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+            r['preset'], '{}-{}'.format(r['algorithm'], r['level']),
+            r['write_wall'], r['write_cpu'], r['size'] / 1024**2, r['read_wall']
+            ))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('rootfile', type=str, help='File to rewrite, or RECO input with --cmsrun')
+    parser.add_argument('--presets', type=str, nargs='*', default=list(common.COMPRESSION_PRESETS), choices=list(common.COMPRESSION_PRESETS))
+    parser.add_argument('--cmsrun', action='store_true', help='Run nanoML_cfg.py per preset instead of rewriting rootfile')
+    parser.add_argument('-n', '--nevents', type=int, default=None, help='Max number of events with --cmsrun')
+    parser.add_argument('-d', '--work-dir', type=str, default='bench_compression')
+    parser.add_argument('--json', type=str, default=None, help='Also write the results to this file')
+    args = parser.parse_args()
+    results = bench(args.rootfile, args.presets, args.work_dir, cmsrun=args.cmsrun, n_events=args.nevents)
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,123 @@
+"""
+Measures how much of a file the inspection tools read.
+
+Reads the products that one of the print tools uses from the first `n`
+events of a file, in three ways:
+- all: every branch enabled, `tree.GetEntry` per event, no TTreeCache
+  (how the tools used to loop `for _ in tree`)
+- lazy: only the used branches are read, through rootio.EventView, but
+  without pruning and TTreeCache
+- pruned: like lazy, after rootio.prepare_tree (unused branches disabled,
+  TTreeCache sized for the used branches, asynchronous prefetching)
+
+and reports the bytes read from the file, the number of read calls, and
+the wall and CPU time per mode. Bytes read do not depend on the order of
+the modes; wall times do, as later modes may find the file in the page
+cache.
+
+    python bench_io.py reco.root --tool reco -n 50
+"""
+from __future__ import print_function
+import time
+import json
+
+import ROOT
+from DataFormats.FWLite import Events, Handle
+
+import rootio
+
+
+def tool_branches(tool):
+    if tool == 'reco':
+        import print_reco as module
+    elif tool == 'sim':
+        import print_sim as module
+    elif tool == 'alltracks':
+        import print_all_tracks_and_vertices as module
+    else:
+        raise Exception('Unknown tool {}'.format(tool))
+    return [branch for branch, _ in module.EXTRACTORS.values()]
+
+
+def existing_branches(tree, branches):
+    out = []
+    for branch in branches:
+        try:
+            rootio.resolve_branch(tree, branch)
+            out.append(branch)
+        except Exception:
+            print('Skipping missing branch {}'.format(branch))
+    return out
+
+
+def bench(rootfile, branches, mode, n=None):
+    with rootio.open_root(rootfile, prefetch=(mode == 'pruned')) as f:
+        tree = f.Get('Events')
+        branches = existing_branches(tree, branches)
+        if mode == 'pruned':
+            cache_bytes = rootio.prepare_tree(tree, branches)
+        else:
+            cache_bytes = 0
+            tree.SetCacheSize(0)
+        names = [rootio.resolve_branch(tree, b) for b in branches]
+        t0, cpu0 = time.time(), time.process_time()
+        n_events = 0
+        n_objects = 0
+        if mode == 'all':
+            n_entries = int(tree.GetEntries())
+            if n is not None: n_entries = min(n, n_entries)
+            for i in range(n_entries):
+                tree.GetEntry(i)
+                n_objects += sum(int(getattr(tree, name).product().size()) for name in names)
+                n_events += 1
+        else:
+            for event in rootio.iter_events(tree, n=n):
+                n_objects += sum(event.size(name) for name in names)
+                n_events += 1
+        return dict(
+            mode = mode,
+            events = n_events,
+            objects = n_objects,
+            branches = len(names),
+            cache_mb = cache_bytes / 1024**2,
+            read_mb = f.GetBytesRead() / 1024**2,
+            read_calls = int(f.GetReadCalls()),
+            wall = time.time() - t0,
+            cpu = time.process_time() - cpu0,
+            )
+
+
+def format_results(results):
+    header = '{:<8} {:>7} {:>9} {:>10} {:>10} {:>11} {:>9} {:>9}'.format(
+        'mode', 'events', 'branches', 'cache [MB]', 'read [MB]', 'read calls', 'wall [s]', 'cpu [s]'
+        )
+    lines = [header, '-'*len(header)]
+    for r in results:
+        lines.append('{:<8} {:>7} {:>9} {:>10.1f} {:>10.1f} {:>11} {:>9.2f} {:>9.2f}'.format(
+            r['mode'], r['events'], r['branches'], r['cache_mb'], r['read_mb'],
+            r['read_calls'], r['wall'], r['cpu']
+            ))
+    base = results[0]
+    for r in results[1:]:
+        if r['read_mb'] > 0. and r['wall'] > 0.:
+            lines.append('{}: {:.1f}x less read, {:.1f}x faster than {}'.format(
+                r['mode'], base['read_mb'] / r['read_mb'], base['wall'] / r['wall'], base['mode']
+                ))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('rootfile', type=str)
+    parser.add_argument('--tool', type=str, default='reco', choices=['reco', 'sim', 'alltracks'])
+    parser.add_argument('-n', '--nevents', type=int, default=None)
+    parser.add_argument('--modes', type=str, nargs='*', default=['all', 'lazy', 'pruned'])
+    parser.add_argument('--json', type=str, default=None, help='Also write the results to this file')
+    args = parser.parse_args()
+    branches = tool_branches(args.tool)
+    results = [bench(args.rootfile, branches, mode, args.nevents) for mode in args.modes]
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,107 @@
+"""
+Measures the event throughput of AllSimTracksAndVerticesProducer against
+the number of threads (with one stream per thread).
+
+For every thread count, throughput_cfg.py runs twice on the same events:
+once with only the mixing and once with the producer, one job at a time.
+The throughput is the EventThroughput of the Timing service from the
+framework job report; the producer cost is the difference in wall time
+per event between the two jobs.
+
+    python bench_throughput.py muon_digi.root --pu catalog:/data/minbias_D86 -n 200 --threads 1 2 4 8
+"""
+from __future__ import print_function
+import os, os.path as osp
+import json
+import xml.etree.ElementTree as ET
+
+import common
+
+THIS_DIR = osp.dirname(osp.abspath(__file__))
+
+
+def parse_job_report(path):
+    """
+    Returns the metrics of the PerformanceReport of a framework job report
+    as a dict of name -> float (non-numeric values are skipped).
+    """
+    metrics = {}
+    for metric in ET.parse(path).getroot().iter('Metric'):
+        try:
+            metrics[metric.get('Name')] = float(metric.get('Value'))
+        except (TypeError, ValueError):
+            pass
+    return metrics
+
+
+def run(rootfile, pu, n_threads, producer, work_dir, n_events=None):
+    name = 'throughput_t{}_{}'.format(n_threads, 'producer' if producer else 'mix')
+    report = osp.join(work_dir, name + '.xml')
+    cmd = [
+        'cmsRun', '-j', report, osp.join(THIS_DIR, 'throughput_cfg.py'),
+        'inputFiles=file:' + osp.abspath(common.strip_file_prefix(rootfile)),
+        'pu=' + ','.join(pu),
+        'nThreads={}'.format(n_threads), 'nStreams={}'.format(n_threads),
+        'producer={}'.format(producer),
+        ]
+    if n_events is not None: cmd.append('maxEvents={}'.format(n_events))
+    job = common.Job(cmd, cwd=work_dir, log=osp.join(work_dir, name + '.log'), name=name)
+    common.Executor(max_jobs=1).run([job])
+    if job.returncode != 0: raise Exception('Status {}! Command: {}'.format(job.returncode, ' '.join(cmd)))
+    metrics = parse_job_report(report)
+    common.check_job_report_threading(metrics, n_threads, n_threads)
+    return dict(
+        threads = n_threads,
+        producer = producer,
+        throughput = metrics.get('EventThroughput', 0.),
+        wall = job.resources['wall'],
+        cpu = job.resources['user'] + job.resources['sys'],
+        )
+
+
+def bench(rootfile, pu, threads, work_dir, n_events=None):
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    for n_threads in threads:
+        for producer in [False, True]:
+            results.append(run(rootfile, pu, n_threads, producer, work_dir, n_events))
+            common.logger.info('%s', results[-1])
+    return results
+
+
+def format_results(results):
+    header = '{:>8} {:>16} {:>16} {:>20}'.format(
+        'threads', 'mix [ev/s]', 'producer [ev/s]', 'producer [ms/event]'
+        )
+    lines = [header, '-'*len(header)]
+    by_threads = {}
+    for r in results:
+        by_threads.setdefault(r['threads'], {})[r['producer']] = r['throughput']
+    for n_threads, r in sorted(by_threads.items()):
+        mix, producer = r.get(False, 0.), r.get(True, 0.)
+        cost = 1000. * (1. / producer - 1. / mix) if mix > 0. and producer > 0. else float('nan')
+        lines.append('{:>8} {:>16.2f} {:>16.2f} {:>20.3f}'.format(n_threads, mix, producer, cost))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('rootfile', type=str, help='DIGI file with SimTracks and SimVertices')
+    parser.add_argument('--pu', type=str, nargs='+', required=True, help='Pileup files or catalog:<directory>')
+    parser.add_argument('--threads', type=int, nargs='*', default=[1, 2, 4, 8])
+    parser.add_argument('-n', '--nevents', type=int, default=None)
+    parser.add_argument('-d', '--work-dir', type=str, default='bench_throughput')
+    parser.add_argument('--json', type=str, default=None, help='Also write the results to this file')
+    args = parser.parse_args()
+    # The jobs run in the work dir, so paths have to be absolute
+    pu = [
+        'catalog:' + osp.abspath(p[len('catalog:'):]) if p.startswith('catalog:')
+        else 'file:' + osp.abspath(common.strip_file_prefix(p))
+        for p in args.pu
+        ]
+    results = bench(args.rootfile, pu, args.threads, osp.abspath(args.work_dir), n_events=args.nevents)
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
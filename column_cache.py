@@ -0,0 +1,234 @@
+"""
+Sidecar cache of the per-event columns of a ROOT file.
+
+The columns of `columns.read` are stored as one .npy file per column in
+`<rootfile>.columns/<key>/`, next to the input file, and loaded
+memory-mapped: a cached file opens in milliseconds, only the pages that
+are actually used are read, and concurrent processes share them through
+the page cache.
+
+Every entry records the size, mtime and content digest (see
+`common.file_digest`) of the ROOT file, the branch it was read from and
+the version of the extraction code; an entry that does not match all of
+them is re-extracted. If the directory of the input file is not
+writable, the sidecar goes to $PU_COLUMN_CACHE (default
+~/.cache/pu_attempt1/columns) instead.
+
+    cache = ColumnCache('reco.root')
+    cols = cache.get(tree, {'tracks': ('SimTracks_g4SimHits__SIM', columns.simtracks)})
+"""
+from __future__ import print_function
+
+import os, os.path as osp
+import hashlib, json
+import shutil
+import fcntl
+from contextlib import contextmanager
+
+import numpy as np
+
+import common
+import columns
+import rootio
+
+# Bump when the layout of the cache changes
+CACHE_VERSION = 1
+
+
+def schema_digest(extract):
+    """
+    Identifies the code that produced the columns: the C++ helper, the
+    column specs and the extraction function.
+    """
+    specs = sorted(
+        (name, repr(value)) for name, value in vars(columns).items() if name.endswith('_COLUMNS')
+        )
+    return hashlib.sha256(json.dumps([
+        CACHE_VERSION, columns.CPP_HELPER, specs, extract.__name__
+        ]).encode()).hexdigest()
+
+
+def default_cache_dir(rootfile):
+    rootfile = osp.abspath(rootfile)
+    if os.access(osp.dirname(rootfile), os.W_OK):
+        return rootfile + '.columns'
+    base = os.environ.get(
+        'PU_COLUMN_CACHE',
+        osp.join(osp.expanduser('~'), '.cache', 'pu_attempt1', 'columns')
+        )
+    return osp.join(
+        base, hashlib.sha256(rootfile.encode()).hexdigest()[:16] + '_' + osp.basename(rootfile)
+        )
+
+
+class ColumnCache(object):
+    """
+    Column cache of one ROOT file; one entry per extractor key.
+    """
+    def __init__(self, rootfile, path=None):
+        self.rootfile = osp.abspath(rootfile)
+        self.path = default_cache_dir(rootfile) if path is None else osp.abspath(path)
+        self._source = None
+
+    def __repr__(self):
+        return '<ColumnCache {}>'.format(self.path)
+
+    def source(self):
+        """
+        Size, mtime and content digest of the ROOT file (digest computed
+        once per instance).
+        """
+        stat = os.stat(self.rootfile)
+        if self._source is None or self._source[:2] != (stat.st_size, stat.st_mtime_ns):
+            self._source = (stat.st_size, stat.st_mtime_ns, common.file_digest(self.rootfile))
+        return dict(zip(['size', 'mtime_ns', 'digest'], self._source))
+
+    def entry_path(self, key):
+        return osp.join(self.path, key)
+
+    @contextmanager
+    def lock(self):
+        """
+        Exclusive lock on the cache directory, held while extracting, so
+        that concurrent processes (e.g. the chunk workers of fanout.py)
+        extract a file only once and then load each other's entries.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(osp.join(self.path, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def meta(self, branch, extract, n_entries):
+        meta = self.source()
+        meta.update(branch=branch, schema=schema_digest(extract), n_entries=n_entries)
+        return meta
+
+    def load(self, key, meta):
+        """
+        Returns the memory-mapped columns of `key`, or None if there is no
+        entry matching `meta`.
+        """
+        path = self.entry_path(key)
+        try:
+            with open(osp.join(path, 'meta.json'), 'r') as f:
+                stored = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if stored.get('meta') != meta: return None
+        try:
+            return {
+                name: np.load(osp.join(path, name + '.npy'), mmap_mode='r')
+                for name in stored['columns']
+                }
+        except (IOError, OSError, ValueError):
+            return None
+
+    def store(self, key, meta, cols, replace=False):
+        """
+        Writes the entry in a temporary directory first, and swaps it in
+        with a rename: readers never see a half-written entry, and
+        processes that still have the old entry mapped keep their pages.
+        An existing entry that matches `meta` is kept unless `replace`.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        path = self.entry_path(key)
+        if not replace and self.load(key, meta) is not None: return
+        tmp = '{}.tmp{}'.format(path, os.getpid())
+        old = '{}.old{}'.format(path, os.getpid())
+        if osp.isdir(tmp): shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        try:
+            for name, values in cols.items():
+                np.save(osp.join(tmp, name + '.npy'), np.ascontiguousarray(values))
+            with open(osp.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(dict(meta=meta, columns=list(cols)), f)
+            if osp.isdir(path): os.rename(path, old)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # Another process installed the entry in between
+                if self.load(key, meta) is None: raise
+        finally:
+            for d in [tmp, old]:
+                if osp.isdir(d): shutil.rmtree(d)
+
+    def get(self, tree, extractors, recreate=False):
+        """
+        Like `columns.read(tree, extractors)`, but only extracts the keys
+        without a valid cache entry (in one pass over the tree), and
+        returns memory-mapped arrays.
+        """
+        n_entries = int(tree.GetEntries())
+        metas = {
+            key: self.meta(rootio.resolve_branch(tree, branch), fn, n_entries)
+            for key, (branch, fn) in extractors.items()
+            }
+        out = {}
+        if not recreate:
+            for key in extractors:
+                cols = self.load(key, metas[key])
+                if cols is not None: out[key] = cols
+        missing = {key: extractors[key] for key in extractors if key not in out}
+        if not missing: return out
+        with self.lock():
+            if not recreate:
+                # Entries another process extracted while we waited for the lock
+                for key in list(missing):
+                    cols = self.load(key, metas[key])
+                    if cols is None: continue
+                    out[key] = cols
+                    del missing[key]
+            if missing:
+                common.logger.info(
+                    'Extracting %s from %s into %s', ', '.join(missing), self.rootfile, self.path
+                    )
+                for key, cols in columns.read(tree, missing).items():
+                    self.store(key, metas[key], cols, replace=recreate)
+                    out[key] = self.load(key, metas[key])
+        return out
+
+
+def resolve_extractors(tree, extractors, optional=()):
+    """
+    Resolves the branch names of `extractors` in `tree`. Keys in
+    `optional` whose branch does not exist are dropped.
+    """
+    out = {}
+    for key, (branch, fn) in extractors.items():
+        try:
+            out[key] = (rootio.resolve_branch(tree, branch), fn)
+        except Exception:
+            if key not in optional: raise
+            common.logger.warning('No branch %s; skipping %s', branch, key)
+    return out
+
+
+def iter_events(rootfile, extractors, n=None, cache=False, recreate=False, optional=(), entries=None):
+    """
+    Yields (entry, columns) for the first `n` events (default: all) of
+    `rootfile`, or for the entries in `entries`; columns is a dict
+    key -> columns. With `cache`, all events are extracted once into the
+    sidecar cache, and read from there.
+    Keys in `optional` are left out if their branch does not exist.
+    """
+    with rootio.open_root(rootfile) as f:
+        tree = f.Get('Events')
+        extractors = resolve_extractors(tree, extractors, optional)
+        rootio.prepare_tree(tree, [branch for branch, _ in extractors.values()])
+        n_entries = int(tree.GetEntries())
+        if entries is None:
+            entries = range(n_entries if n is None else min(n, n_entries))
+        else:
+            for entry in entries:
+                if not 0 <= entry < n_entries:
+                    raise Exception('Entry {} out of range; {} has {} entries'.format(entry, rootfile, n_entries))
+        if cache:
+            cols = ColumnCache(rootfile).get(tree, extractors, recreate=recreate)
+            for entry in entries:
+                yield entry, {key: columns.event(cols[key], entry) for key in extractors}
+            return
+        for event in rootio.iter_events(tree, entries=entries):
+            yield event.entry, {key: fn(event.product(branch)) for key, (branch, fn) in extractors.items()}
@@ -0,0 +1,295 @@
+"""
+Columnar extraction of sim and reco products to NumPy arrays.
+
+The per-object accessors are called from a small C++ helper that is
+compiled once with cling; it packs every product into one flat
+std::vector<double> (rows x columns), which is converted to NumPy in a
+single copy. Python never touches the individual objects.
+
+Per event:
+
+    tracks = columns.simtracks(tree.SimTracks_g4SimHits__SIM.product())
+    tracks['track_id'], tracks['pdgid'], ...
+
+In bulk, over many events (see `read`):
+
+    cols = columns.read(tree, {'tracks': ('SimTracks_g4SimHits__SIM', columns.simtracks)})
+    cols['tracks']['track_id'][cols['tracks']['offsets'][i]:cols['tracks']['offsets'][i+1]]
+"""
+from __future__ import print_function
+import numpy as np
+
+import ROOT
+
+import rootio
+
+CPP_HELPER = r'''
+#include <vector>
+#include "SimDataFormats/Track/interface/SimTrack.h"
+#include "SimDataFormats/Vertex/interface/SimVertex.h"
+#include "SimDataFormats/CaloHit/interface/PCaloHit.h"
+#include "SimDataFormats/CaloAnalysis/interface/SimCluster.h"
+#include "SimDataFormats/CaloAnalysis/interface/CaloParticle.h"
+#include "DataFormats/HGCRecHit/interface/HGCRecHit.h"
+
+namespace pucolumns {
+
+std::vector<double> simtracks(const std::vector<SimTrack>& tracks){
+    std::vector<double> out;
+    out.reserve(10*tracks.size());
+    for (const auto& t : tracks){
+        const auto& mom = t.momentum();
+        out.insert(out.end(), {
+            double(t.trackId()), double(t.vertIndex()), double(t.genpartIndex()),
+            double(t.type()), double(t.eventId().rawId()), double(t.crossedBoundary()),
+            mom.E(), mom.Pt(), mom.Eta(), mom.Phi()
+            });
+        }
+    return out;
+    }
+
+std::vector<double> simvertices(const std::vector<SimVertex>& vertices){
+    std::vector<double> out;
+    out.reserve(7*vertices.size());
+    for (const auto& v : vertices){
+        const auto& pos = v.position();
+        out.insert(out.end(), {
+            double(v.vertexId()), double(v.parentIndex()), double(v.eventId().rawId()),
+            pos.x(), pos.y(), pos.z(), pos.t()
+            });
+        }
+    return out;
+    }
+
+std::vector<double> pcalohits(const std::vector<PCaloHit>& hits){
+    std::vector<double> out;
+    out.reserve(4*hits.size());
+    for (const auto& h : hits){
+        out.insert(out.end(), {
+            double(h.id()), h.energy(), h.time(), double(h.geantTrackId())
+            });
+        }
+    return out;
+    }
+
+template <class Collection>
+std::vector<double> hgcrechits(const Collection& hits){
+    std::vector<double> out;
+    out.reserve(4*hits.size());
+    for (const auto& h : hits){
+        out.insert(out.end(), {
+            double(h.id().rawId()), h.energy(), h.time(), double(h.flags())
+            });
+        }
+    return out;
+    }
+
+std::vector<double> simclusters(const std::vector<SimCluster>& clusters){
+    std::vector<double> out;
+    out.reserve(5*clusters.size());
+    for (const auto& c : clusters){
+        out.insert(out.end(), {
+            double(c.particleId()), double(c.pdgId()), double(c.eventId().rawId()),
+            c.energy(), double(c.numberOfRecHits())
+            });
+        }
+    return out;
+    }
+
+std::vector<double> caloparticles(const std::vector<CaloParticle>& particles){
+    std::vector<double> out;
+    out.reserve(4*particles.size());
+    for (const auto& p : particles){
+        out.insert(out.end(), {
+            double(p.particleId()), double(p.pdgId()), double(p.eventId().rawId()), p.energy()
+            });
+        }
+    return out;
+    }
+
+std::vector<double> simcluster_hits(const std::vector<SimCluster>& clusters){
+    size_t n = 0;
+    for (const auto& c : clusters) n += c.numberOfRecHits();
+    std::vector<double> out;
+    out.reserve(4*n);
+    for (size_t i = 0; i < clusters.size(); i++){
+        const auto hits_and_fractions = clusters[i].hits_and_fractions();
+        const auto hits_and_energies = clusters[i].hits_and_energies();
+        for (size_t j = 0; j < hits_and_fractions.size(); j++){
+            out.insert(out.end(), {
+                double(i), double(hits_and_fractions[j].first),
+                double(hits_and_fractions[j].second), double(hits_and_energies[j].second)
+                });
+            }
+        }
+    return out;
+    }
+
+}
+'''
+
+_declared = False
+
+def declare():
+    """
+    Compiles the C++ helper (once per process).
+    """
+    global _declared
+    if not _declared:
+        if not ROOT.gInterpreter.Declare(CPP_HELPER):
+            raise Exception('Could not compile the columns C++ helper')
+        _declared = True
+    return ROOT.pucolumns
+
+
+def to_columns(flat, names, dtypes):
+    """
+    Splits a flat std::vector<double> of rows into named, typed columns.
+    """
+    table = np.array(flat, dtype=np.float64, copy=True).reshape(-1, len(names))
+    return {name: table[:, i].astype(dtype) for i, (name, dtype) in enumerate(zip(names, dtypes))}
+
+
+SIMTRACK_COLUMNS = [
+    ('track_id', np.int64), ('vert_index', np.int64), ('genpart_index', np.int64),
+    ('pdgid', np.int64), ('event_id', np.uint32), ('crossed_boundary', np.bool_),
+    ('energy', np.float64), ('pt', np.float64), ('eta', np.float64), ('phi', np.float64),
+    ]
+SIMVERTEX_COLUMNS = [
+    ('vertex_id', np.int64), ('parent_index', np.int64), ('event_id', np.uint32),
+    ('x', np.float64), ('y', np.float64), ('z', np.float64), ('t', np.float64),
+    ]
+PCALOHIT_COLUMNS = [
+    ('id', np.uint32), ('energy', np.float64), ('time', np.float64), ('geant_track_id', np.int64),
+    ]
+HGCRECHIT_COLUMNS = [
+    ('raw_id', np.uint32), ('energy', np.float64), ('time', np.float64), ('flags', np.uint32),
+    ]
+SIMCLUSTER_COLUMNS = [
+    ('particle_id', np.int64), ('pdgid', np.int64), ('event_id', np.uint32),
+    ('energy', np.float64), ('n_rechits', np.int64),
+    ]
+CALOPARTICLE_COLUMNS = [
+    ('particle_id', np.int64), ('pdgid', np.int64), ('event_id', np.uint32), ('energy', np.float64),
+    ]
+SIMCLUSTER_HIT_COLUMNS = [
+    ('hit_cluster', np.int64), ('hit_id', np.uint32), ('hit_fraction', np.float64), ('hit_energy', np.float64),
+    ]
+
+def _columns(flat, spec):
+    return to_columns(flat, [c[0] for c in spec], [c[1] for c in spec])
+
+def simtracks(product):
+    return _columns(declare().simtracks(product), SIMTRACK_COLUMNS)
+
+def simvertices(product):
+    return _columns(declare().simvertices(product), SIMVERTEX_COLUMNS)
+
+def pcalohits(product):
+    return _columns(declare().pcalohits(product), PCALOHIT_COLUMNS)
+
+def hgcrechits(product):
+    return _columns(declare().hgcrechits(product), HGCRECHIT_COLUMNS)
+
+def size(product):
+    """
+    Only the number of objects in the product.
+    """
+    return dict(size=np.array([product.size()], dtype=np.int64))
+
+def ints(product):
+    """
+    A plain std::vector<int> product, as one `values` column.
+    """
+    return dict(values=np.array(product, dtype=np.int64))
+
+def eventauxiliary(aux):
+    """
+    Run, lumi and event number from the EventAuxiliary branch.
+    """
+    return dict(
+        run=np.array([aux.run()], dtype=np.uint32),
+        lumi=np.array([aux.luminosityBlock()], dtype=np.uint32),
+        event=np.array([aux.event()], dtype=np.uint64),
+        )
+
+def caloparticles(product):
+    return _columns(declare().caloparticles(product), CALOPARTICLE_COLUMNS)
+
+def simclusters(product):
+    """
+    One row per SimCluster, plus the flattened hits of all clusters
+    (`hit_*` columns; `hit_cluster` is the row of the owning cluster).
+    """
+    helper = declare()
+    cols = _columns(helper.simclusters(product), SIMCLUSTER_COLUMNS)
+    cols.update(_columns(helper.simcluster_hits(product), SIMCLUSTER_HIT_COLUMNS))
+    return cols
+
+
+def concatenate(per_event):
+    """
+    Concatenates a list of per-event column dicts. Columns that are
+    per-hit (e.g. `hit_*` of simclusters) may have a different length than
+    the per-object columns; each group gets its own `<prefix>offsets`
+    array with the event boundaries.
+    """
+    if not per_event: return {}
+    out = {}
+    for name in per_event[0]:
+        out[name] = np.concatenate([cols[name] for cols in per_event])
+    for prefix, name in [('', next(iter(per_event[0]))), ('hit_', 'hit_id')]:
+        if name not in per_event[0]: continue
+        sizes = [len(cols[name]) for cols in per_event]
+        out[prefix + 'offsets'] = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    return out
+
+
+def event(cols, i):
+    """
+    Returns the columns of event i out of `concatenate`d columns.
+    """
+    out = {}
+    for name, values in cols.items():
+        if name.endswith('offsets'): continue
+        offsets = cols['hit_offsets' if name.startswith('hit_') else 'offsets']
+        out[name] = values[offsets[i]:offsets[i+1]]
+    return out
+
+
+def read(tree, extractors, entries=None):
+    """
+    Reads columns for many events at once.
+    `extractors` maps a key to (branch name, extraction function), e.g.
+    {'tracks': ('SimTracks_g4SimHits__SIM', simtracks)}; see
+    `rootio.resolve_branch` for the branch name. Only these branches are
+    read.
+    Returns a dict key -> concatenated columns with event `offsets`.
+    """
+    per_event = {key: [] for key in extractors}
+    for event in rootio.iter_events(tree, entries=entries):
+        for key, (branch, fn) in extractors.items():
+            per_event[key].append(fn(event.product(branch)))
+    return {key: concatenate(cols) for key, cols in per_event.items()}
+
+
+def simtrack_formatter(tracks):
+    """
+    Returns a function that formats track i of `simtracks` columns.
+    The columns are converted to Python rows once, up front.
+    """
+    rows = list(zip(*(
+        tracks[name].tolist()
+        for name in ['track_id', 'pdgid', 'energy', 'pt', 'eta', 'phi', 'crossed_boundary']
+        )))
+    fmt = (
+        '<trackid={:6d}'
+        ' pdgid={:<5d}'
+        ' E={:<7.2f}'
+        ' pt={:<7.2f}'
+        ' eta={:<7.2f}'
+        ' phi={:<7.2f}'
+        ' crossed_b={:d}'
+        '>'
+        )
+    return lambda i: fmt.format(*rows[i])
@@ -1,12 +1,18 @@
 from __future__ import print_function
 
 import logging
+import asyncio
 from collections import OrderedDict
 import subprocess
 import copy
-import importlib
+import importlib, importlib.util
+import shutil
+import time
+import pickle
+import json
 import os, os.path as osp
-from functools import cached_property
+import signal
+from concurrent.futures import ThreadPoolExecutor
 
 import FWCore.ParameterSet.Config as cms
 
@@ -61,96 +67,556 @@ class CMSDriver(object):
             name += self.kwargs['-s'].replace(',', '_')
         return name + '.py'
 
-    @cached_property
+    @property
     def hash(self):
+        """
+        Hash of the driver command. The --python_filename is left out, so
+        that the same command written to different files has the same hash.
+        """
         import hashlib
-        return hashlib.sha224(self.__repr__().encode()).hexdigest()
+        s = ' '.join(str(arg) for arg in self.args)
+        for k, v in self.kwargs.items():
+            if k == '--python_filename': continue
+            s += ' {} {}'.format(k, v)
+        return hashlib.sha224(s.encode()).hexdigest()
+
+
+class Job(object):
+    """
+    A command to run with an Executor. Once it ran, `returncode` and
+    `output` (the captured lines) are filled.
+    If `log` is given, the captured output is also written to that file.
+    The resources used by the job are stored in `resources` (see `Executor`).
+    """
+    def __init__(self, cmd, log=None, cwd=None, stdout=None, stderr=None, name=None):
+        self.cmd = cmd
+        self.log = log
+        self.cwd = cwd
+        self.stdout = stdout
+        self.stderr = stderr
+        self.name = name if name else osp.basename(cmd[1] if len(cmd) > 1 else cmd[0])
+        self.returncode = None
+        self.output = []
+        self.resources = {}
+
+    def __repr__(self):
+        return '<Job {}>'.format(' '.join(self.cmd))
+
+
+def proc_tree(pid):
+    """
+    Returns the pids of a process and all its descendants, from /proc.
+    """
+    pids = [pid]
+    i = 0
+    while i < len(pids):
+        try:
+            task_dir = '/proc/{}/task'.format(pids[i])
+            for tid in os.listdir(task_dir):
+                with open(osp.join(task_dir, tid, 'children'), 'r') as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+        i += 1
+    return pids
+
+
+def proc_rss(pid):
+    """
+    Resident set size of a process in bytes, 0 if it is gone.
+    """
+    try:
+        with open('/proc/{}/status'.format(pid), 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'): return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def proc_io(pid):
+    """
+    I/O counters of a process from /proc/<pid>/io (as a dict of ints), empty
+    if it is gone. The counters include all children the process reaped.
+    """
+    io = {}
+    try:
+        with open('/proc/{}/io'.format(pid), 'r') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                io[name] = int(value)
+    except (OSError, ValueError):
+        pass
+    return io
+
+
+def wait_process(pid):
+    """
+    Waits for a process to exit, reads its /proc I/O counters while it is a
+    zombie, and only then reaps it with wait4. Returns (status, rusage, io).
+    """
+    os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+    io = proc_io(pid)
+    _, status, rusage = os.wait4(pid, 0)
+    return status, rusage, io
+
+
+def format_resources(jobs):
+    """
+    Summary table of the resources used by a list of finished jobs.
+    """
+    header = '{:<40} {:>6} {:>10} {:>10} {:>10} {:>12} {:>10} {:>10}'.format(
+        'job', 'status', 'wall [s]', 'user [s]', 'sys [s]', 'peak rss [MB]', 'read [MB]', 'write [MB]'
+        )
+    lines = [header, '-'*len(header)]
+    for job in jobs:
+        r = job.resources
+        if not r: continue
+        lines.append('{:<40} {:>6} {:>10.1f} {:>10.1f} {:>10.1f} {:>12.1f} {:>10.1f} {:>10.1f}'.format(
+            job.name[-40:], job.returncode, r['wall'], r['user'], r['sys'],
+            r['peak_rss']/1024**2, r['read_bytes']/1024**2, r['write_bytes']/1024**2
+            ))
+    return '\n'.join(lines)
+
+
+class Executor(object):
+    """
+    Runs commands as subprocesses from an asyncio event loop, at most
+    `max_jobs` at the same time. Output is read line by line without
+    blocking the loop, so many commands can be driven from one thread.
+
+    Every job records its resource usage in `job.resources`:
+    - wall time
+    - user and sys CPU time from the rusage returned by wait4 (which
+      includes all reaped descendants)
+    - bytes read and written from /proc/<pid>/io, read when the process
+      exited (likewise including reaped descendants): `read_bytes` and
+      `write_bytes` count all reads and writes, including page cache hits
+      and network filesystems, `disk_read_bytes` and `disk_write_bytes`
+      only what went to block devices
+    - peak RSS of the whole process tree, from sampling /proc every
+      `sample_interval` seconds, and the max RSS of the largest process
+    The records are appended as JSON lines to `resource_log` if given,
+    defaulting to $PU_RESOURCE_LOG. Finished jobs are kept in `finished`.
+    """
+    def __init__(self, max_jobs=None, dry=False, resource_log=None, sample_interval=.5):
+        self.max_jobs = max_jobs or os.cpu_count() or 1
+        self.dry = dry
+        self.resource_log = resource_log or os.environ.get('PU_RESOURCE_LOG')
+        self.sample_interval = sample_interval
+        self.finished = []
+        self._semaphore = None
+        self._waiters = None
+        self._loop = None
+        self._tasks = set()
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None: self._semaphore = asyncio.Semaphore(self.max_jobs)
+        return self._semaphore
+
+    @property
+    def waiters(self):
+        """
+        Threads that wait for the running jobs, one per job slot: on the
+        default pool of the loop (min(32, cores+4) threads), the waits of
+        jobs beyond the pool size would queue, and exited jobs would not
+        be reaped until another job finished.
+        """
+        if self._waiters is None: self._waiters = ThreadPoolExecutor(max_workers=self.max_jobs)
+        return self._waiters
+
+    def shutdown(self):
+        if self._waiters is not None: self._waiters.shutdown()
+        self._waiters = None
 
+    async def run_job(self, job):
+        """
+        Runs a single job once a slot is free. Cancelling the awaiting task
+        terminates the subprocess.
+        """
+        self._loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            async with self.semaphore:
+                return await self._run_job(job)
+        finally:
+            self._tasks.discard(task)
 
-def run_command(cmd, dry=False, stdout=None, stderr=None, stop_on_error=True):
+    async def _run_job(self, job):
+        logger.info('%sIssuing command %s', '(dry) ' if self.dry else '', ' '.join(job.cmd))
+        if self.dry:
+            job.returncode, job.output = 0, '<dry output>'
+            return job
+        t0 = time.monotonic()
+        process = subprocess.Popen(
+            job.cmd,
+            stdout=(subprocess.PIPE if job.stdout is None else job.stdout),
+            stderr=(subprocess.STDOUT if job.stderr is None else job.stderr),
+            cwd=job.cwd,
+            # Own process group, so that terminate reaches all descendants
+            start_new_session=True,
+            )
+        job.resources['peak_rss'] = 0
+        sampler = asyncio.ensure_future(self._sample(process.pid, job))
+        # The only place the process is reaped; shielded so that it survives
+        # cancellation and `terminate` can await it
+        waiter = self._loop.run_in_executor(self.waiters, wait_process, process.pid)
+        log = open(job.log, 'w') if job.log else None
+        try:
+            if process.stdout is not None:
+                await self._capture(process.stdout, job, log)
+            status, rusage, io = await asyncio.shield(waiter)
+            process.returncode = job.returncode = os.waitstatus_to_exitcode(status)
+        except asyncio.CancelledError:
+            logger.warning('Cancelling %s', job)
+            await self.terminate(process, waiter)
+            raise
+        finally:
+            sampler.cancel()
+            if log: log.close()
+        job.resources.update(
+            wall = time.monotonic() - t0,
+            user = rusage.ru_utime,
+            sys = rusage.ru_stime,
+            max_rss = rusage.ru_maxrss * 1024,
+            read_bytes = io.get('rchar', 0),
+            write_bytes = io.get('wchar', 0),
+            disk_read_bytes = io.get('read_bytes', 0),
+            disk_write_bytes = io.get('write_bytes', 0),
+            )
+        job.resources['peak_rss'] = max(job.resources['peak_rss'], job.resources['max_rss'])
+        self.record(job)
+        return job
+
+    async def _sample(self, pid, job):
+        while True:
+            rss = sum(proc_rss(p) for p in proc_tree(pid))
+            job.resources['peak_rss'] = max(job.resources['peak_rss'], rss)
+            await asyncio.sleep(self.sample_interval)
+
+    def record(self, job):
+        self.finished.append(job)
+        r = job.resources
+        logger.info(
+            'Job %s: status %s, wall %.1fs, user %.1fs, sys %.1fs, peak rss %.1f MB,'
+            ' read %.1f MB, written %.1f MB',
+            job.name, job.returncode, r['wall'], r['user'], r['sys'],
+            r['peak_rss']/1024**2, r['read_bytes']/1024**2, r['write_bytes']/1024**2
+            )
+        if self.resource_log:
+            with open(self.resource_log, 'a') as f:
+                f.write(json.dumps(dict(job=job.name, cmd=job.cmd, returncode=job.returncode, **r)) + '\n')
+
+    async def _capture(self, pipe, job, log):
+        reader = asyncio.StreamReader(limit=2**24)
+        transport, _ = await self._loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), pipe
+            )
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+                line = line.decode(errors='replace')
+                subprocess_logger.debug(line.rstrip('\n'))
+                job.output.append(line)
+                if log: log.write(line)
+        finally:
+            transport.close()
+
+    @staticmethod
+    def signal_group(process, sig):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    @classmethod
+    async def terminate(cls, process, waiter, timeout=10.):
+        """
+        Sends SIGTERM to the process group of the job (the process and all
+        its descendants), and SIGKILL if the process did not exit after
+        `timeout` seconds. The process is reaped by the pending
+        `wait_process` of `waiter`, which is awaited without blocking the
+        event loop. Descendants left over after that are killed.
+        """
+        if not waiter.done():
+            cls.signal_group(process, signal.SIGTERM)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            except asyncio.TimeoutError:
+                cls.signal_group(process, signal.SIGKILL)
+        status, _, _ = await waiter
+        process.returncode = os.waitstatus_to_exitcode(status)
+        cls.signal_group(process, signal.SIGKILL)
+
+    async def run_batch(self, jobs, stop_on_error=True):
+        """
+        Runs all jobs and returns their return codes. With `stop_on_error`,
+        the first failing job cancels all other jobs and raises.
+        """
+        tasks = [asyncio.ensure_future(self.run_job(job)) for job in jobs]
+        try:
+            if stop_on_error:
+                for future in asyncio.as_completed(tasks):
+                    job = await future
+                    if job.returncode != 0:
+                        raise Exception('Status {}! Command: {}'.format(job.returncode, ' '.join(job.cmd)))
+            else:
+                await asyncio.gather(*tasks)
+        finally:
+            for task in tasks: task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return [job.returncode for job in jobs]
+
+    def run(self, jobs, stop_on_error=True):
+        """
+        Blocking version of `run_batch`.
+        """
+        self._semaphore = None
+        try:
+            return asyncio.run(self.run_batch(jobs, stop_on_error=stop_on_error))
+        finally:
+            self.shutdown()
+
+    def cancel(self):
+        """
+        Cancels all queued and running jobs. Can be called from any thread.
+        """
+        if self._loop is None: return
+        for task in list(self._tasks):
+            self._loop.call_soon_threadsafe(task.cancel)
+
+
+def run_command(cmd, dry=False, stdout=None, stderr=None, stop_on_error=True, cwd=None, log=None):
     """
     Runs a command and captures output.
     Returns return code and captured output.
     """
-    logger.info('%sIssuing command %s', '(dry) ' if dry else '', ' '.join(cmd))
-    if dry: return 0, '<dry output>'
-    process = subprocess.Popen(
-        cmd,
-        stdout=(subprocess.PIPE if stdout is None else stdout),
-        stderr=(subprocess.STDOUT if stderr is None else stderr),
-        universal_newlines=True,
-        )
-    # Start running command and capturing output
-    output = []
-    for stdout_line in iter(process.stdout.readline, ''):
-        subprocess_logger.debug(stdout_line.strip('\n'))
-        output.append(stdout_line)
-    process.stdout.close()
-    process.wait()
-    if stop_on_error and process.returncode != 0:
-        raise Exception('Status {}!'.format(process.returncode))
-    return process.returncode, output
+    job = Job(cmd, log=log, cwd=cwd, stdout=stdout, stderr=stderr)
+    Executor(max_jobs=1, dry=dry).run([job], stop_on_error=False)
+    if stop_on_error and job.returncode != 0:
+        raise Exception('Status {}!'.format(job.returncode))
+    return job.returncode, job.output
 
 
-def run_driver_cmd(driver, *args, **kwargs):
-    recreate = kwargs.pop('recreate', False)
-    # Make sure outfile is clearly defined
-    outfile = kwargs.pop('outfile', None)
-    if outfile:
+def file_digest(path, chunk_size=4*1024**2):
+    """
+    Cheap content hash of a (possibly multi-GB) input file: the size and
+    the first and last `chunk_size` bytes.
+    """
+    import hashlib
+    h = hashlib.sha256()
+    size = osp.getsize(path)
+    h.update(str(size).encode())
+    with open(path, 'rb') as f:
+        h.update(f.read(chunk_size))
+        if size > chunk_size:
+            f.seek(max(chunk_size, size - chunk_size))
+            h.update(f.read(chunk_size))
+    return h.hexdigest()
+
+
+class DriverCache(object):
+    """
+    Directory of cmsDriver-generated configs, keyed by the driver hash.
+
+    Every config is stored as `<hash>.py` in a subdirectory per CMSSW release,
+    so many driver variants can live side by side. The atime of an entry is
+    bumped on every hit (the mtime marks the generation time and is left
+    alone), and the least recently used entries are evicted whenever the
+    cache grows beyond `max_bytes` or `max_entries`.
+    """
+    def __init__(self, path=None, max_bytes=None, max_entries=None):
+        if path is None:
+            path = os.environ.get(
+                'PU_DRIVER_CACHE',
+                osp.join(osp.expanduser('~'), '.cache', 'pu_attempt1', 'drivers')
+                )
+        self.path = osp.join(osp.abspath(path), os.environ.get('CMSSW_VERSION', 'norelease'))
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('PU_DRIVER_CACHE_MAX_MB', 1000)) * 1024**2)
+        if max_entries is None:
+            max_entries = int(os.environ.get('PU_DRIVER_CACHE_MAX_ENTRIES', 200))
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+    def config_path(self, driver):
+        return osp.join(self.path, driver.hash + '.py')
+
+    def process_path(self, driver):
+        return osp.join(self.path, driver.hash + '.pkl')
+
+    def has(self, driver):
+        return osp.isfile(self.config_path(driver))
+
+    def touch(self, driver):
+        """
+        Marks all files of the entry as recently used.
+        """
+        now = time.time()
+        for path in self.entry_files(driver.hash):
+            os.utime(path, (now, os.stat(path).st_mtime))
+
+    def entry_files(self, hash):
+        if not osp.isdir(self.path): return []
+        return [
+            osp.join(self.path, f) for f in os.listdir(self.path)
+            if f.split('.', 1)[0] == hash and '.tmp' not in f
+            ]
+
+    def entries(self):
+        """
+        Returns a list of (hash, n_bytes, last_used) tuples, one per entry.
+        """
+        if not osp.isdir(self.path): return []
+        entries = {}
+        for f in os.listdir(self.path):
+            if '.tmp' in f: continue
+            hash = f.split('.', 1)[0]
+            stat = os.stat(osp.join(self.path, f))
+            n_bytes, last_used = entries.get(hash, (0, 0.))
+            entries[hash] = (n_bytes + stat.st_size, max(last_used, stat.st_atime))
+        return [(hash, n_bytes, last_used) for hash, (n_bytes, last_used) in entries.items()]
+
+    def evict(self, keep=()):
+        """
+        Removes least recently used entries until the cache is within its limits.
+        Hashes in `keep` are never removed.
+        """
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        n_bytes = sum(e[1] for e in entries)
+        n_entries = len(entries)
+        for hash, size, _ in entries:
+            if n_bytes <= self.max_bytes and n_entries <= self.max_entries: break
+            if hash in keep: continue
+            logger.info('Evicting driver %s from cache %s', hash, self.path)
+            for path in self.entry_files(hash):
+                os.remove(path)
+            n_bytes -= size
+            n_entries -= 1
+
+    def generate(self, driver, *args, **kwargs):
+        """
+        Runs the driver command, writing to a temporary file first so that
+        an interrupted cmsDriver.py never leaves a broken entry behind.
+        Pass `evict=False` to postpone eviction to the caller.
+        """
+        evict = kwargs.pop('evict', True)
+        os.makedirs(self.path, exist_ok=True)
+        config = self.config_path(driver)
+        tmp = osp.join(self.path, '{}.tmp{}.py'.format(driver.hash, os.getpid()))
         driver = copy.deepcopy(driver)
-        driver.kwargs['--python_filename'] = outfile
-    elif '--python_filename' not in driver.kwargs:
-        driver.kwargs['--python_filename'] = 'tmp.py'
-    # Determine whether driver command should be rerun:
-    # - if recreate option is True
-    # - if the outfile does not exist yet
-    # - if the hash stored in the outfile differs from the driver hash
-    #   (i.e. the command has changed)
-    def run():
+        driver.kwargs['--python_filename'] = tmp
         logger.info('Running driver command %s', driver)
-        output = run_command(driver.cmd, *args, **kwargs)
-        add_hash_to_file(driver.outfile, driver.hash)
+        try:
+            output = run_command(driver.cmd, *args, **kwargs)
+            if not kwargs.get('dry', False): os.replace(tmp, config)
+        finally:
+            if osp.isfile(tmp): os.remove(tmp)
+        if evict: self.evict(keep=(driver.hash,))
         return output
+
+driver_cache = DriverCache()
+
+
+def run_driver_cmd(driver, *args, **kwargs):
+    """
+    Makes sure the config of `driver` is in the driver cache, and returns
+    the path to it. cmsDriver.py only runs if the cache has no entry for
+    the driver hash yet, or if `recreate` is True.
+    If `outfile` is given, the cached config is also copied there.
+    """
+    recreate = kwargs.pop('recreate', False)
+    outfile = kwargs.pop('outfile', None)
+    cache = kwargs.pop('cache', driver_cache)
+    config = cache.config_path(driver)
     if recreate:
-        logger.info(f'Force recreating {outfile}')
-        run()
-    elif not(osp.isfile(driver.outfile)):
-        logger.info(f'{outfile} does not exist yet')
-        run()
-    elif (stored_hash:=read_hash(driver.outfile)) != driver.hash:
-        logger.info(f'Hash in {outfile} {stored_hash} != {driver.hash}')
-        run()
+        logger.info(f'Force recreating {config}')
+        cache.generate(driver, *args, **kwargs)
+    elif not cache.has(driver):
+        logger.info(f'{config} does not exist yet')
+        cache.generate(driver, *args, **kwargs)
     else:
-        logger.info(
-            f'Not running driver command; {driver.outfile} exists and hashes match.'
-            f' Driver:\n{driver}'
-            )
+        logger.info(f'Not running driver command; using cached {config}. Driver:\n{driver}')
+        cache.touch(driver)
+    if outfile and osp.isfile(config):
+        shutil.copyfile(config, outfile)
+    return config
 
 
-def add_hash_to_file(filename, hash):
-    logger.info(f'Adding hash {hash} to {filename}')
-    with open(filename, 'r') as f:
-        txt = f.read()
-    txt = f'#{hash}\n' + txt
-    with open(filename, 'w') as f:
-        f.write(txt)
+def generate_configs(drivers, n_workers=None, cache=None, **kwargs):
+    """
+    Generates the configs of all drivers that are not in the cache yet,
+    running up to `n_workers` cmsDriver.py processes at the same time.
+    Returns the list of config paths (in the order of `drivers`) once all
+    configs are ready.
+    """
+    if cache is None: cache = driver_cache
+    recreate = kwargs.pop('recreate', False)
+    missing = OrderedDict()
+    for driver in drivers:
+        if recreate or not cache.has(driver): missing[driver.hash] = driver
+    if n_workers is None: n_workers = min(len(missing), os.cpu_count() or 1)
+    logger.info(
+        'Generating %s/%s driver configs with %s workers',
+        len(missing), len(drivers), n_workers
+        )
+    if missing:
+        kwargs['evict'] = False
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            futures = [pool.submit(cache.generate, d, **kwargs) for d in missing.values()]
+            for future in futures: future.result()
+    cache.evict(keep={driver.hash for driver in drivers})
+    return [cache.config_path(driver) for driver in drivers]
 
 
-def read_hash(filename):
-    with open(filename, 'r') as f:
-        return f.readline().strip().lstrip('#')
+# Pickled processes per (driver hash, config mtime), so that repeated loads in one
+# interpreter never re-import or re-read the config
+_process_memory_cache = {}
 
+def clone_process(process):
+    """
+    Returns an independent deep copy of a cms.Process.
+    """
+    return pickle.loads(pickle.dumps(process, pickle.HIGHEST_PROTOCOL))
 
-def load_process_from_driver(driver, outfile=None):
+
+def load_process_from_driver(driver, outfile=None, cache=None):
     """
-    Runs a driver command, dumping the output in `outfile`.
-    Then imports that outfile, and returns the `process` variable
+    Makes sure the config of `driver` is generated (see `run_driver_cmd`).
+    Then imports that config, and returns the `process` variable
     from it.
+
+    The loaded process is pickled next to the config in the driver cache,
+    and kept in memory. Later loads unpickle from memory or disk instead of
+    importing the config again. Every call returns a fresh copy, so the
+    returned process can be modified freely.
     """
-    run_driver_cmd(driver, outfile=outfile)
-    process = importlib.import_module(driver.kwargs['--python_filename'].replace('.py', '')).process
-    logger.info('Loaded process %s from %s', process, driver.kwargs['--python_filename'])
-    return process
+    if cache is None: cache = driver_cache
+    config = run_driver_cmd(driver, outfile=outfile, cache=cache)
+    pkl = cache.process_path(driver)
+    mtime = osp.getmtime(config)
+    data = _process_memory_cache.get((driver.hash, mtime))
+    if data is not None:
+        logger.info('Loaded process for driver %s from memory', driver.hash)
+    elif osp.isfile(pkl) and osp.getmtime(pkl) >= mtime:
+        with open(pkl, 'rb') as f:
+            data = f.read()
+        logger.info('Loaded process from %s', pkl)
+    else:
+        spec = importlib.util.spec_from_file_location('driver_' + driver.hash, config)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        data = pickle.dumps(module.process, pickle.HIGHEST_PROTOCOL)
+        tmp = '{}.tmp{}'.format(pkl, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, pkl)
+        logger.info('Loaded process %s from %s; cached in %s', module.process, config, pkl)
+    _process_memory_cache[(driver.hash, mtime)] = data
+    return pickle.loads(data)
 
 
 WARNED_ABOUT_EDM_ML_DEBUG = False
@@ -175,6 +641,32 @@ def add_debug_module(process, module_name):
         WARNED_ABOUT_EDM_ML_DEBUG = True
 
 
+HGCAL_HIT_SUBDETS = ['HGCHitsEE', 'HGCHitsHEfront', 'HGCHitsHEback']
+
+def add_mixing_profile(process, output_file='cfviewer.root'):
+    """
+    Adds the cfviewer analyzer, which writes per-event and per-bunch crossing
+    counts of the signal and pileup SimTracks, SimVertices and HGCal PCaloHits,
+    and the MixCollection iteration time, to `output_file` via TFileService.
+    The mixing module only keeps crossing frames of the calo hits listed in
+    mixCH.crossingFrames, so the HGCal ones are added there.
+    """
+    if not hasattr(process, 'mix') or not hasattr(process.mix, 'mixObjects'):
+        raise Exception('Process has no mixing module to profile')
+    mixCH = process.mix.mixObjects.mixCH
+    subdets = [s for s in HGCAL_HIT_SUBDETS if s in mixCH.subdets]
+    for subdet in subdets:
+        if subdet not in mixCH.crossingFrames: mixCH.crossingFrames.append(subdet)
+    process.TFileService = cms.Service("TFileService", fileName = cms.string(output_file))
+    process.cfviewer = cms.EDAnalyzer(
+        "cfviewer",
+        caloHitCrossingFrames = cms.VInputTag(*[cms.InputTag('mix', 'g4SimHits' + s) for s in subdets])
+        )
+    process.cfviewer_step = cms.Path(process.cfviewer)
+    process.schedule.append(process.cfviewer_step)
+    logger.info('Profiling crossing frames of %s to %s', ', '.join(['tracks', 'vertices'] + subdets), output_file)
+
+
 def rng(process, seed=1001):
     """
     Sets the RandomNumberGeneratorService to a fixed seed
@@ -185,6 +677,191 @@ def rng(process, seed=1001):
     logger.info('Set RNG to seed %s', seed)
 
 
+def shard_range(n_events, i_shard, n_shards):
+    """
+    Splits `n_events` over `n_shards` as evenly as possible.
+    Returns (index of the first event, number of events) of shard `i_shard`.
+    """
+    base, remainder = divmod(n_events, n_shards)
+    return i_shard*base + min(i_shard, remainder), base + int(i_shard < remainder)
+
+
+def shard_seed(seed, i_shard, engine):
+    """
+    Deterministic seed for one random engine of one shard.
+    Kept below 900000000, the maximum seed of HepJamesRandom.
+    """
+    import hashlib
+    digest = hashlib.sha256('{}:{}:{}'.format(seed, i_shard, engine).encode()).hexdigest()
+    return int(digest, 16) % 899999999 + 1
+
+
+def shard(process, i_shard, n_shards, n_events, seed=1):
+    """
+    Turns `process` into shard `i_shard` out of `n_shards` of an `n_events` job:
+    - every random engine gets its own seed, derived from (seed, i_shard)
+    - an EmptySource shard gets luminosity block i_shard+1, so events stay
+      unique after merging
+    - a PoolSource shard skips the events of the earlier shards; the input
+      keeps its own lumi numbers (firstLuminosityBlock of a PoolSource would
+      skip all lumis below it rather than renumber them)
+    """
+    first, n = shard_range(n_events, i_shard, n_shards)
+    process.maxEvents.input = cms.untracked.int32(n)
+    if process.source.type_() == 'EmptySource':
+        process.source.firstLuminosityBlock = cms.untracked.uint32(i_shard + 1)
+    elif process.source.type_() == 'PoolSource':
+        process.source.skipEvents = cms.untracked.uint32(first)
+    service = process.RandomNumberGeneratorService
+    for engine in service.parameterNames_():
+        pset = getattr(service, engine)
+        if isinstance(pset, cms.PSet) and hasattr(pset, 'initialSeed'):
+            pset.initialSeed = cms.untracked.uint32(shard_seed(seed, i_shard, engine))
+    logger.info(
+        'Shard %s/%s: events %s-%s (%s), seeds derived from %s',
+        i_shard, n_shards, first, first + n,
+        'lumi {}'.format(i_shard + 1) if process.source.type_() == 'EmptySource' else 'skipping {}'.format(first),
+        seed
+        )
+
+
+# VarParsing option -> parameter in process.options
+THREADING_OPTIONS = OrderedDict([
+    ('nThreads', 'numberOfThreads'),
+    ('nStreams', 'numberOfStreams'),
+    ('nConcurrentLumis', 'numberOfConcurrentLuminosityBlocks'),
+    ('nConcurrentIOVs', 'eventSetup.numberOfConcurrentIOVs'),
+    ])
+
+def add_threading_options(options):
+    """
+    Registers the options of THREADING_OPTIONS on a VarParsing object
+    """
+    from FWCore.ParameterSet.VarParsing import VarParsing
+    for name, default, help in [
+        ('nThreads', 1, 'Number of threads'),
+        ('nStreams', 0, 'Number of streams (0: one per thread)'),
+        ('nConcurrentLumis', 0, 'Number of concurrent luminosity blocks (0: keep the default)'),
+        ('nConcurrentIOVs', 0, 'Number of concurrent IOVs per EventSetup record (0: keep the default)'),
+        ]:
+        options.register(name, default, VarParsing.multiplicity.singleton, VarParsing.varType.int, help)
+
+
+def get_process_option(process, path):
+    pset = process.options
+    for name in path.split('.'):
+        if not hasattr(pset, name): return None
+        pset = getattr(pset, name)
+    return pset.value()
+
+
+def set_threading(process, n_threads=1, n_streams=0, n_concurrent_lumis=0, n_concurrent_iovs=0):
+    """
+    Sets the threads and streams of `process`, and the number of concurrent
+    luminosity blocks and EventSetup IOVs if they are not 0.
+    Returns the settings as {parameter in process.options: value}.
+    """
+    if n_threads < 1: raise Exception('Need at least 1 thread, got {}'.format(n_threads))
+    if n_streams > n_threads:
+        logger.warning('%s streams on %s threads: streams beyond the thread count only cost memory', n_streams, n_threads)
+    n_cpus = os.cpu_count()
+    if n_cpus and n_threads > n_cpus:
+        logger.warning('%s threads on a machine with %s cores', n_threads, n_cpus)
+    settings = OrderedDict([
+        ('numberOfThreads', n_threads),
+        ('numberOfStreams', n_streams),
+        ])
+    if n_concurrent_lumis: settings['numberOfConcurrentLuminosityBlocks'] = n_concurrent_lumis
+    if n_concurrent_iovs: settings['eventSetup.numberOfConcurrentIOVs'] = n_concurrent_iovs
+    if not hasattr(process, 'options'): process.options = cms.untracked.PSet()
+    for path, value in settings.items():
+        pset = process.options
+        names = path.split('.')
+        for name in names[:-1]:
+            if not hasattr(pset, name): setattr(pset, name, cms.untracked.PSet())
+            pset = getattr(pset, name)
+        setattr(pset, names[-1], cms.untracked.uint32(value))
+    return settings
+
+
+def check_threading(process, settings):
+    """
+    Logs the threading configuration of `process`, and raises if it differs
+    from `settings` (as returned by `set_threading`), e.g. because a later
+    customisation replaced process.options
+    """
+    found = OrderedDict((path, get_process_option(process, path)) for path in THREADING_OPTIONS.values())
+    logger.info('Threading: %s', ', '.join('{}={}'.format(path, value) for path, value in found.items()))
+    wrong = ['{}={} (requested {})'.format(path, found[path], value) for path, value in settings.items() if found[path] != value]
+    if wrong: raise Exception('Threading settings did not take effect: ' + ', '.join(wrong))
+
+
+def threading_from_options(process, options):
+    """
+    Applies the options registered by `add_threading_options`, and returns
+    the settings. Call it as soon as the process exists, and
+    `check_threading` with the settings at the very end of the config, so
+    that later customisations that override them are caught.
+    """
+    return set_threading(
+        process, options.nThreads, options.nStreams,
+        options.nConcurrentLumis, options.nConcurrentIOVs
+        )
+
+
+def check_job_report_threading(metrics, n_threads, n_streams=0):
+    """
+    Runtime check of the threads and streams a job actually ran with, from
+    the metrics of its framework job report (written by the Timing service).
+    """
+    if 'NumberOfThreads' not in metrics:
+        logger.warning('No NumberOfThreads in the job report; is the Timing service enabled?')
+        return
+    expected = dict(NumberOfThreads=n_threads, NumberOfStreams=n_streams or n_threads)
+    wrong = [
+        '{}={:g} (requested {})'.format(name, metrics[name], value)
+        for name, value in expected.items() if name in metrics and metrics[name] != value
+        ]
+    if wrong: raise Exception('Job did not run with the requested threading: ' + ', '.join(wrong))
+
+
+# name -> (compressionAlgorithm, compressionLevel) of an output module
+COMPRESSION_PRESETS = OrderedDict([
+    ('archival', ('LZMA', 9)), # smallest files, slowest to write and read
+    ('balanced', ('ZSTD', 5)),
+    ('fast', ('LZ4', 4)),      # fastest to write and read, largest files
+    ])
+
+# ROOT compression algorithm codes; ROOT compression settings are 100*algorithm + level
+ROOT_COMPRESSION_ALGORITHMS = dict(ZLIB=1, LZMA=2, LZ4=4, ZSTD=5)
+
+def compression_preset(preset):
+    """
+    Returns (algorithm, level) of a preset in COMPRESSION_PRESETS.
+    """
+    if preset not in COMPRESSION_PRESETS:
+        raise Exception('Unknown compression preset {}; choose from {}'.format(preset, ', '.join(COMPRESSION_PRESETS)))
+    return COMPRESSION_PRESETS[preset]
+
+
+def compression_settings(preset):
+    """
+    ROOT compression settings (e.g. for TFile::SetCompressionSettings) of a preset.
+    """
+    algorithm, level = compression_preset(preset)
+    return 100*ROOT_COMPRESSION_ALGORITHMS[algorithm] + level
+
+
+def set_compression(output_module, preset):
+    """
+    Sets the compression algorithm and level of an output module to a preset.
+    """
+    algorithm, level = compression_preset(preset)
+    output_module.compressionAlgorithm = cms.untracked.string(algorithm)
+    output_module.compressionLevel = cms.untracked.int32(level)
+    logger.info('Output compression: %s (%s-%s)', preset, algorithm, level)
+
+
 def activate_finecalo(process):
     for module_name in ['CaloSD', 'CaloTrkProcessing', 'TrackingAction']:
         pset = getattr(process.g4SimHits, module_name)
@@ -244,6 +921,10 @@ def add_generator(process, thing):
         raise Exception('Unknown thing %s' % thing)
 
 
+def strip_file_prefix(path):
+    return path[len('file:'):] if path.startswith('file:') else path
+
+
 def guntype(filename):
     basename = osp.basename(filename)
     for keyword in ['muon', 'tau', 'minbias']:
@@ -10,16 +10,20 @@
 #include <set>
 #include <cmath>
 #include <numeric>
+#include <algorithm>
 using std::vector;
 using std::unordered_map;
 using std::pair;
 
 #include "FWCore/Framework/interface/Frameworkfwd.h"
-#include "FWCore/Framework/interface/stream/EDProducer.h"
+#include "FWCore/Framework/interface/global/EDProducer.h"
 #include "FWCore/Framework/interface/Event.h"
 #include "FWCore/Framework/interface/MakerMacros.h"
 #include "FWCore/ParameterSet/interface/ParameterSet.h"
+#include "FWCore/ParameterSet/interface/ConfigurationDescriptions.h"
+#include "FWCore/ParameterSet/interface/ParameterSetDescription.h"
 #include "FWCore/Framework/interface/ESHandle.h"
+#include "FWCore/MessageLogger/interface/MessageLogger.h"
 #include "FWCore/Utilities/interface/StreamID.h"
 #include "FWCore/PluginManager/interface/ModuleDef.h"
 
@@ -35,166 +39,329 @@ using std::pair;
 #include "DataFormats/DetId/interface/DetId.h"
 
 
-class VertexIndexMapper{
+/*
+Dense table of the (event, bunch crossing) pairs of a crossing frame: every pair
+in the fitted range gets a slot, so that per-pair data can live in flat arrays.
+*/
+class EventSlots{
     public:
-        VertexIndexMapper(){}
-        ~VertexIndexMapper(){}
+        template <class T>
+        void fit(const vector<T>& objects){
+            min_bx_ = 0;
+            n_bx_ = 1;
+            n_events_ = 1;
+            if (objects.empty()) return;
+            int max_bx = objects[0].eventId().bunchCrossing();
+            min_bx_ = max_bx;
+            for (const auto& object : objects){
+                const EncodedEventId id = object.eventId();
+                min_bx_ = std::min(min_bx_, id.bunchCrossing());
+                max_bx = std::max(max_bx, id.bunchCrossing());
+                n_events_ = std::max(n_events_, id.event() + 1);
+                }
+            n_bx_ = max_bx - min_bx_ + 1;
+            }
 
-        int current_global_vertex_count_ = 0;
-        unordered_map<int, int> current_vertex_count_per_event_;
-        unordered_map<int, unordered_map<int, int>> eventspecific_to_global_;
+        int size() const { return n_bx_ * n_events_; }
+        int event(int i_slot) const { return i_slot % n_events_; }
+        int bunch_crossing(int i_slot) const { return min_bx_ + i_slot / n_events_; }
 
         /*
-        Super-simplistic event id to use as a key: simply 10000*event_id number + bunch_cr
+        Slot of an (event, bunch crossing), or -1 if it is outside of the fitted range
         */
-        int get_eventid(EncodedEventId id){
-            return 10000*id.event() + id.bunchCrossing();
-            }
-        int get_eventid(const SimVertex& vertex){
-            return get_eventid(vertex.eventId());
+        int slot(const EncodedEventId& id) const {
+            const int i_bx = id.bunchCrossing() - min_bx_;
+            if (i_bx < 0 || i_bx >= n_bx_ || id.event() < 0 || id.event() >= n_events_) return -1;
+            return i_bx * n_events_ + id.event();
             }
-        int get_eventid(const SimTrack& track){
-            return get_eventid(track.eventId());
+
+        /*
+        CSR offsets of `objects` grouped per slot
+        */
+        template <class T>
+        void offsets(const vector<T>& objects, vector<int>& out) const {
+            out.assign(size() + 1, 0);
+            for (const auto& object : objects) out[slot(object.eventId()) + 1]++;
+            std::partial_sum(out.begin(), out.end(), out.begin());
             }
 
-        void add_vertex(const SimVertex& vertex){
-            int id = get_eventid(vertex);
-            int event_specific_index = current_vertex_count_per_event_[id]++;
-            eventspecific_to_global_[id][event_specific_index] = current_global_vertex_count_++;
+    private:
+        int min_bx_ = 0;
+        int n_bx_ = 1;
+        int n_events_ = 1;
+    };
+
+
+/*
+Maps the event-specific vertex index of a SimTrack (its vertIndex(), which counts
+the vertices of its own (event, bunch crossing) only) to the index of the vertex
+in the flat list of all vertices of the crossing frame.
+
+The global indices of the vertices are stored per slot in one flat array
+(slot_offsets_ are the CSR offsets into global_index_), so a lookup is two array
+reads.
+*/
+class VertexIndexMapper{
+    public:
+        VertexIndexMapper(){}
+        ~VertexIndexMapper(){}
+
+        /*
+        Builds the mapping; the global index of a vertex is its position in `vertices`
+        */
+        void build(const vector<SimVertex>& vertices){
+            slots_.fit(vertices);
+            slots_.offsets(vertices, slot_offsets_);
+            vector<int> fill(slot_offsets_.begin(), slot_offsets_.end() - 1);
+            global_index_.resize(vertices.size());
+            for (size_t i = 0; i < vertices.size(); ++i)
+                global_index_[fill[slots_.slot(vertices[i].eventId())]++] = i;
             }
 
-        int global_vertex_index(int id, int local_index){
-            if (eventspecific_to_global_.find(id) == eventspecific_to_global_.end())
+        int global_vertex_index(const SimTrack& track) const {
+            const EncodedEventId id = track.eventId();
+            const int local_index = track.vertIndex();
+            const int i_slot = slots_.slot(id);
+            if (i_slot < 0)
                 throw cms::Exception("AllSimTracksAndVerticesProducer")
-                    << "Requested global vertex index for event " << id
+                    << "Requested global vertex index for event " << id.event()
+                    << " bunch crossing " << id.bunchCrossing()
                     << " with event-specific index " << local_index
-                    << ": This event is not available to the mapper yet"
+                    << ": This event has no vertices in the crossing frame"
                     ;
-            if (eventspecific_to_global_[id].find(local_index) == eventspecific_to_global_[id].end())
+            if (local_index < 0 || local_index >= slot_offsets_[i_slot + 1] - slot_offsets_[i_slot])
                 throw cms::Exception("AllSimTracksAndVerticesProducer")
-                    << "Requested global vertex index for event " << id
+                    << "Requested global vertex index for event " << id.event()
+                    << " bunch crossing " << id.bunchCrossing()
                     << " with event-specific index " << local_index
-                    << ": This local_index is not available to the mapper yet"
+                    << ": The event only has " << slot_offsets_[i_slot + 1] - slot_offsets_[i_slot] << " vertices"
                     ;
-            return eventspecific_to_global_[id][local_index];
+            return global_index_[slot_offsets_[i_slot] + local_index];
             }
 
-        int global_vertex_index(const SimTrack& track){
-            return global_vertex_index(get_eventid(track), track.vertIndex());
+        void print(std::ostream& out) const {
+            out << "Vertex mapper (local -> global index per event and bunch crossing):\n";
+            for (int i_slot = 0; i_slot < slots_.size(); ++i_slot){
+                if (slot_offsets_[i_slot] == slot_offsets_[i_slot + 1]) continue;
+                out << "Event " << slots_.event(i_slot) << " bunchx " << slots_.bunch_crossing(i_slot) << ":";
+                for (int i = slot_offsets_[i_slot]; i < slot_offsets_[i_slot + 1]; ++i)
+                    out << " " << i - slot_offsets_[i_slot] << "->" << global_index_[i];
+                out << "\n";
+                }
             }
 
-        void print(){
-            std::cout << "\nPrintout of vertex mapper:\n";
-            for(auto it = eventspecific_to_global_.begin(); it != eventspecific_to_global_.end(); ++it){
-                int id = it->first;
-                std::cout
-                    << "Event " << id/10000 << " bunchx " << id%10000
-                    << " contains the local-to-global mapping:\n"
-                    ;
-                auto& local_to_global = it->second;
-                for(auto it2 = local_to_global.begin(); it2 != local_to_global.end(); ++it2)
-                    std::cout << "  " << it2->first << " -> " << it2->second << "\n";
+    private:
+        EventSlots slots_;
+        vector<int> slot_offsets_;
+        vector<int> global_index_;
+    };
+
+
+/*
+Maps (event, bunch crossing, trackId()) to the position of the track in the flat
+list of all tracks: per slot, the (trackId, position) pairs sorted by trackId.
+*/
+class TrackIndexMapper{
+    public:
+        void build(const vector<SimTrack>& tracks){
+            slots_.fit(tracks);
+            slots_.offsets(tracks, slot_offsets_);
+            vector<int> fill(slot_offsets_.begin(), slot_offsets_.end() - 1);
+            ids_and_positions_.resize(tracks.size());
+            for (size_t i = 0; i < tracks.size(); ++i)
+                ids_and_positions_[fill[slots_.slot(tracks[i].eventId())]++] = pair<int, int>(tracks[i].trackId(), i);
+            for (int i_slot = 0; i_slot < slots_.size(); ++i_slot)
+                std::sort(
+                    ids_and_positions_.begin() + slot_offsets_[i_slot],
+                    ids_and_positions_.begin() + slot_offsets_[i_slot + 1]
+                    );
+            }
+
+        /*
+        Position of the track, or -1 if it is not in the list
+        */
+        int position(const EncodedEventId& id, int track_id) const {
+            const int i_slot = slots_.slot(id);
+            if (i_slot < 0) return -1;
+            const auto begin = ids_and_positions_.begin() + slot_offsets_[i_slot];
+            const auto end = ids_and_positions_.begin() + slot_offsets_[i_slot + 1];
+            const auto it = std::lower_bound(begin, end, pair<int, int>(track_id, -1));
+            return (it != end && it->first == track_id) ? it->second : -1;
+            }
+
+    private:
+        EventSlots slots_;
+        vector<int> slot_offsets_;
+        vector<pair<int, int>> ids_and_positions_;
+    };
+
+
+/*
+Flat columns of the track hierarchy, one entry per track of the flat track list:
+- parent: position of the parent track, -1 if there is none (or it was not stored)
+- root: position of the topmost ancestor (the track itself if it has no parent)
+- depth: number of ancestors
+- event, bunch_crossing: origin of the track in the crossing frame
+`tracks` must have global vertex indices (see VertexIndexMapper).
+*/
+struct TrackHierarchy{
+    vector<int> parent, root, depth, event, bunch_crossing;
+
+    void build(const vector<SimTrack>& tracks, const vector<SimVertex>& vertices){
+        const int n = tracks.size();
+        parent.assign(n, -1);
+        root.assign(n, -1);
+        depth.assign(n, -1);
+        event.resize(n);
+        bunch_crossing.resize(n);
+        TrackIndexMapper track_mapper;
+        track_mapper.build(tracks);
+        for (int i = 0; i < n; ++i){
+            event[i] = tracks[i].eventId().event();
+            bunch_crossing[i] = tracks[i].eventId().bunchCrossing();
+            const int i_vertex = tracks[i].vertIndex();
+            if (i_vertex < 0 || i_vertex >= int(vertices.size())) continue;
+            const SimVertex& vertex = vertices[i_vertex];
+            if (vertex.parentIndex() < 0) continue;
+            parent[i] = track_mapper.position(vertex.eventId(), vertex.parentIndex());
+            }
+        // Resolve root and depth along the parent chains; every track is visited once
+        vector<int> chain;
+        for (int i = 0; i < n; ++i){
+            int j = i;
+            while (depth[j] < 0 && parent[j] >= 0){
+                if (int(chain.size()) > n)
+                    throw cms::Exception("AllSimTracksAndVerticesProducer") << "Cyclic track hierarchy at track " << i;
+                chain.push_back(j);
+                j = parent[j];
+                }
+            if (depth[j] < 0){
+                depth[j] = 0;
+                root[j] = j;
                 }
+            for (auto it = chain.rbegin(); it != chain.rend(); ++it){
+                depth[*it] = depth[parent[*it]] + 1;
+                root[*it] = root[parent[*it]];
+                }
+            chain.clear();
             }
+        }
     };
 
 
-class AllSimTracksAndVerticesProducer : public edm::stream::EDProducer<> {
+/*
+Stateless: all per-event state lives in produce(), so one instance serves all
+streams of a multithreaded job.
+*/
+class AllSimTracksAndVerticesProducer : public edm::global::EDProducer<> {
     public:
         explicit AllSimTracksAndVerticesProducer(const edm::ParameterSet&);
         ~AllSimTracksAndVerticesProducer() {}
+        static void fillDescriptions(edm::ConfigurationDescriptions& descriptions);
     private:
-        virtual void produce(edm::Event&, const edm::EventSetup&) override;
-        void beginRun(const edm::Run&, const edm::EventSetup&) override {}
-        edm::EDGetTokenT<edm::SimTrackContainer> tokenSimTracks_;
-        edm::EDGetTokenT<edm::SimVertexContainer> tokenSimVertices_;
-        edm::EDGetTokenT<CrossingFrame<SimTrack>> tokenCrossingFrameSimTracks_;
-        edm::EDGetTokenT<CrossingFrame<SimVertex>> tokenCrossingFrameSimVertices_;
+        void produce(edm::StreamID, edm::Event&, const edm::EventSetup&) const override;
+        const edm::EDGetTokenT<CrossingFrame<SimTrack>> tokenCrossingFrameSimTracks_;
+        const edm::EDGetTokenT<CrossingFrame<SimVertex>> tokenCrossingFrameSimVertices_;
+        const edm::EDPutTokenT<edm::SimTrackContainer> tokenAllSimTracks_;
+        const edm::EDPutTokenT<edm::SimVertexContainer> tokenAllSimVertices_;
+        // Flat hierarchy columns of AllSimTracks (see TrackHierarchy)
+        const edm::EDPutTokenT<vector<int>> tokenParentIndex_;
+        const edm::EDPutTokenT<vector<int>> tokenRootIndex_;
+        const edm::EDPutTokenT<vector<int>> tokenDepth_;
+        const edm::EDPutTokenT<vector<int>> tokenEvent_;
+        const edm::EDPutTokenT<vector<int>> tokenBunchCrossing_;
+        // 0: silent, 1: collection sizes, 2: also every track and vertex, 3: also the vertex mapper
+        const int verbosity_;
     };
 
 
 AllSimTracksAndVerticesProducer::AllSimTracksAndVerticesProducer(const edm::ParameterSet& iConfig) :
-    tokenSimTracks_(consumes<edm::SimTrackContainer>(edm::InputTag("g4SimHits"))),
-    tokenSimVertices_(consumes<edm::SimVertexContainer>(edm::InputTag("g4SimHits"))),
-    tokenCrossingFrameSimTracks_(consumes<CrossingFrame<SimTrack>>(edm::InputTag("mix", "g4SimHits"))),
-    tokenCrossingFrameSimVertices_(consumes<CrossingFrame<SimVertex>>(edm::InputTag("mix", "g4SimHits")))
-    {
-    produces<edm::SimTrackContainer>("AllSimTracks");
-    produces<edm::SimVertexContainer>("AllSimVertices");
-    }
-
-
-void AllSimTracksAndVerticesProducer::produce(edm::Event& iEvent, const edm::EventSetup& iSetup) {  
-    std::unique_ptr<edm::SimTrackContainer> all_simtracks(new edm::SimTrackContainer);
-    std::unique_ptr<edm::SimVertexContainer> all_simvertices(new edm::SimVertexContainer);
+    tokenCrossingFrameSimTracks_(consumes<CrossingFrame<SimTrack>>(iConfig.getParameter<edm::InputTag>("simTrackCrossingFrame"))),
+    tokenCrossingFrameSimVertices_(consumes<CrossingFrame<SimVertex>>(iConfig.getParameter<edm::InputTag>("simVertexCrossingFrame"))),
+    tokenAllSimTracks_(produces<edm::SimTrackContainer>("AllSimTracks")),
+    tokenAllSimVertices_(produces<edm::SimVertexContainer>("AllSimVertices")),
+    tokenParentIndex_(produces<vector<int>>("AllSimTracksParentIndex")),
+    tokenRootIndex_(produces<vector<int>>("AllSimTracksRootIndex")),
+    tokenDepth_(produces<vector<int>>("AllSimTracksDepth")),
+    tokenEvent_(produces<vector<int>>("AllSimTracksEvent")),
+    tokenBunchCrossing_(produces<vector<int>>("AllSimTracksBunchCrossing")),
+    verbosity_(iConfig.getUntrackedParameter<int>("verbosity"))
+    {}
 
-    edm::Handle<edm::SimVertexContainer> handleSimVertices;
-    iEvent.getByLabel("g4SimHits", handleSimVertices);
-    edm::Handle<edm::SimTrackContainer> handleSimTracks;
-    iEvent.getByLabel("g4SimHits", handleSimTracks);
 
-    VertexIndexMapper vertex_mapper;
-
-    // for(auto& vertex : *(handleSimVertices.product())){
-    //     vertex_repo.add_vertex(vertex);
-    //     }
+void AllSimTracksAndVerticesProducer::produce(edm::StreamID, edm::Event& iEvent, const edm::EventSetup& iSetup) const {
+    auto all_simtracks = std::make_unique<edm::SimTrackContainer>();
+    auto all_simvertices = std::make_unique<edm::SimVertexContainer>();
 
     edm::Handle<CrossingFrame<SimVertex>> cf_simvertex;
     bool gotVertices = iEvent.getByToken(tokenCrossingFrameSimVertices_, cf_simvertex);
     if(!gotVertices) throw cms::Exception("AllSimTracksAndVerticesProducer") << "Failed to get PU vertices";
+    edm::Handle<CrossingFrame<SimTrack>> cf_simtrack;
+    bool gotTracks = iEvent.getByToken(tokenCrossingFrameSimTracks_, cf_simtrack);
+    if(!gotTracks) throw cms::Exception("AllSimTracksAndVerticesProducer") << "Failed to get PU tracks";
+
+    MixCollection<SimVertex> simvertex_collection(cf_simvertex.product());
+    MixCollection<SimTrack> simtrack_collection(cf_simtrack.product());
+    all_simvertices->reserve(simvertex_collection.size());
+    all_simtracks->reserve(simtrack_collection.size());
+    if (verbosity_ > 0)
+        edm::LogVerbatim("AllSimTracksAndVerticesProducer")
+            << "SimVertices: " << simvertex_collection.sizeSignal() << " signal, "
+            << simvertex_collection.sizePileup() << " pileup; "
+            << "SimTracks: " << simtrack_collection.sizeSignal() << " signal, "
+            << simtrack_collection.sizePileup() << " pileup"
+            ;
 
-    std::unique_ptr<MixCollection<SimVertex>> simvertex_collection(new MixCollection<SimVertex>(cf_simvertex.product()));
-    MixCollection<SimVertex>::iterator it_simvertex;
-    std::cout
-        << "simvertex_collection->sizeSignal()=" << simvertex_collection->sizeSignal()
-        << " simvertex_collection->sizePileup()=" << simvertex_collection->sizePileup()
-        << " simvertex_collection->size()=" << simvertex_collection->size()
-        << std::endl;
-    for (it_simvertex = simvertex_collection->begin(); it_simvertex != simvertex_collection->end(); it_simvertex++) {
-        std::cout
-            << "SimVertex " << it_simvertex->vertexId()
-            << " parentTrackID=" << it_simvertex->parentIndex()
-            << " event=" << it_simvertex->eventId().event()
-            << " bunch-X=" << it_simvertex->eventId().bunchCrossing()
-            << std::endl;
-        SimVertex copy(*it_simvertex);
-        vertex_mapper.add_vertex(copy);
-        all_simvertices->push_back(copy);
+    for (auto it_simvertex = simvertex_collection.begin(); it_simvertex != simvertex_collection.end(); it_simvertex++) {
+        if (verbosity_ > 1)
+            edm::LogVerbatim("AllSimTracksAndVerticesProducer")
+                << "SimVertex " << it_simvertex->vertexId()
+                << " parentTrackID=" << it_simvertex->parentIndex()
+                << " event=" << it_simvertex->eventId().event()
+                << " bunch-X=" << it_simvertex->eventId().bunchCrossing()
+                ;
+        all_simvertices->push_back(*it_simvertex);
         }
 
-    vertex_mapper.print();
+    VertexIndexMapper vertex_mapper;
+    vertex_mapper.build(*all_simvertices);
+    if (verbosity_ > 2){
+        std::ostringstream mapper_printout;
+        vertex_mapper.print(mapper_printout);
+        edm::LogVerbatim("AllSimTracksAndVerticesProducer") << mapper_printout.str();
+        }
 
-    // for(auto& track : *(handleSimTracks.product())){
-    //     SimTrack copy = track;
-    //     copy.setVertexIndex(vertex_repo.get_global_index(copy));
-    //     all_simtracks->push_back(copy);
-    //     }
+    for (auto it_simtrack = simtrack_collection.begin(); it_simtrack != simtrack_collection.end(); it_simtrack++) {
+        if (verbosity_ > 1)
+            edm::LogVerbatim("AllSimTracksAndVerticesProducer")
+                << "SimTrack " << it_simtrack->trackId()
+                << " vertIndex=" << it_simtrack->vertIndex()
+                << " event=" << it_simtrack->eventId().event()
+                << " bunch-X=" << it_simtrack->eventId().bunchCrossing()
+                ;
+        all_simtracks->push_back(*it_simtrack);
+        all_simtracks->back().setVertexIndex(vertex_mapper.global_vertex_index(*it_simtrack));
+        }
 
-    edm::Handle<CrossingFrame<SimTrack>> cf_simtrack;
-    bool gotTracks = iEvent.getByToken(tokenCrossingFrameSimTracks_, cf_simtrack);
-    if(!gotTracks) throw cms::Exception("AllSimTracksAndVerticesProducer") << "Failed to get PU tracks";
+    TrackHierarchy hierarchy;
+    hierarchy.build(*all_simtracks, *all_simvertices);
+    iEvent.emplace(tokenParentIndex_, std::move(hierarchy.parent));
+    iEvent.emplace(tokenRootIndex_, std::move(hierarchy.root));
+    iEvent.emplace(tokenDepth_, std::move(hierarchy.depth));
+    iEvent.emplace(tokenEvent_, std::move(hierarchy.event));
+    iEvent.emplace(tokenBunchCrossing_, std::move(hierarchy.bunch_crossing));
+
+    iEvent.put(tokenAllSimTracks_, std::move(all_simtracks));
+    iEvent.put(tokenAllSimVertices_, std::move(all_simvertices));
+    }
 
-    std::unique_ptr<MixCollection<SimTrack>> simtrack_collection(new MixCollection<SimTrack>(cf_simtrack.product()));
-    MixCollection<SimTrack>::iterator it_simtrack;
-    std::cout
-        << "simtrack_collection->sizeSignal()=" << simtrack_collection->sizeSignal()
-        << " simtrack_collection->sizePileup()=" << simtrack_collection->sizePileup()
-        << " simtrack_collection->size()=" << simtrack_collection->size()
-        << std::endl;
-    for (it_simtrack = simtrack_collection->begin(); it_simtrack != simtrack_collection->end(); it_simtrack++) {
-        std::cout
-            << "SimTrack " << it_simtrack->trackId()
-            << " vertIndex=" << it_simtrack->vertIndex()
-            << " event=" << it_simtrack->eventId().event()
-            << " bunch-X=" << it_simtrack->eventId().bunchCrossing()
-            << std::endl;
-        SimTrack copy(*it_simtrack);
-        copy.setVertexIndex(vertex_mapper.global_vertex_index(copy));
-        all_simtracks->push_back(copy);
-        }
 
-    iEvent.put(std::move(all_simtracks), "AllSimTracks");
-    iEvent.put(std::move(all_simvertices), "AllSimVertices");
+void AllSimTracksAndVerticesProducer::fillDescriptions(edm::ConfigurationDescriptions& descriptions) {
+    edm::ParameterSetDescription desc;
+    desc.add<edm::InputTag>("simTrackCrossingFrame", edm::InputTag("mix", "g4SimHits"));
+    desc.add<edm::InputTag>("simVertexCrossingFrame", edm::InputTag("mix", "g4SimHits"));
+    desc.addUntracked<int>("verbosity", 0);
+    descriptions.add("allSimTracksAndVerticesProducer", desc);
     }
 
 DEFINE_FWK_MODULE(AllSimTracksAndVerticesProducer);
\ No newline at end of file
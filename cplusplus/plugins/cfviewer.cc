@@ -1,133 +1,225 @@
 #include "FWCore/Framework/interface/Frameworkfwd.h"
 #include "FWCore/Framework/interface/one/EDAnalyzer.h"
-#include "FWCore/Framework/interface/ESHandle.h"
 #include "FWCore/Framework/interface/Event.h"
 #include "FWCore/Framework/interface/MakerMacros.h"
+#include "FWCore/MessageLogger/interface/MessageLogger.h"
 #include "FWCore/ParameterSet/interface/ParameterSet.h"
-#include "FWCore/Utilities/interface/StreamID.h"
+#include "FWCore/ParameterSet/interface/ConfigurationDescriptions.h"
+#include "FWCore/ParameterSet/interface/ParameterSetDescription.h"
 #include "FWCore/PluginManager/interface/ModuleDef.h"
 #include "FWCore/ServiceRegistry/interface/Service.h"
-#include "CommonTools/UtilAlgos/interface/TFileService.h" 
+#include "CommonTools/UtilAlgos/interface/TFileService.h"
 
 #include "SimDataFormats/CrossingFrame/interface/CrossingFrame.h"
 #include "SimDataFormats/CrossingFrame/interface/MixCollection.h"
-#include "SimDataFormats/GeneratorProducts/interface/HepMCProduct.h"
+#include "SimDataFormats/CaloHit/interface/PCaloHit.h"
+#include "SimDataFormats/Track/interface/SimTrack.h"
+#include "SimDataFormats/Vertex/interface/SimVertex.h"
 
+#include <TH1D.h>
+#include <TProfile.h>
+#include <TTree.h>
 
-#include <TLorentzVector.h>
- 
 #include <vector>
-#include <map>
-#include <any>
-#include <set>
-#include <memory>
-#include <cmath>
-#include <iostream>
 #include <string>
-#include <cstdlib>
+#include <chrono>
 using std::vector;
 using std::string;
-using std::map;
-using std::unordered_map;
-
-#include "DataFormats/Common/interface/Ptr.h"
-#include "DataFormats/Common/interface/View.h"
-#include "SimDataFormats/CaloHit/interface/PCaloHitContainer.h"
-#include "SimDataFormats/CaloHit/interface/PCaloHit.h"
-#include "DataFormats/DetId/interface/DetId.h"
-#include "SimDataFormats/Track/interface/SimTrack.h"
-#include "SimDataFormats/Vertex/interface/SimVertex.h"
-#include "SimDataFormats/Track/interface/SimTrackContainer.h"
-#include "SimDataFormats/Vertex/interface/SimVertexContainer.h"
-
-#include "DataFormats/ForwardDetId/interface/HGCalDetId.h"
-#include "Geometry/HGCalGeometry/interface/HGCalGeometry.h"
-#include "DataFormats/HGCRecHit/interface/HGCRecHitCollections.h"
-#include "Geometry/CaloGeometry/interface/CaloCellGeometry.h"
-#include "Geometry/CaloGeometry/interface/CaloGeometry.h"
-#include "Geometry/CaloGeometry/interface/CaloSubdetectorGeometry.h"
-#include "Geometry/CaloGeometry/interface/TruncatedPyramid.h"
-#include "Geometry/Records/interface/CaloGeometryRecord.h"
-#include "RecoLocalCalo/HGCalRecAlgos/interface/RecHitTools.h"
 
 
+/*
+Per-event profile of the crossing frames made by the mixing module.
+
+For the SimTracks, SimVertices and the PCaloHits of every configured HGCal
+subdetector, it counts the signal and pileup objects per bunch crossing, and
+times the MixCollection iteration over the crossing frame (constructing the
+MixCollection and visiting every object). The results go to TFileService:
+- histograms per collection: mean pileup and signal objects per bunch crossing,
+  iteration time per event, and iteration time against the number of objects
+- a `crossings` ntuple with one entry per (event, bunch crossing) with the signal
+  and pileup counts of all collections
+- an `events` ntuple with one entry per event with the total number of objects
+  and the iteration time of all collections
+*/
 class cfviewer: public edm::one::EDAnalyzer<edm::one::SharedResources>  {
     public:
         explicit cfviewer(const edm::ParameterSet&);
         ~cfviewer() {}
         static void fillDescriptions(edm::ConfigurationDescriptions& descriptions);
     private:
+        // Counts, timing and output of one crossing frame
+        struct Profile {
+            string name;
+            vector<int> n_signal, n_pileup;  // per bunch crossing
+            int n_total = 0;
+            double time_us = 0.;
+            bool missing = false;  // warned about a missing crossing frame
+            TProfile* signal_vs_bx = nullptr;
+            TProfile* pileup_vs_bx = nullptr;
+            TH1D* time = nullptr;
+            TProfile* time_vs_n = nullptr;
+            };
+
         void beginJob() override;
-        void doBeginRun_(const edm::Run&, const edm::EventSetup&) override {}
         void analyze(const edm::Event&, const edm::EventSetup&) override;
-        void doEndRun_(const edm::Run&, const edm::EventSetup&) override {}
         void endJob() override {}
-        edm::EDGetTokenT<edm::SimTrackContainer> tokenSimTracks;
-        edm::EDGetTokenT<edm::SimVertexContainer> tokenSimVertices;
-        edm::EDGetTokenT<CrossingFrame<SimTrack>> SimTrackToken_;
+
+        template <class T>
+        void profile(const edm::Event&, const edm::EDGetTokenT<CrossingFrame<T>>&, Profile&);
+        void book(Profile&);
+
+        const edm::EDGetTokenT<CrossingFrame<SimTrack>> tokenSimTracks_;
+        const edm::EDGetTokenT<CrossingFrame<SimVertex>> tokenSimVertices_;
+        vector<edm::EDGetTokenT<CrossingFrame<PCaloHit>>> tokensCaloHits_;
+        const int min_bx_;
+        const int n_bx_;
+        vector<Profile> profiles_;  // tracks, vertices, then the calo hits in configuration order
+
+        TTree* crossings_ = nullptr;
+        TTree* events_ = nullptr;
+        unsigned int run_ = 0, lumi_ = 0;
+        unsigned long long event_ = 0;
+        int bx_ = 0;
+        vector<int> crossing_signal_, crossing_pileup_;  // ntuple buffers, per collection
     };
 
-cfviewer::cfviewer(const edm::ParameterSet& iConfig) : 
-    tokenSimTracks(consumes<edm::SimTrackContainer>(edm::InputTag("g4SimHits"))),
-    tokenSimVertices(consumes<edm::SimVertexContainer>(edm::InputTag("g4SimHits"))),
-    SimTrackToken_(consumes<CrossingFrame<SimTrack>>(edm::InputTag("mix", "g4SimHits")))
-    {}
 
-void cfviewer::beginJob() {}
+cfviewer::cfviewer(const edm::ParameterSet& iConfig) :
+    tokenSimTracks_(consumes<CrossingFrame<SimTrack>>(iConfig.getParameter<edm::InputTag>("simTrackCrossingFrame"))),
+    tokenSimVertices_(consumes<CrossingFrame<SimVertex>>(iConfig.getParameter<edm::InputTag>("simVertexCrossingFrame"))),
+    min_bx_(iConfig.getParameter<int>("minBunch")),
+    n_bx_(iConfig.getParameter<int>("maxBunch") - iConfig.getParameter<int>("minBunch") + 1)
+    {
+    usesResource(TFileService::kSharedResource);
+    profiles_.resize(2);
+    profiles_[0].name = "simtracks";
+    profiles_[1].name = "simvertices";
+    for (const auto& tag : iConfig.getParameter<vector<edm::InputTag>>("caloHitCrossingFrames")){
+        tokensCaloHits_.push_back(consumes<CrossingFrame<PCaloHit>>(tag));
+        // mix:g4SimHitsHGCHitsEE -> hits_HGCHitsEE
+        string subdet = tag.instance();
+        if (subdet.rfind("g4SimHits", 0) == 0) subdet = subdet.substr(9);
+        profiles_.emplace_back();
+        profiles_.back().name = "hits_" + subdet;
+        }
+    for (auto& p : profiles_){
+        p.n_signal.resize(n_bx_);
+        p.n_pileup.resize(n_bx_);
+        }
+    crossing_signal_.resize(profiles_.size());
+    crossing_pileup_.resize(profiles_.size());
+    }
 
-void cfviewer::analyze(const edm::Event& iEvent, const edm::EventSetup& iSetup) {
 
-    edm::Handle<edm::SimVertexContainer> handleSimVertices;
-    iEvent.getByLabel("g4SimHits", handleSimVertices);
-    edm::Handle<edm::SimTrackContainer> handleSimTracks;
-    iEvent.getByLabel("g4SimHits", handleSimTracks);
+void cfviewer::book(Profile& p){
+    edm::Service<TFileService> fs;
+    const double lo = min_bx_ - 0.5, hi = min_bx_ + n_bx_ - 0.5;
+    p.signal_vs_bx = fs->make<TProfile>(
+        (p.name + "_signal_vs_bx").c_str(), (p.name + ";bunch crossing;signal objects per event").c_str(), n_bx_, lo, hi
+        );
+    p.pileup_vs_bx = fs->make<TProfile>(
+        (p.name + "_pileup_vs_bx").c_str(), (p.name + ";bunch crossing;pileup objects per event").c_str(), n_bx_, lo, hi
+        );
+    p.time = fs->make<TH1D>(
+        (p.name + "_time").c_str(), (p.name + ";MixCollection iteration time per event [us];events").c_str(), 200, 0., 1000.
+        );
+    p.time_vs_n = fs->make<TProfile>(
+        (p.name + "_time_vs_n").c_str(), (p.name + ";objects per event;MixCollection iteration time [us]").c_str(), 100, 0., 1000.
+        );
+    // Ranges double as needed to fit larger events
+    p.time->SetCanExtend(TH1::kAllAxes);
+    p.time_vs_n->SetCanExtend(TH1::kAllAxes);
+    }
 
 
-    for(const auto& track : *(handleSimTracks.product())){
-        std::cout << "SimTrack id: " << track.trackId() << "\n";
-        // SimVertex vertex = handleSimVertices.product()->at(track.vertIndex());
+void cfviewer::beginJob() {
+    edm::Service<TFileService> fs;
+    crossings_ = fs->make<TTree>("crossings", "Signal and pileup objects per event and bunch crossing");
+    events_ = fs->make<TTree>("events", "Objects and MixCollection iteration time per event");
+    for (TTree* tree : {crossings_, events_}){
+        tree->Branch("run", &run_, "run/i");
+        tree->Branch("lumi", &lumi_, "lumi/i");
+        tree->Branch("event", &event_, "event/l");
+        }
+    crossings_->Branch("bx", &bx_, "bx/I");
+    for (size_t i = 0; i < profiles_.size(); ++i){
+        Profile& p = profiles_[i];
+        book(p);
+        crossings_->Branch((p.name + "_signal").c_str(), &crossing_signal_[i], (p.name + "_signal/I").c_str());
+        crossings_->Branch((p.name + "_pileup").c_str(), &crossing_pileup_[i], (p.name + "_pileup/I").c_str());
+        events_->Branch((p.name + "_n").c_str(), &p.n_total, (p.name + "_n/I").c_str());
+        events_->Branch((p.name + "_time_us").c_str(), &p.time_us, (p.name + "_time_us/D").c_str());
         }
+    }
 
-    // const std::string subdet("TrackerHitsTECHighTof");
-    // edm::Handle<CrossingFrame<PSimHit> > cf_simhit;
-    // iEvent.getByLabel("mix",subdet,cf_simhit);
-    // auto col = std::make_unique<PSimHit>(cf_simhit.product());
-    // MixCollection<PSimHit>::iterator cfi;
-    
-
-    edm::Handle<CrossingFrame<SimTrack>> cf_simtrack;
-    bool gotTracks = iEvent.getByToken(SimTrackToken_, cf_simtrack);
-    if (!gotTracks) std::cout << " Could not read SimTracks!!!!" << std::endl;
-
-    // test access to SimTracks
-    if (gotTracks) {
-        std::cout << "\n=================== Starting SimTrack access ===================" << std::endl;
-        //   edm::Handle<CrossingFrame<SimTrack> > cf_simtrack;
-        //   iEvent.getByLabel("mix",cf_simtrack);
-        std::unique_ptr<MixCollection<SimTrack>> col2(new MixCollection<SimTrack>(cf_simtrack.product()));
-        MixCollection<SimTrack>::iterator cfi2;
-        int count2 = 0;
-        std::cout
-            << " \nWe got " << col2->sizeSignal() << " signal tracks and " << col2->sizePileup()
-            << " pileup tracks, total: " << col2->size()
-            << std::endl;
-        for (cfi2 = col2->begin(); cfi2 != col2->end(); cfi2++) {
-            std::cout
-                << " SimTrack " << count2 << " has genpart index  " << cfi2->genpartIndex() << " vertex Index "
-                << cfi2->vertIndex() << " bunchcr " << cfi2.bunch() << " trigger " << cfi2.getTrigger()
-                << ", from EncodedEventId: " << cfi2->eventId().bunchCrossing() << " " << cfi2->eventId().event()
-                << std::endl;
-            count2++;
-            }
+
+template <class T>
+void cfviewer::profile(const edm::Event& iEvent, const edm::EDGetTokenT<CrossingFrame<T>>& token, Profile& p){
+    std::fill(p.n_signal.begin(), p.n_signal.end(), 0);
+    std::fill(p.n_pileup.begin(), p.n_pileup.end(), 0);
+    p.n_total = 0;
+    p.time_us = 0.;
+    edm::Handle<CrossingFrame<T>> cf;
+    if (!iEvent.getByToken(token, cf)){
+        if (!p.missing) edm::LogWarning("cfviewer") << "No crossing frame for " << p.name << "; counting 0 objects";
+        p.missing = true;
+        return;
+        }
+    const auto start = std::chrono::steady_clock::now();
+    MixCollection<T> collection(cf.product());
+    for (auto it = collection.begin(); it != collection.end(); it++) {
+        const int i_bx = it.bunch() - min_bx_;
+        ++p.n_total;
+        if (i_bx < 0 || i_bx >= n_bx_) continue;
+        if (it.getTrigger()) ++p.n_signal[i_bx];
+        else ++p.n_pileup[i_bx];
+        }
+    p.time_us = std::chrono::duration<double, std::micro>(std::chrono::steady_clock::now() - start).count();
+
+    for (int i_bx = 0; i_bx < n_bx_; ++i_bx){
+        p.signal_vs_bx->Fill(min_bx_ + i_bx, p.n_signal[i_bx]);
+        p.pileup_vs_bx->Fill(min_bx_ + i_bx, p.n_pileup[i_bx]);
         }
+    p.time->Fill(p.time_us);
+    p.time_vs_n->Fill(p.n_total, p.time_us);
+    }
 
+
+void cfviewer::analyze(const edm::Event& iEvent, const edm::EventSetup& iSetup) {
+    run_ = iEvent.id().run();
+    lumi_ = iEvent.id().luminosityBlock();
+    event_ = iEvent.id().event();
+
+    profile(iEvent, tokenSimTracks_, profiles_[0]);
+    profile(iEvent, tokenSimVertices_, profiles_[1]);
+    for (size_t i = 0; i < tokensCaloHits_.size(); ++i)
+        profile(iEvent, tokensCaloHits_[i], profiles_[i + 2]);
+
+    events_->Fill();
+    for (int i_bx = 0; i_bx < n_bx_; ++i_bx){
+        bx_ = min_bx_ + i_bx;
+        for (size_t i = 0; i < profiles_.size(); ++i){
+            crossing_signal_[i] = profiles_[i].n_signal[i_bx];
+            crossing_pileup_[i] = profiles_[i].n_pileup[i_bx];
+            }
+        crossings_->Fill();
+        }
     }
 
+
 void cfviewer::fillDescriptions(edm::ConfigurationDescriptions& descriptions) {
     edm::ParameterSetDescription desc;
-    desc.add<edm::InputTag>("SimTrackTag", edm::InputTag("g4SimHits"));
-    desc.add<edm::InputTag>("SimVertexTag", edm::InputTag("g4SimHits"));
+    desc.add<edm::InputTag>("simTrackCrossingFrame", edm::InputTag("mix", "g4SimHits"));
+    desc.add<edm::InputTag>("simVertexCrossingFrame", edm::InputTag("mix", "g4SimHits"));
+    desc.add<vector<edm::InputTag>>("caloHitCrossingFrames", {
+        edm::InputTag("mix", "g4SimHitsHGCHitsEE"),
+        edm::InputTag("mix", "g4SimHitsHGCHitsHEfront"),
+        edm::InputTag("mix", "g4SimHitsHGCHitsHEback"),
+        });
+    // Range of the per-bunch crossing histograms and ntuple
+    desc.add<int>("minBunch", -12);
+    desc.add<int>("maxBunch", 3);
     descriptions.add("cfviewer", desc);
     }
 
-DEFINE_FWK_MODULE(cfviewer);
\ No newline at end of file
+DEFINE_FWK_MODULE(cfviewer);
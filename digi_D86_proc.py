@@ -4,35 +4,38 @@ from time import strftime
 import os.path as osp
 
 import common
+import pileup_catalog
+import drivers
 
 import FWCore.ParameterSet.Config as cms
 
 
-def digi(input_rootfiles, pu_rootfiles=None, n_events=1):
-    digi_driver = common.CMSDriver('digi', '--no_exec')
-    digi_driver.kwargs.update({
-        '-s'              : 'DIGI:pdigi_valid,L1TrackTrigger,L1,DIGI2RAW,HLT:@fake2',
-        '--conditions'    : 'auto:phase2_realistic_T21',
-        '--datatier'      : 'GEN-SIM-DIGI-RAW',
-        '--eventcontent'  : 'FEVTDEBUGHLT',
-        '--geometry'      : 'Extended2026D86',
-        '--era'           : 'Phase2C11I13M9',
-        '--pileup'        : 'AVE_200_BX_25ns',
-        '--pileup_input'  : 'das:/RelValMinBias_14TeV/1/GEN-SIM',
-        })
+def digi(input_rootfiles, pu_rootfiles=None, n_events=1, output_file=None, seed=1, premix=False):
+    """
+    Mixes `pu_rootfiles` into the signal: minbias GEN-SIM files, or with
+    `premix` a premixed pileup library made by premix_D86_proc.py.
+    """
+    digi_driver = drivers.digi_d86_premix_driver() if premix else drivers.digi_d86_driver()
 
     common.logger.info('input_rootfiles: %s', input_rootfiles)
     common.logger.info('pu_rootfiles: %s', pu_rootfiles)
 
-    process = common.load_process_from_driver(digi_driver, 'digi_driver.py')
-    common.rng(process, 1)
+    process = common.load_process_from_driver(digi_driver, 'digi_premix_driver.py' if premix else 'digi_driver.py')
+    common.rng(process, seed)
     process.source.fileNames = cms.untracked.vstring(input_rootfiles)
     process.maxEvents.input = cms.untracked.int32(n_events)
     process.source.firstLuminosityBlock = cms.untracked.uint32(1)
-    process.mix.input.fileNames = cms.untracked.vstring(pu_rootfiles)
-    process.mix.input.nbPileupEvents.averageNumber = cms.double(4.)
+    if premix:
+        # The pileup is already mixed and digitized; overlay one library event per signal event
+        process.mixData.input.fileNames = cms.untracked.vstring(pu_rootfiles)
+    else:
+        process.mix.input.fileNames = cms.untracked.vstring(pu_rootfiles)
+        process.mix.input.nbPileupEvents.averageNumber = cms.double(4.)
 
-    output_file = 'file:{}_digi_D86_fine_n{}_{}.root'.format(common.guntype(input_rootfiles[0]), n_events, strftime('%b%d'))
+    if not output_file:
+        output_file = 'file:{}_digi_D86_fine_n{}_{}.root'.format(common.guntype(input_rootfiles[0]), n_events, strftime('%b%d'))
+    elif not output_file.startswith('file:'):
+        output_file = 'file:' + output_file
     common.logger.info('Output: %s', output_file)
     process.FEVTDEBUGHLToutput.fileName = cms.untracked.string(output_file)
 
@@ -46,8 +49,18 @@ def digi(input_rootfiles, pu_rootfiles=None, n_events=1):
 
 from FWCore.ParameterSet.VarParsing import VarParsing
 options = VarParsing('analysis')
-options.register('pu', '', VarParsing.multiplicity.list, VarParsing.varType.string, 'List of PU rootfiles')
+options.register('pu', '', VarParsing.multiplicity.list, VarParsing.varType.string, 'List of PU rootfiles or catalog:<directory> (see pileup_catalog.py)')
 options.register('n', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Number of events')
+options.register('out', '', VarParsing.multiplicity.singleton, VarParsing.varType.string, 'Output file (default: dated name)')
+options.register('seed', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Random seed')
+options.register('shard', 0, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Index of this shard')
+options.register('nShards', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Number of shards the n events are split over')
+options.register('premix', False, VarParsing.multiplicity.singleton, VarParsing.varType.bool, 'pu is a premixed pileup library (premix_D86_proc.py)')
+pileup_catalog.add_options(options)
+common.add_threading_options(options)
 options.parseArguments()
-process = digi(options.inputFiles, options.pu, n_events=options.n)
+process = digi(options.inputFiles, pileup_catalog.resolve(options.pu, options.scratch), n_events=options.n, output_file=options.out, seed=options.seed, premix=options.premix)
+threading = common.threading_from_options(process, options)
+if options.nShards > 1: common.shard(process, options.shard, options.nShards, options.n, options.seed)
 common.logger.info('Created process %s', process)
+common.check_threading(process, threading)
@@ -0,0 +1,138 @@
+"""
+cmsDriver.py commands used by the step scripts.
+
+Run this file directly to generate the configs of all steps at once:
+
+    python drivers.py -j 4
+"""
+from __future__ import print_function
+
+import common
+
+# --pileup_input of the drivers with pileup. The step scripts set the actual
+# pileup files (local files or catalogs, see pileup_catalog.py), so this is a
+# placeholder that lets cmsDriver.py generate the configs without a DAS query
+PILEUP_INPUT = 'file:pileup.root'
+
+
+def gen_driver():
+    driver = common.CMSDriver('TTbar_14TeV_TuneCP5_cfi', '--no_exec')
+    driver.kwargs.update({
+        '--conditions'      : 'auto:phase2_realistic_T15',
+        '-n'                : '10',
+        '--era'             : 'Phase2C9',
+        '--eventcontent'    : 'FEVTDEBUG',
+        '-s'                : 'GEN',
+        '--datatier'        : 'GEN',
+        '--beamspot'        : 'NoSmear',
+        '--geometry'        : 'Extended2026D49',
+        '--pileup'          : 'NoPileUp',
+        })
+    return driver
+
+
+def gensim_d86_driver():
+    driver = common.CMSDriver('TTbar_14TeV_TuneCP5_cfi', '--no_exec')
+    driver.kwargs.update({
+        '-s'             : 'GEN,SIM',
+        '--conditions'   : 'auto:phase2_realistic_T21',
+        '--beamspot'     : 'HLLHC14TeV',
+        '--datatier'     : 'GEN-SIM',
+        '--eventcontent' : 'FEVTDEBUG',
+        '--geometry'     : 'Extended2026D86',
+        '--era'          : 'Phase2C11I13M9',
+        '--procModifier' : 'fineCalo',
+        })
+    return driver
+
+
+def digi_d86_driver():
+    driver = common.CMSDriver('digi', '--no_exec')
+    driver.kwargs.update({
+        '-s'              : 'DIGI:pdigi_valid,L1TrackTrigger,L1,DIGI2RAW,HLT:@fake2',
+        '--conditions'    : 'auto:phase2_realistic_T21',
+        '--datatier'      : 'GEN-SIM-DIGI-RAW',
+        '--eventcontent'  : 'FEVTDEBUGHLT',
+        '--geometry'      : 'Extended2026D86',
+        '--era'           : 'Phase2C11I13M9',
+        '--pileup'        : 'AVE_200_BX_25ns',
+        '--pileup_input'  : PILEUP_INPUT,
+        })
+    return driver
+
+
+def reco_d86_driver():
+    driver = common.CMSDriver('reco', '--no_exec')
+    driver.kwargs.update({
+        '-s'             : 'RAW2DIGI,L1Reco,RECO,RECOSIM,PAT,VALIDATION:@phase2Validation+@miniAODValidation,DQM:@phase2+@miniAODDQM',
+        '--conditions'   : 'auto:phase2_realistic_T21',
+        '--datatier'     : 'GEN-SIM-RECO,MINIAODSIM,DQMIO',
+        '-n'             : '10',
+        '--eventcontent' : 'FEVTDEBUGHLT,MINIAODSIM,DQM',
+        '--geometry'     : 'Extended2026D86',
+        '--era'          : 'Phase2C11I13M9',
+        '--pileup'       : 'AVE_200_BX_25ns',
+        '--pileup_input' : PILEUP_INPUT,
+        })
+    return driver
+
+
+def premix_stage1_d86_driver():
+    """
+    Premixed pileup library: neutrino gun events with only pileup mixed in,
+    digitized and written as PREMIX.
+    """
+    driver = common.CMSDriver('SingleNuE10_cfi', '--no_exec')
+    driver.kwargs.update({
+        '-s'              : 'GEN,SIM,DIGI:pdigi_valid',
+        '--conditions'    : 'auto:phase2_realistic_T21',
+        '--beamspot'      : 'HLLHC14TeV',
+        '--datatier'      : 'PREMIX',
+        '--eventcontent'  : 'PREMIX',
+        '--geometry'      : 'Extended2026D86',
+        '--era'           : 'Phase2C11I13M9',
+        '--procModifiers' : 'premix_stage1',
+        '--pileup'        : 'AVE_200_BX_25ns',
+        '--pileup_input'  : PILEUP_INPUT,
+        })
+    return driver
+
+
+def digi_d86_premix_driver():
+    """
+    Like `digi_d86_driver`, but mixes a premixed pileup library (see
+    `premix_stage1_d86_driver`) into the signal instead of minbias events.
+    """
+    driver = digi_d86_driver()
+    del driver.kwargs['--pileup']
+    driver.kwargs.update({
+        '-s'              : 'DIGI:pdigi_valid,DATAMIX,L1TrackTrigger,L1,DIGI2RAW,HLT:@fake2',
+        '--datamix'       : 'PreMix',
+        '--procModifiers' : 'premix_stage2',
+        '--pileup_input'  : PILEUP_INPUT,
+        })
+    return driver
+
+
+def reco_d86_premix_driver():
+    driver = reco_d86_driver()
+    for key in ['--pileup', '--pileup_input']: del driver.kwargs[key]
+    driver.kwargs['--procModifiers'] = 'premix_stage2'
+    return driver
+
+
+def all_drivers():
+    return [
+        gen_driver(), gensim_d86_driver(), digi_d86_driver(), reco_d86_driver(),
+        premix_stage1_d86_driver(), digi_d86_premix_driver(), reco_d86_premix_driver(),
+        ]
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Max number of cmsDriver.py processes')
+    parser.add_argument('--recreate', action='store_true')
+    args = parser.parse_args()
+    for config in common.generate_configs(all_drivers(), n_workers=args.jobs, recreate=args.recreate):
+        print(config)
@@ -0,0 +1,161 @@
+"""
+Persistent per-file index of the events in an EDM file.
+
+Maps every entry of the Events tree to its (run, lumi, event), and
+optionally to the sizes of a few basic collections. The index is stored
+in the sidecar column cache of the file (see column_cache.py), so it is
+built once per file by reading only the branches it needs.
+
+The print tools use it to seek straight to events:
+
+    python print_sim.py sim.root --event 3471
+    python print_sim.py sim.root --event 1:12:45071 1:12:45078
+    python print_reco.py reco.root --range 100:110
+
+Run this file directly to print the index of a file:
+
+    python event_index.py reco.root
+"""
+from __future__ import print_function
+
+import numpy as np
+
+import columns
+import column_cache
+import rootio
+
+ID_EXTRACTORS = {
+    'index_id' : ('EventAuxiliary', columns.eventauxiliary),
+    }
+
+# Collections whose per-event size goes into the index, if they exist
+SIZE_BRANCHES = {
+    'genparticles' : 'recoGenParticles_genParticles__GEN',
+    'simtracks' : ['SimTracks_g4SimHits__SIM', 'SimTracks_g4SimHits__HLT'],
+    'simvertices' : ['SimVertexs_g4SimHits__SIM', 'SimVertexs_g4SimHits__HLT'],
+    'allsimtracks' : 'SimTracks_AllSimTracksAndVerticesProducer_AllSimTracks_RECO',
+    'ee_simhits' : 'PCaloHits_g4SimHits_HGCHitsEE_SIM',
+    'ee_rechits' : 'HGCRecHitsSorted_HGCalRecHit_HGCEERecHits_RECO',
+    'simclusters' : ['SimClusters_mix_MergedCaloTruth_HLT', 'SimClusters_mix_MergedCaloTruth_SIM'],
+    'caloparticles' : ['CaloParticles_mix_MergedCaloTruth_HLT', 'CaloParticles_mix_MergedCaloTruth_SIM'],
+    }
+
+
+def load(rootfile, sizes=False, recreate=False):
+    """
+    Returns the index of `rootfile` as a dict of per-entry arrays: `run`,
+    `lumi`, `event` and, with `sizes`, `n_<collection>` for the
+    collections in SIZE_BRANCHES that exist in the file.
+    """
+    extractors = dict(ID_EXTRACTORS)
+    if sizes:
+        extractors.update({
+            'index_n_' + label : (branch, columns.size)
+            for label, branch in SIZE_BRANCHES.items()
+            })
+    with rootio.open_root(rootfile) as f:
+        tree = f.Get('Events')
+        extractors = column_cache.resolve_extractors(
+            tree, extractors, optional=[k for k in extractors if k not in ID_EXTRACTORS]
+            )
+        rootio.prepare_tree(tree, [branch for branch, _ in extractors.values()])
+        cols = column_cache.ColumnCache(rootfile).get(tree, extractors, recreate=recreate)
+    index = {name: cols['index_id'][name] for name in ['run', 'lumi', 'event']}
+    for key in cols:
+        if key in ID_EXTRACTORS: continue
+        index[key[len('index_'):]] = cols[key]['size']
+    return index
+
+
+def parse_event(s):
+    """
+    An event is an entry number ('3471') or run:lumi:event ('1:12:45071').
+    """
+    parts = s.split(':')
+    if len(parts) == 1: return int(parts[0])
+    if len(parts) == 3: return tuple(int(p) for p in parts)
+    raise Exception('Cannot parse event {}; use <entry> or <run>:<lumi>:<event>'.format(s))
+
+
+def parse_range(s):
+    """
+    An entry range 'start:stop' (stop exclusive); either may be left out.
+    """
+    start, _, stop = s.partition(':')
+    return (int(start) if start else 0), (int(stop) if stop else None)
+
+
+def find_entry(index, run, lumi, event):
+    matches = np.nonzero(
+        (index['run'] == run) & (index['lumi'] == lumi) & (index['event'] == event)
+        )[0]
+    if not len(matches):
+        raise Exception('Event {}:{}:{} is not in the file'.format(run, lumi, event))
+    return int(matches[0])
+
+
+def n_entries(rootfile):
+    with rootio.open_root(rootfile) as f:
+        return int(f.Get('Events').GetEntries())
+
+
+def select_entries(rootfile, events=None, entry_range=None, missing_ok=False):
+    """
+    Returns the list of entries for `events` (see `parse_event`) followed
+    by the entries in `entry_range` (see `parse_range`), or None if
+    neither is given. The index is only loaded for run:lumi:event lookups.
+    With `missing_ok`, run:lumi:events that are not in the file are
+    skipped, and entries beyond the end of the file are dropped.
+    """
+    if not events and not entry_range: return None
+    entries = []
+    index = None
+    total = None
+    for event in (events or []):
+        event = parse_event(event)
+        if isinstance(event, int):
+            if missing_ok:
+                if total is None: total = n_entries(rootfile)
+                if not 0 <= event < total: continue
+            entries.append(event)
+            continue
+        if index is None: index = load(rootfile)
+        try:
+            entries.append(find_entry(index, *event))
+        except Exception:
+            if not missing_ok: raise
+    if entry_range:
+        start, stop = parse_range(entry_range)
+        if stop is None or missing_ok:
+            if total is None: total = n_entries(rootfile)
+            stop = total if stop is None else min(stop, total)
+        entries.extend(range(start, stop))
+    return entries
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        '--event', type=str, nargs='*', default=None,
+        help='Entry numbers or run:lumi:event of the events to print (overrides -n)'
+        )
+    parser.add_argument(
+        '--range', type=str, default=None,
+        help='Range of entries start:stop to print (overrides -n)'
+        )
+
+
+def entries_from_args(rootfile, args):
+    return select_entries(rootfile, args.event, args.range)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('rootfile', type=str)
+    parser.add_argument('--recreate', action='store_true')
+    args = parser.parse_args()
+    index = load(args.rootfile, sizes=True, recreate=args.recreate)
+    names = ['run', 'lumi', 'event'] + sorted(k for k in index if k.startswith('n_'))
+    print(' '.join(['{:>7}'.format('entry')] + ['{:>12}'.format(name) for name in names]))
+    for entry, row in enumerate(zip(*(index[name].tolist() for name in names))):
+        print(' '.join(['{:>7}'.format(entry)] + ['{:>12}'.format(v) for v in row]))
@@ -0,0 +1,162 @@
+"""
+Runs a print tool over many files on a process pool.
+
+Inputs are paths, globs or `@filelist` files (one path or glob per line).
+The work is split into one task per file, or with `--chunk-size` into
+chunks of entries of each file. Every task runs the tool function in a
+worker process with its output captured; the outputs are printed in
+input order as soon as they are available, followed by the sum of the
+summaries that the tool function returns (counts per event, e.g. tracks
+and hits), with rates where the tool defines them.
+
+    python print_reco.py 'production/*.root' -j 64 --summary
+"""
+from __future__ import print_function
+
+import os
+import sys, io
+import glob
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from collections import Counter
+
+import common
+import event_index
+
+# (numerator, denominator, label) of summary rates
+RATES = [
+    ('matched_hits', 'simcluster_hits', 'simcluster hit match rate'),
+    ('hits_on_tracks', 'hits', 'fraction of hits on a simtrack'),
+    ]
+
+
+def expand_inputs(inputs):
+    """
+    Expands globs and `@filelist` files into a sorted list of paths per
+    input, without duplicates.
+    """
+    paths = []
+    for item in inputs:
+        if item.startswith('@'):
+            with open(item[1:], 'r') as f:
+                lines = [l.strip() for l in f]
+            paths.extend(expand_inputs([l for l in lines if l and not l.startswith('#')]))
+        elif glob.has_magic(item):
+            matches = sorted(glob.glob(item))
+            if not matches: common.logger.warning('No files match %s', item)
+            paths.extend(matches)
+        else:
+            paths.append(item)
+    seen = set()
+    return [p for p in paths if not (p in seen or seen.add(p))]
+
+
+def make_tasks(rootfiles, n=None, events=None, entry_range=None, chunk_size=None):
+    """
+    Returns a list of (rootfile, entries, selection) tasks.
+    Without `chunk_size` there is one task per file, and the worker selects
+    the entries itself (`entries` is None; `selection` is the events and
+    entry range, see event_index.select_entries). With `chunk_size` the
+    entries of every file are selected here, and split into tasks of at
+    most `chunk_size` entries.
+    """
+    missing_ok = len(rootfiles) > 1
+    if not chunk_size:
+        return [(rootfile, None, (events, entry_range, missing_ok)) for rootfile in rootfiles]
+    tasks = []
+    for rootfile in rootfiles:
+        entries = event_index.select_entries(rootfile, events, entry_range, missing_ok=missing_ok)
+        if entries is None:
+            total = event_index.n_entries(rootfile)
+            entries = list(range(total if n is None else min(n, total)))
+        for i in range(0, len(entries), chunk_size):
+            tasks.append((rootfile, entries[i:i+chunk_size], None))
+    return tasks
+
+
+def run_task(module, func, rootfile, entries, selection, kwargs, quiet=False, capture=True):
+    """
+    Runs `module.func(rootfile, entries=entries, **kwargs)`. Returns
+    (output, summary); the output is only captured with `capture`, and
+    discarded with `quiet`.
+    """
+    fn = getattr(importlib.import_module(module), func)
+    if selection is not None:
+        entries = event_index.select_entries(rootfile, *selection)
+    out = io.StringIO()
+    if quiet:
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            summary = fn(rootfile, entries=entries, **kwargs)
+    elif capture:
+        with redirect_stdout(out):
+            summary = fn(rootfile, entries=entries, **kwargs)
+    else:
+        summary = fn(rootfile, entries=entries, **kwargs)
+    return out.getvalue(), Counter(summary or {})
+
+
+def format_summary(summary):
+    lines = ['{:<40} {:>14}'.format(key, value) for key, value in sorted(summary.items())]
+    for num, denom, label in RATES:
+        if summary.get(denom):
+            lines.append('{:<40} {:>14.4f}'.format(label, summary[num] / summary[denom]))
+    return '\n'.join(lines)
+
+
+def run(module, func, rootfiles, kwargs, n_workers=None, quiet=False, **task_kwargs):
+    """
+    Runs the tool over all tasks (see `make_tasks`) on `n_workers`
+    processes (default: number of cores), prints the outputs in order and
+    returns the summed summary.
+    """
+    tasks = make_tasks(rootfiles, n=kwargs.get('n'), **task_kwargs)
+    if n_workers is None: n_workers = os.cpu_count() or 1
+    n_workers = max(1, min(n_workers, len(tasks)))
+    common.logger.info('Running %s over %s tasks from %s files on %s workers', func, len(tasks), len(rootfiles), n_workers)
+    summary = Counter()
+    if n_workers == 1:
+        for task in tasks:
+            summary.update(run_task(module, func, *task, kwargs, quiet=quiet, capture=False)[1])
+        return summary
+    # Worker processes are spawned, not forked: ROOT does not survive a fork
+    # of an initialized interpreter
+    with ProcessPoolExecutor(n_workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [
+            pool.submit(run_task, module, func, *task, kwargs, quiet=quiet)
+            for task in tasks
+            ]
+        for future in futures:
+            output, task_summary = future.result()
+            sys.stdout.write(output)
+            sys.stdout.flush()
+            summary.update(task_summary)
+    return summary
+
+
+def add_arguments(parser):
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes (0: number of cores)')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Split files into tasks of this many entries')
+    parser.add_argument('--summary', action='store_true', help='Only print the summed summary')
+
+
+def main(module, func, args, kwargs):
+    """
+    Entry point for the print tools: `args` has `rootfiles`, `event`,
+    `range` (see event_index.add_arguments) and the arguments of
+    `add_arguments`. The tool function takes `entries` and
+    `summary_only` keyword arguments, and returns a dict of counts.
+    """
+    rootfiles = expand_inputs(args.rootfiles)
+    if not rootfiles: raise Exception('No input files')
+    if args.summary: kwargs = dict(kwargs, summary_only=True)
+    summary = run(
+        module, func, rootfiles, kwargs,
+        n_workers=args.jobs or None, quiet=args.summary,
+        events=args.event, entry_range=args.range, chunk_size=args.chunk_size,
+        )
+    if args.summary or len(rootfiles) > 1:
+        print('\nSummary over {} files:'.format(len(rootfiles)))
+        print(format_summary(summary))
+    return summary
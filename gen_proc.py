@@ -2,22 +2,12 @@ from __future__ import print_function
 from pprint import pprint, pformat
 
 import common
+import drivers
 
 import FWCore.ParameterSet.Config as cms
 
 
-driver = common.CMSDriver('TTbar_14TeV_TuneCP5_cfi', '--no_exec')
-driver.kwargs.update({
-    '--conditions'      : 'auto:phase2_realistic_T15',
-    '-n'                : '10',
-    '--era'             : 'Phase2C9',
-    '--eventcontent'    : 'FEVTDEBUG',
-    '-s'                : 'GEN',
-    '--datatier'        : 'GEN',
-    '--beamspot'        : 'NoSmear',
-    '--geometry'        : 'Extended2026D49',
-    '--pileup'          : 'NoPileUp',
-    })
+driver = drivers.gen_driver()
 
 
 def minbias(pt_min=None, pt_max=None, n_events=1):
@@ -97,9 +87,12 @@ options.register(
 options.register(
     'n', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Number of events'
     )
+common.add_threading_options(options)
 options.parseArguments()
 
 if options.thing not in locals(): raise Exception('Invalid thing %s' % options.thing)
 common.logger.info('Doing %s', options.thing)
 process = locals()[options.thing](n_events=options.n)
-common.logger.info('Created process %s', process)
\ No newline at end of file
+threading = common.threading_from_options(process, options)
+common.logger.info('Created process %s', process)
+common.check_threading(process, threading)
@@ -3,29 +3,23 @@ from pprint import pprint, pformat
 from time import strftime
 
 import common
+import drivers
 
 import FWCore.ParameterSet.Config as cms
 
 
-def gensim(thing, n_events):
-    gensim_driver = common.CMSDriver('TTbar_14TeV_TuneCP5_cfi', '--no_exec')
-    gensim_driver.kwargs.update({
-        '-s'             : 'GEN,SIM',
-        '--conditions'   : 'auto:phase2_realistic_T21',
-        '--beamspot'     : 'HLLHC14TeV',
-        '--datatier'     : 'GEN-SIM',
-        '--eventcontent' : 'FEVTDEBUG',
-        '--geometry'     : 'Extended2026D86',
-        '--era'          : 'Phase2C11I13M9',
-        '--procModifier' : 'fineCalo',
-        })
+def gensim(thing, n_events, output_file=None, seed=1):
+    gensim_driver = drivers.gensim_d86_driver()
     process = common.load_process_from_driver(gensim_driver, 'gensim_driver.py')
-    common.rng(process, 1)
+    common.rng(process, seed)
     common.activate_finecalo(process)
     process.maxEvents.input = cms.untracked.int32(n_events)
     process.source.firstLuminosityBlock = cms.untracked.uint32(1)
 
-    output_file = 'file:{}_gensim_D86_fine_n{}_{}.root'.format(thing, n_events, strftime('%b%d'))
+    if not output_file:
+        output_file = 'file:{}_gensim_D86_fine_n{}_{}.root'.format(thing, n_events, strftime('%b%d'))
+    elif not output_file.startswith('file:'):
+        output_file = 'file:' + output_file
     common.logger.info('Output: %s', output_file)
     process.FEVTDEBUGoutput.fileName = cms.untracked.string(output_file)
 
@@ -41,7 +35,14 @@ from FWCore.ParameterSet.VarParsing import VarParsing
 options = VarParsing('analysis')
 options.register('thing', 'minbias', VarParsing.multiplicity.singleton, VarParsing.varType.string, 'Choices: "tau", "muon", "minbias"')
 options.register('n', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Number of events')
+options.register('out', '', VarParsing.multiplicity.singleton, VarParsing.varType.string, 'Output file (default: dated name)')
+options.register('seed', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Random seed')
+options.register('shard', 0, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Index of this shard')
+options.register('nShards', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Number of shards the n events are split over')
+common.add_threading_options(options)
 options.parseArguments()
-process = gensim(options.thing, n_events=options.n)
+process = gensim(options.thing, n_events=options.n, output_file=options.out, seed=options.seed)
+threading = common.threading_from_options(process, options)
+if options.nShards > 1: common.shard(process, options.shard, options.nShards, options.n, options.seed)
 common.logger.info('Created process %s', process)
-
+common.check_threading(process, threading)
@@ -91,5 +91,11 @@ def gensim():
     
     return process
 
+from FWCore.ParameterSet.VarParsing import VarParsing
+options = VarParsing('analysis')
+common.add_threading_options(options)
+options.parseArguments()
 process = gensim()
+threading = common.threading_from_options(process, options)
 common.logger.info('Created process %s', process)
+common.check_threading(process, threading)
@@ -0,0 +1,30 @@
+"""
+Merges EDM files (e.g. the shards of a sharded step) into one file:
+
+    cmsRun merge_cfg.py inputFiles=file:a.root,file:b.root out=file:merged.root
+"""
+import FWCore.ParameterSet.Config as cms
+from FWCore.ParameterSet.VarParsing import VarParsing
+
+import common
+
+options = VarParsing('analysis')
+options.register('out', 'merged.root', VarParsing.multiplicity.singleton, VarParsing.varType.string, 'Output file')
+options.parseArguments()
+
+output_file = options.out if options.out.startswith('file:') else 'file:' + options.out
+common.logger.info('Merging %s into %s', options.inputFiles, output_file)
+
+process = cms.Process('MERGE')
+process.load('FWCore.MessageService.MessageLogger_cfi')
+process.MessageLogger.cerr.FwkReport.reportEvery = 1000
+process.maxEvents = cms.untracked.PSet(input = cms.untracked.int32(-1))
+process.source = cms.Source("PoolSource",
+    fileNames = cms.untracked.vstring(options.inputFiles),
+    duplicateCheckMode = cms.untracked.string('checkEachFile'),
+    )
+process.output = cms.OutputModule("PoolOutputModule",
+    fileName = cms.untracked.string(output_file),
+    outputCommands = cms.untracked.vstring('keep *'),
+    )
+process.output_step = cms.EndPath(process.output)
@@ -15,9 +15,16 @@ cms_bool = VarParsing.varType.bool
 process = cms.Process('NANO')
 options = VarParsing('python')
 # options.setDefault('outputFile', 'testNanoML.root')
-options.register("nThreads", 1, cms_single, cms_int, "number of threads")
+common.add_threading_options(options)
 options.register("runPFTruth", 0, cms_single, cms_int, "Don't run PFTruth (currently not working with pileup)")
 options.register("merge", True, cms_single, cms_bool, "Run the SimCluster merging steps")
+options.register("out", "", cms_single, VarParsing.varType.string, "Output file (default: dated name)")
+options.register(
+    "compression", "archival", cms_single, VarParsing.varType.string,
+    "Output compression preset: " + ", ".join(
+        "{} ({}-{})".format(k, *v) for k, v in common.COMPRESSION_PRESETS.items()
+        )
+    )
 options.parseArguments()
 
 # import of standard configurations
@@ -40,10 +47,9 @@ if not options.runPFTruth:
     process.trackSCAssocTable = cms.Sequence()
 
 process.maxEvents = cms.untracked.PSet(
-    input = cms.untracked.int32(-1),
+    input = cms.untracked.int32(options.maxEvents),
     output = cms.optional.untracked.allowed(cms.int32,cms.PSet)
 )
-process.options.numberOfThreads=cms.untracked.uint32(options.nThreads)
 
 # Input source
 process.source = cms.Source("PoolSource",
@@ -78,6 +84,7 @@ process.options = cms.untracked.PSet(
     throwIfIllegalParameter = cms.untracked.bool(True),
     wantSummary = cms.untracked.bool(False)
 )
+threading = common.threading_from_options(process, options)
 
 # Production Info
 process.configurationMetadata = cms.untracked.PSet(
@@ -87,8 +94,11 @@ process.configurationMetadata = cms.untracked.PSet(
 )
 
 # Output definition
-output_file = f'file:{common.guntype(options.inputFiles[0])}_nanoml_D86_fine_n{2}_{strftime("%b%d")}.root'
-if not options.merge: output_file = output_file.replace('.root', '_notmerged.root')
+if options.out:
+    output_file = options.out if options.out.startswith('file:') else 'file:' + options.out
+else:
+    output_file = f'file:{common.guntype(options.inputFiles[0])}_nanoml_D86_fine_n{2}_{strftime("%b%d")}.root'
+    if not options.merge: output_file = output_file.replace('.root', '_notmerged.root')
 common.logger.info('Output: %s', output_file)
 
 process.NANOAODSIMoutput = cms.OutputModule("NanoAODOutputModule",
@@ -103,6 +113,7 @@ process.NANOAODSIMoutput = cms.OutputModule("NanoAODOutputModule",
 )
 
 process.NANOAODSIMoutput.outputCommands.remove("keep edmTriggerResults_*_*_*")
+common.set_compression(process.NANOAODSIMoutput, options.compression)
 
 # Additional output definition
 
@@ -142,3 +153,6 @@ else:
 from Configuration.StandardSequences.earlyDeleteSettings_cff import customiseEarlyDelete
 process = customiseEarlyDelete(process)
 # End adding early deletion
+
+# Check that no customisation overrode the threads and streams
+common.check_threading(process, threading)
@@ -0,0 +1,244 @@
+"""
+Offline catalog of local minbias files for pileup mixing.
+
+A catalog is a directory of EDM files plus an index `catalog.json` with
+the size, number of events and adler32 checksum of every file. Step
+scripts accept a catalog wherever they take pileup files, as
+`catalog:<directory>`, so mixing needs no DAS query and no remote reads:
+
+    python pileup_catalog.py build /data/minbias_D86
+    cmsRun digi_D86_proc.py inputFiles=file:muon.root pu=catalog:/data/minbias_D86
+
+With `scratch=<dir>` (or $PU_SCRATCH), the files are first copied to
+node-local scratch, verified against the index, and mixed from there.
+Every file is copied under a lock and stamped once verified; verified
+copies are reused, so concurrent jobs on a node share one staged copy.
+"""
+from __future__ import print_function
+
+import os, os.path as osp
+import json
+import shutil
+import zlib
+import fcntl
+import hashlib
+from collections import OrderedDict
+
+import common
+
+INDEX = 'catalog.json'
+PREFIX = 'catalog:'
+
+
+def adler32(path, chunk_size=4*1024**2):
+    """
+    adler32 of the file as an 8 character hex string, as DAS and the CMS
+    data management tools report it.
+    """
+    value = 1
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            value = zlib.adler32(chunk, value)
+    return '{:08x}'.format(value & 0xffffffff)
+
+
+def count_events(path):
+    import rootio
+    with rootio.open_root(path) as f:
+        tree = f.Get('Events')
+        if not tree: raise Exception('No Events tree in {}'.format(path))
+        return int(tree.GetEntries())
+
+
+class Catalog(object):
+    """
+    The index of a catalog directory: an ordered dict of file name ->
+    dict(size, mtime, n_events, adler32).
+    """
+    def __init__(self, directory):
+        self.directory = osp.abspath(directory)
+        self.files = OrderedDict()
+
+    @property
+    def index_path(self):
+        return osp.join(self.directory, INDEX)
+
+    @property
+    def n_events(self):
+        return sum(entry['n_events'] for entry in self.files.values())
+
+    def paths(self):
+        return [osp.join(self.directory, name) for name in self.files]
+
+    @classmethod
+    def load(cls, directory):
+        catalog = cls(directory)
+        if not osp.isfile(catalog.index_path):
+            raise Exception(
+                'No pileup catalog in {0}; run `python pileup_catalog.py build {0}`'
+                .format(catalog.directory)
+                )
+        with open(catalog.index_path, 'r') as f:
+            catalog.files = json.load(f, object_pairs_hook=OrderedDict)
+        return catalog
+
+    def save(self):
+        tmp = '{}.tmp{}'.format(self.index_path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(self.files, f, indent=2)
+        os.replace(tmp, self.index_path)
+
+    def build(self, update=True):
+        """
+        Indexes all .root files in the directory. With `update`, files
+        whose size and mtime did not change since the existing index keep
+        their entry and are not read again.
+        """
+        old = Catalog.load(self.directory).files if update and osp.isfile(self.index_path) else {}
+        self.files = OrderedDict()
+        for name in sorted(os.listdir(self.directory)):
+            path = osp.join(self.directory, name)
+            if not name.endswith('.root') or not osp.isfile(path): continue
+            stat = os.stat(path)
+            entry = old.get(name)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                common.logger.info('Indexing %s', path)
+                entry = dict(
+                    size = stat.st_size, mtime = stat.st_mtime,
+                    n_events = count_events(path), adler32 = adler32(path),
+                    )
+            self.files[name] = entry
+        self.save()
+        common.logger.info('Catalog %s: %s files, %s events', self.directory, len(self.files), self.n_events)
+        return self
+
+    def verify(self):
+        """
+        Returns the names of files that are missing or whose checksum does
+        not match the index.
+        """
+        bad = []
+        for name, entry in self.files.items():
+            path = osp.join(self.directory, name)
+            if not osp.isfile(path) or osp.getsize(path) != entry['size'] or adler32(path) != entry['adler32']:
+                common.logger.error('Bad catalog file %s', path)
+                bad.append(name)
+        return bad
+
+    def stage(self, scratch):
+        """
+        Copies all files to `scratch`, and returns the paths of the copies.
+        Every copy is written to a temporary name, verified against the
+        index and only then renamed, next to a `.adler32` stamp with the
+        verified checksum. Copies are made under a per-file lock, so
+        concurrent jobs wait for one copy instead of all copying; a copy
+        is reused only if its stamp and size match the index.
+        """
+        os.makedirs(scratch, exist_ok=True)
+        staged = []
+        for name, entry in self.files.items():
+            dst = osp.join(scratch, name)
+            with open(dst + '.lock', 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    if not is_staged(dst, entry): self._stage_file(name, entry, dst)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+            staged.append(dst)
+        return staged
+
+    def _stage_file(self, name, entry, dst):
+        common.logger.info('Staging %s to %s', name, osp.dirname(dst))
+        tmp = '{}.tmp{}'.format(dst, os.getpid())
+        try:
+            shutil.copyfile(osp.join(self.directory, name), tmp)
+            if adler32(tmp) != entry['adler32']:
+                raise Exception('Checksum mismatch staging {} to {}'.format(name, osp.dirname(dst)))
+            if osp.isfile(dst + '.adler32'): os.remove(dst + '.adler32')
+            os.replace(tmp, dst)
+            with open(dst + '.adler32', 'w') as f: f.write(entry['adler32'])
+        finally:
+            if osp.isfile(tmp): os.remove(tmp)
+
+
+def is_staged(path, entry):
+    """
+    Whether `path` is a verified copy of the catalog `entry`: it has the
+    size of the entry, and a stamp with the checksum of the entry.
+    """
+    try:
+        with open(path + '.adler32', 'r') as f:
+            stamp = f.read().strip()
+        return stamp == entry['adler32'] and osp.getsize(path) == entry['size']
+    except (IOError, OSError):
+        return False
+
+
+def scratch_dir(scratch, directory):
+    """
+    Directory of a catalog in `scratch`; keyed by a hash of the catalog
+    path, so catalogs whose directories share a name do not collide.
+    """
+    directory = osp.abspath(directory)
+    key = hashlib.sha256(directory.encode()).hexdigest()[:12]
+    return osp.join(scratch, '{}_{}'.format(osp.basename(directory), key))
+
+
+def default_scratch():
+    return os.environ.get('PU_SCRATCH', '')
+
+
+def add_options(options):
+    """
+    Registers the `scratch` option of `resolve` on a VarParsing object
+    """
+    from FWCore.ParameterSet.VarParsing import VarParsing
+    options.register(
+        'scratch', default_scratch(), VarParsing.multiplicity.singleton, VarParsing.varType.string,
+        'Node-local directory to stage pileup catalogs to (default: $PU_SCRATCH; empty: read in place)'
+        )
+
+
+def resolve(pu_files, scratch=None):
+    """
+    Expands `catalog:<directory>` entries of a list of pileup files into
+    the `file:` paths of the catalog files; with `scratch`, the catalog
+    files are staged there first. Other entries are passed through.
+    """
+    if scratch is None: scratch = default_scratch()
+    out = []
+    for pu in pu_files:
+        if not pu.startswith(PREFIX):
+            out.append(pu)
+            continue
+        catalog = Catalog.load(pu[len(PREFIX):])
+        paths = catalog.stage(scratch_dir(scratch, catalog.directory)) if scratch else catalog.paths()
+        common.logger.info(
+            'Pileup from catalog %s: %s files, %s events%s',
+            catalog.directory, len(paths), catalog.n_events, ', staged in ' + scratch if scratch else ''
+            )
+        out.extend('file:' + path for path in paths)
+    return out
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('action', type=str, choices=['build', 'show', 'verify', 'stage'])
+    parser.add_argument('directory', type=str)
+    parser.add_argument('scratch', type=str, nargs='?', default=None, help='Scratch directory for stage (as scratch= of the jobs)')
+    parser.add_argument('--rebuild', action='store_true', help='Index all files again with build')
+    args = parser.parse_args()
+    if args.action == 'build':
+        catalog = Catalog(args.directory).build(update=not args.rebuild)
+    else:
+        catalog = Catalog.load(args.directory)
+    if args.action == 'verify':
+        bad = catalog.verify()
+        if bad: raise Exception('{} bad files: {}'.format(len(bad), ', '.join(bad)))
+    elif args.action == 'stage':
+        if not args.scratch: raise Exception('stage needs a scratch directory')
+        catalog.stage(scratch_dir(args.scratch, catalog.directory))
+    for name, entry in catalog.files.items():
+        print('{:<60} {:>8} {:>12} {}'.format(name, entry['n_events'], entry['size'], entry['adler32']))
+    print('{} files, {} events'.format(len(catalog.files), catalog.n_events))
@@ -0,0 +1,320 @@
+"""
+Make-style runner for the GEN-SIM -> DIGI -> RECO -> NANO chain.
+
+Every step is a cmsRun job of one of the step scripts. A step is
+fingerprinted from its config (the script and the python modules it
+imports from this repository), its arguments, its seed and the
+fingerprints or contents of its inputs. A step only reruns if its output
+is missing or its stored fingerprint differs; steps that do not depend on
+each other run concurrently.
+
+A step can be sharded: its events are split over several cmsRun jobs with
+their own seeds and luminosity blocks (see `common.shard`), which run on a
+local pool and are merged into the step output with merge_cfg.py.
+
+    python pipeline.py --thing muon -n 10 --npu 1000 --shards 64 -j 64
+
+With --premix, the pileup is premixed once into a library that the DIGI
+of every signal sample reuses:
+
+    python pipeline.py --thing muon -n 100 --npu 1000 --premix 100 --shards 64 -j 64
+    python pipeline.py --thing tau -n 100 --npu 1000 --premix 100 --shards 64 -j 64
+"""
+from __future__ import print_function
+
+import os, os.path as osp
+import hashlib, json
+import asyncio
+from collections import OrderedDict
+
+import common
+import pileup_catalog
+
+THIS_DIR = osp.dirname(osp.abspath(__file__))
+
+# Modules from this repository that every step script imports
+CONFIG_DEPENDENCIES = ['common.py', 'drivers.py', 'pileup_catalog.py']
+
+
+def sha256_file(path, chunk_size=1024**2):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Step(object):
+    """
+    One cmsRun job. `inputs` and `pu` are lists of other Steps or of paths
+    to existing files; they are passed as `inputFiles` and `pu`. `pu` may
+    also hold pileup catalogs as `catalog:<directory>`.
+    """
+    def __init__(self, name, script, args=None, inputs=None, pu=None, seed=None, n_shards=1):
+        self.name = name
+        self.script = script
+        self.args = args or {}
+        self.inputs = inputs or []
+        self.pu = pu or []
+        self.seed = seed
+        self.n_shards = n_shards
+        self.output = None
+
+    def __repr__(self):
+        return '<Step {} {}>'.format(self.name, self.script)
+
+    @property
+    def deps(self):
+        return [i for i in self.inputs + self.pu if isinstance(i, Step)]
+
+    @staticmethod
+    def _path(i):
+        return i.output if isinstance(i, Step) else osp.abspath(common.strip_file_prefix(i))
+
+    @staticmethod
+    def _is_catalog(i):
+        return not isinstance(i, Step) and i.startswith(pileup_catalog.PREFIX)
+
+    def _pu_arg(self, i):
+        if self._is_catalog(i): return pileup_catalog.PREFIX + osp.abspath(i[len(pileup_catalog.PREFIX):])
+        return 'file:' + self._path(i)
+
+    def cmd(self, shard=None, output=None):
+        cmd = ['cmsRun', osp.join(THIS_DIR, self.script)]
+        for key, value in self.args.items():
+            cmd.append('{}={}'.format(key, value))
+        if self.seed is not None: cmd.append('seed={}'.format(self.seed))
+        if self.inputs:
+            cmd.append('inputFiles=' + ','.join('file:' + self._path(i) for i in self.inputs))
+        if self.pu:
+            cmd.append('pu=' + ','.join(self._pu_arg(i) for i in self.pu))
+        if shard is not None:
+            cmd.extend(['shard={}'.format(shard), 'nShards={}'.format(self.n_shards)])
+        cmd.append('out=file:' + (self.output if output is None else output))
+        return cmd
+
+    def fingerprint(self):
+        """
+        Hash of everything that determines the output of this step. Upstream
+        steps contribute their fingerprint, external files their content,
+        pileup catalogs their index.
+        """
+        def input_hash(i):
+            if self._is_catalog(i):
+                return sha256_file(pileup_catalog.Catalog(i[len(pileup_catalog.PREFIX):]).index_path)
+            return i.fingerprint() if isinstance(i, Step) else common.file_digest(self._path(i))
+        return hashlib.sha256(json.dumps({
+            'config' : [sha256_file(osp.join(THIS_DIR, f)) for f in [self.script] + CONFIG_DEPENDENCIES],
+            'args' : sorted((k, str(v)) for k, v in self.args.items()),
+            'seed' : self.seed,
+            'n_shards' : self.n_shards,
+            'inputs' : [input_hash(i) for i in self.inputs],
+            'pu' : [input_hash(i) for i in self.pu],
+            }).encode()).hexdigest()
+
+    @property
+    def fingerprint_file(self):
+        return self.output + '.fingerprint'
+
+    def is_stale(self):
+        if not osp.isfile(self.output) or not osp.isfile(self.fingerprint_file):
+            return True
+        with open(self.fingerprint_file, 'r') as f:
+            return f.read().strip() != self.fingerprint()
+
+
+class Pipeline(object):
+    """
+    Every step runs in its own directory `<work_dir>/<step name>`, so that
+    side outputs of concurrent cmsRun jobs do not clash. All cmsRun jobs,
+    including the shards of sharded steps, share one common.Executor.
+    """
+    def __init__(self, steps, work_dir='pipeline'):
+        self.steps = steps
+        self.work_dir = osp.abspath(work_dir)
+        for step in self.steps:
+            step.output = osp.join(self.work_dir, step.name + '.root')
+
+    def sorted_steps(self):
+        """
+        Returns the steps in topological order.
+        """
+        ordered = []
+        def visit(step, path=()):
+            if step in ordered: return
+            if step in path: raise Exception('Cyclic dependency at step %s' % step.name)
+            for dep in step.deps: visit(dep, path + (step,))
+            ordered.append(step)
+        for step in self.steps: visit(step)
+        return ordered
+
+    async def run_step(self, executor, step, force=False):
+        if not(force or step.is_stale()):
+            common.logger.info('%s is up to date: %s', step, step.output)
+            return False
+        common.logger.info('Running %s', step)
+        fingerprint = step.fingerprint()
+        if osp.isfile(step.fingerprint_file): os.remove(step.fingerprint_file)
+        step_dir = osp.join(self.work_dir, step.name)
+        os.makedirs(step_dir, exist_ok=True)
+        if step.n_shards > 1:
+            await self.run_shards(executor, step, step_dir)
+        else:
+            job = common.Job(step.cmd(), cwd=step_dir, log=osp.join(self.work_dir, step.name + '.log'), name=step.name)
+            await self.run_jobs(executor, [job])
+        if executor.dry: return True
+        with open(step.fingerprint_file, 'w') as f:
+            f.write(fingerprint + '\n')
+        return True
+
+    @staticmethod
+    async def run_jobs(executor, jobs):
+        for job in await asyncio.gather(*(executor.run_job(job) for job in jobs)):
+            if job.returncode != 0:
+                raise Exception('Status {}! Command: {}'.format(job.returncode, ' '.join(job.cmd)))
+
+    async def run_shards(self, executor, step, step_dir):
+        """
+        Runs the shards of `step` concurrently, and merges them into the
+        step output. Every shard and the merge write a log in `step_dir`.
+        """
+        common.logger.info('Running %s in %s shards', step, step.n_shards)
+        shard_outputs = []
+        jobs = []
+        for i in range(step.n_shards):
+            shard_dir = osp.join(step_dir, 'shard{}'.format(i))
+            os.makedirs(shard_dir, exist_ok=True)
+            shard_outputs.append(osp.join(shard_dir, 'output.root'))
+            jobs.append(common.Job(
+                step.cmd(shard=i, output=shard_outputs[-1]),
+                cwd=shard_dir, log=osp.join(step_dir, 'shard{}.log'.format(i)),
+                name='{}/shard{}'.format(step.name, i)
+                ))
+        await self.run_jobs(executor, jobs)
+        merge = common.Job(
+            [
+                'cmsRun', osp.join(THIS_DIR, 'merge_cfg.py'),
+                'inputFiles=' + ','.join('file:' + f for f in shard_outputs),
+                'out=file:' + step.output,
+                ],
+            cwd=step_dir, log=osp.join(step_dir, 'merge.log'), name=step.name + '/merge'
+            )
+        await self.run_jobs(executor, [merge])
+        if not executor.dry:
+            for f in shard_outputs: os.remove(f)
+
+    async def run_async(self, executor, force=()):
+        os.makedirs(self.work_dir, exist_ok=True)
+        tasks = OrderedDict()
+        async def run(step):
+            reran_deps = await asyncio.gather(*(tasks[dep] for dep in step.deps))
+            return await self.run_step(executor, step, force=(step.name in force or any(reran_deps)))
+        for step in self.sorted_steps():
+            tasks[step] = asyncio.ensure_future(run(step))
+        try:
+            reran = await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values(): task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        return OrderedDict((step.name, r) for step, r in zip(tasks, reran))
+
+    def run(self, n_workers=None, dry=False, force=()):
+        """
+        Runs all stale steps, with at most `n_workers` cmsRun jobs at a time.
+        A failing job cancels everything that is still running.
+        The resources used by every job are appended to
+        `<work_dir>/resources.jsonl`, and summarized at the end.
+        Returns a dict of step name -> whether the step was (re)run.
+        """
+        os.makedirs(self.work_dir, exist_ok=True)
+        executor = common.Executor(
+            max_jobs=n_workers, dry=dry, resource_log=osp.join(self.work_dir, 'resources.jsonl')
+            )
+        try:
+            return asyncio.run(self.run_async(executor, force=force))
+        finally:
+            executor.shutdown()
+            if executor.finished:
+                common.logger.info('Resource usage:\n%s', common.format_resources(executor.finished))
+
+
+def default_pipeline(
+    thing='muon', n_events=1, n_pu_events=10, seed=1, work_dir='pipeline', n_shards=1,
+    n_premix_events=None, average_pu=4., pu_catalog=None
+    ):
+    """
+    Minbias pileup sample and signal gun sample (independent), followed by
+    DIGI, RECO and NANO of the signal with the minbias sample as pileup.
+    All steps except NANO are split in `n_shards` shards (at most one shard
+    per event).
+
+    With `n_premix_events`, the minbias sample is first premixed into a
+    library of that many events with `average_pu` (see premix_D86_proc.py),
+    and DIGI overlays the library instead of mixing the minbias sample.
+    The library step does not depend on `thing`, so signal samples of
+    different things in the same `work_dir` share it.
+
+    With `pu_catalog` (a directory, see pileup_catalog.py), the pileup
+    comes from that catalog instead of a generated minbias sample.
+    """
+    minbias = Step(
+        'minbias_gensim_n{}'.format(n_pu_events), 'gensim_D86_proc.py',
+        args=dict(thing='minbias', n=n_pu_events), seed=seed,
+        n_shards=min(n_shards, n_pu_events)
+        )
+    signal = Step(
+        '{}_gensim_n{}'.format(thing, n_events), 'gensim_D86_proc.py',
+        args=dict(thing=thing, n=n_events), seed=seed,
+        n_shards=min(n_shards, n_events)
+        )
+    if pu_catalog:
+        minbias = pileup_catalog.PREFIX + pu_catalog
+        steps = [signal]
+    else:
+        steps = [minbias, signal]
+    if n_premix_events:
+        library = Step(
+            'premix_pu{}_n{}'.format(average_pu, n_premix_events), 'premix_D86_proc.py',
+            args=dict(n=n_premix_events, avgPU=average_pu), pu=[minbias], seed=seed,
+            n_shards=min(n_shards, n_premix_events)
+            )
+        steps.append(library)
+        digi_pu, reco_pu, premix_args = [library], [], dict(premix=True)
+    else:
+        digi_pu, reco_pu, premix_args = [minbias], [minbias], {}
+    digi = Step(
+        '{}_digi_n{}'.format(thing, n_events), 'digi_D86_proc.py',
+        args=dict(n=n_events, **premix_args), inputs=[signal], pu=digi_pu, seed=seed,
+        n_shards=min(n_shards, n_events)
+        )
+    reco = Step(
+        '{}_reco_n{}'.format(thing, n_events), 'reco_D86_proc.py',
+        args=dict(n=n_events, **premix_args), inputs=[digi], pu=reco_pu, seed=seed,
+        n_shards=min(n_shards, n_events)
+        )
+    nano = Step('{}_nanoml_n{}'.format(thing, n_events), 'nanoML_cfg.py', inputs=[reco])
+    return Pipeline(steps + [digi, reco, nano], work_dir=work_dir)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--thing', type=str, default='muon', choices=['muon', 'tau'])
+    parser.add_argument('-n', '--nevents', type=int, default=1)
+    parser.add_argument('--npu', type=int, default=10, help='Number of minbias events for pileup')
+    parser.add_argument('--pu-catalog', type=str, default=None, help='Take the pileup from this catalog instead of generating --npu minbias events')
+    parser.add_argument('--premix', type=int, default=None, help='Premix the pileup into a library of this many events first')
+    parser.add_argument('--avg-pu', type=float, default=4., help='Average pileup of the premixed library')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Max number of concurrent cmsRun jobs (default: number of cores)')
+    parser.add_argument('--shards', type=int, default=1, help='Number of shards per step')
+    parser.add_argument('-d', '--work-dir', type=str, default='pipeline')
+    parser.add_argument('--force', type=str, nargs='*', default=[], help='Names of steps to rerun')
+    parser.add_argument('--dry', action='store_true')
+    args = parser.parse_args()
+    pipeline = default_pipeline(
+        args.thing, args.nevents, args.npu, args.seed, args.work_dir,
+        n_shards=args.shards, n_premix_events=args.premix, average_pu=args.avg_pu,
+        pu_catalog=args.pu_catalog
+        )
+    pipeline.run(n_workers=args.jobs, dry=args.dry, force=args.force)
@@ -0,0 +1,73 @@
+"""
+Builds a premixed pileup library: every event is a full bunch-crossing
+train of minbias pileup (around a neutrino gun, i.e. no signal), already
+digitized. Signal DIGI then overlays one library event per signal event
+(digi_D86_proc.py premix=True) instead of mixing and digitizing the
+minbias events again, so one library serves any number of signal samples:
+
+    cmsRun premix_D86_proc.py pu=file:minbias_gensim.root n=100 avgPU=4 out=file:premix.root
+    cmsRun digi_D86_proc.py inputFiles=file:muon_gensim.root pu=file:premix.root premix=True
+    cmsRun reco_D86_proc.py inputFiles=file:muon_digi.root premix=True
+
+Library events are drawn at random for every signal event, so the library
+should have at least as many events as the signal samples to avoid reuse.
+"""
+from __future__ import print_function
+from time import strftime
+
+import common
+import pileup_catalog
+import drivers
+
+import FWCore.ParameterSet.Config as cms
+
+
+def premix(pu_rootfiles, n_events=1, average_pu=4., min_bunch=-12, max_bunch=3, output_file=None, seed=1):
+    premix_driver = drivers.premix_stage1_d86_driver()
+    common.logger.info('pu_rootfiles: %s', pu_rootfiles)
+
+    process = common.load_process_from_driver(premix_driver, 'premix_driver.py')
+    common.rng(process, seed)
+    process.maxEvents.input = cms.untracked.int32(n_events)
+    process.source.firstLuminosityBlock = cms.untracked.uint32(1)
+    process.mix.input.fileNames = cms.untracked.vstring(pu_rootfiles)
+    process.mix.input.nbPileupEvents.averageNumber = cms.double(average_pu)
+    process.mix.minBunch = cms.int32(min_bunch)
+    process.mix.maxBunch = cms.int32(max_bunch)
+    common.logger.info(
+        'Premixing <PU>=%s in bunches %s to %s from %s files',
+        average_pu, min_bunch, max_bunch, len(pu_rootfiles)
+        )
+
+    if not output_file:
+        output_file = 'file:premix_D86_pu{}_n{}_{}.root'.format(average_pu, n_events, strftime('%b%d'))
+    elif not output_file.startswith('file:'):
+        output_file = 'file:' + output_file
+    common.logger.info('Output: %s', output_file)
+    process.PREMIXoutput.fileName = cms.untracked.string(output_file)
+    return process
+
+
+from FWCore.ParameterSet.VarParsing import VarParsing
+options = VarParsing('analysis')
+options.register('pu', '', VarParsing.multiplicity.list, VarParsing.varType.string, 'List of minbias GEN-SIM rootfiles or catalog:<directory> (see pileup_catalog.py)')
+options.register('n', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Number of premixed events')
+options.register('avgPU', 4., VarParsing.multiplicity.singleton, VarParsing.varType.float, 'Average number of pileup interactions per bunch crossing')
+options.register('minBunch', -12, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'First bunch crossing to mix')
+options.register('maxBunch', 3, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Last bunch crossing to mix')
+options.register('out', '', VarParsing.multiplicity.singleton, VarParsing.varType.string, 'Output file (default: dated name)')
+options.register('seed', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Random seed')
+options.register('shard', 0, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Index of this shard')
+options.register('nShards', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Number of shards the n events are split over')
+pileup_catalog.add_options(options)
+common.add_threading_options(options)
+options.parseArguments()
+process = premix(
+    pileup_catalog.resolve(options.pu, options.scratch), n_events=options.n, average_pu=options.avgPU,
+    min_bunch=options.minBunch, max_bunch=options.maxBunch,
+    output_file=options.out, seed=options.seed
+    )
+threading = common.threading_from_options(process, options)
+if options.nShards > 1: common.shard(process, options.shard, options.nShards, options.n, options.seed)
+common.logger.info('Created process %s', process)
+common.check_threading(process, threading)
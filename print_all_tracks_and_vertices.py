@@ -1,113 +1,78 @@
 from __future__ import print_function
+import sys
 import numpy as np
-from contextlib import contextmanager
+from collections import Counter
 
 import ROOT
 from DataFormats.FWLite import Events, Handle
 
-@contextmanager
-def open_root(rootfile, mode='read'):
-    try:
-        tfile = ROOT.TFile.Open(rootfile, mode)
-        yield tfile
-    finally:
-        tfile.Close()
+import columns
+import column_cache
+import event_index
+import fanout
+import simtree
 
 
-class Track:
-    def __init__(self, track):
-        self.track = track
-        self.parent = None
-        self.children = []
+def build_tree(tracks, vertices, parent=None):
+    """
+    AllSimTracks come from all events in the crossing frame, so parents are
+    resolved per event. If the producer also wrote the hierarchy columns,
+    `parent` has the parent position of every track, and nothing needs to
+    be resolved.
+    """
+    if parent is not None: return simtree.SimTrackTree(parent)
+    return simtree.SimTrackTree.from_columns(tracks, vertices, use_event_ids=True)
 
-    @property
-    def id(self):
-        return self.track.trackId()
 
-    def add_child(self, child):
-        self.children.append(child)
-        child.parent = self
-    
-    def add_parent(self, parent):
-        parent.add_child(self)
+EXTRACTORS = {
+    'tracks' : ('SimTracks_AllSimTracksAndVerticesProducer_AllSimTracks_RECO', columns.simtracks),
+    'vertices' : ('SimVertexs_AllSimTracksAndVerticesProducer_AllSimVertices_RECO', columns.simvertices),
+    # Position of the parent of every track (-1: none); only in files made
+    # after the producer wrote the hierarchy columns
+    'parent' : ('ints_AllSimTracksAndVerticesProducer_AllSimTracksParentIndex_RECO', columns.ints),
+    }
 
-    @property
-    def is_root(self):
-        return self.parent is None
 
-    def __repr__(self):
-        t = self.track
-        mom = t.momentum()
-        return (
-            '<trackid={trackid:6d}'
-            ' pdgid={pdgid:<5d}'
-            ' E={e:{ff}}'
-            ' pt={pt:{ff}}'
-            ' eta={eta:{ff}}'
-            ' phi={phi:{ff}}'
-            ' crossed_b={crossed_boundary}'
-            '>'
-            .format(
-                trackid = t.trackId(),
-                pdgid = t.type(),
-                e=mom.E(),
-                pt=mom.Pt(),
-                eta=mom.Eta(),
-                phi=mom.Phi(),
-                crossed_boundary = int(t.crossedBoundary()),
-                ff='<7.2f'
-                )
-            )
+def print_tracks_and_vertices(rootfile, n, order='pre', cache=False, entries=None, summary_only=False):
+    """
+    Prints the tree of all simtracks per event. Returns summed counts over
+    the events.
+    """
+    summary = Counter()
+    events = column_cache.iter_events(
+        rootfile, EXTRACTORS, n=n, cache=cache, entries=entries, optional=['parent']
+        )
+    for i, (entry, event) in enumerate(events, 1):
+        tracks = event['tracks']
+        vertices = event['vertices']
+        summary['events'] += 1
+        summary['tracks'] += len(tracks['track_id'])
+        summary['vertices'] += len(vertices['vertex_id'])
+        if summary_only: continue
 
+        print(f'{rootfile}: event {i} (entry {entry})')
 
-def dfs(track, depth=0):
-    yield track, depth
-    for child in track.children:
-        for _ in dfs(child, depth+1):
-            yield _
+        print(f'Found {len(tracks["track_id"])} tracks and {len(vertices["vertex_id"])} vertices')
 
-def repr_dfs(track):
-    s = ''
-    for t, depth in dfs(track):
-        s += depth*'  ' + str(t) + '\n'
-    return s.rstrip()
-
-def build_tree(tracks, vertices):
-    tracks = [Track(t) for t in tracks]
-    track_ids = [t.id for t in tracks]
-    for t in tracks:
-        parent_id = vertices[t.track.vertIndex()].parentIndex()
-        if parent_id != -1:
-            t.add_parent(tracks[track_ids.index(parent_id)])
-    roots = [t for t in tracks if t.is_root]
-    return roots
-
-
-def print_tracks_and_vertices(rootfile, n):
-    with open_root(rootfile) as f:
-        tree = f.Get('Events')
-        i = 0
-        for _ in tree:
-            i += 1
-            print(f'{rootfile}: event {i}')
-
-            tracks = tree.SimTracks_AllSimTracksAndVerticesProducer_AllSimTracks_RECO.product()
-            vertices = tree.SimVertexs_AllSimTracksAndVerticesProducer_AllSimVertices_RECO.product()
-
-            print(f'Found {len(tracks)} tracks and {len(vertices)} vertices')
-
-            roots = build_tree(tracks, vertices)
-
-            for root in roots:
-                print(repr_dfs(root))
+        tracktree = build_tree(tracks, vertices, event['parent']['values'] if 'parent' in event else None)
 
+        sys.stdout.flush()
+        simtree.write_tree(tracktree, columns.simtrack_formatter(tracks), order=order)
+    return summary
 
 
 
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument('rootfile', type=str)
+    parser.add_argument('rootfiles', type=str, nargs='+', help='ROOT files, globs or @filelists')
     parser.add_argument('-n', '--nevents', type=int, default=1)
+    parser.add_argument('--order', type=str, default='pre', choices=['pre', 'post'], help='Print parents before (pre) or after (post) their children')
+    parser.add_argument('--cache', action='store_true', help='Read the columns from (and fill) the sidecar column cache')
+    event_index.add_arguments(parser)
+    fanout.add_arguments(parser)
     args = parser.parse_args()
-    print_tracks_and_vertices(args.rootfile, n=args.nevents)
+    fanout.main(
+        'print_all_tracks_and_vertices', 'print_tracks_and_vertices', args,
+        dict(n=args.nevents, order=args.order, cache=args.cache)
+        )
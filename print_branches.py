@@ -1,12 +1,18 @@
-#!/usr/bin/env python 
+#!/usr/bin/env python
 from __future__ import print_function
 
 """
 Takes a path to a root file, and prints the branches of the
-found TTrees.
+found TTrees, with their size on disk: compressed and uncompressed
+bytes, compression ratio, number of baskets and compressed bytes per
+event. Only the metadata of the file is read, so this is fast for any
+file size.
+
+    python print_branches.py reco.root --sort zip --top 20
+    python print_branches.py reco.root --group-by label --json sizes.json
 """
 
-import sys, os.path as osp, os, argparse
+import sys, os.path as osp, os, argparse, json
 
 try:
     import ROOT
@@ -14,7 +20,100 @@ except ImportError:
     print('ROOT could not be imported')
     sys.exit(1)
 
-def iter_trees_recursively(node, directory=''):
+SORT_KEYS = ['name', 'zip', 'tot', 'ratio', 'baskets', 'per_event']
+GROUP_KEYS = ['branch', 'label', 'type', 'module', 'instance', 'process']
+
+
+def count_baskets(branch):
+    """
+    Number of baskets of the branch and all its sub-branches.
+    """
+    n = branch.GetWriteBasket()
+    sub_branches = branch.GetListOfBranches()
+    for i in range(sub_branches.GetEntries()):
+        n += count_baskets(sub_branches[i])
+    return n
+
+
+def product_label(branch_name):
+    """
+    Splits an EDM branch name `<type>_<module>_<instance>_<process>.` into
+    its parts, plus the product label `<module>:<instance>`; other branches
+    only get a type.
+    """
+    parts = branch_name.rstrip('.').split('_')
+    if len(parts) != 4: return dict(type=branch_name, label='', module='', instance='', process='')
+    label = dict(zip(['type', 'module', 'instance', 'process'], parts))
+    label['label'] = label['module'] + (':' + label['instance'] if label['instance'] else '')
+    return label
+
+
+def branch_row(tree_name, branch, n_entries):
+    zip_bytes = branch.GetZipBytes('*')
+    tot_bytes = branch.GetTotBytes('*')
+    row = dict(
+        tree = tree_name,
+        name = branch.GetName(),
+        zip = zip_bytes,
+        tot = tot_bytes,
+        ratio = tot_bytes / zip_bytes if zip_bytes else 0.,
+        baskets = count_baskets(branch),
+        per_event = zip_bytes / n_entries if n_entries else 0.,
+        )
+    row.update(product_label(row['name']))
+    return row
+
+
+def group_rows(rows, group_by):
+    """
+    Sums the rows per tree and `group_by` part of the product label.
+    """
+    if group_by == 'branch': return rows
+    groups = {}
+    for row in rows:
+        key = (row['tree'], row[group_by] or row['name'])
+        group = groups.setdefault(key, dict(
+            tree=key[0], name=key[1], zip=0, tot=0, baskets=0, per_event=0., n_branches=0
+            ))
+        for field in ['zip', 'tot', 'baskets', 'per_event']:
+            group[field] += row[field]
+        group['n_branches'] += 1
+    for group in groups.values():
+        group['ratio'] = group['tot'] / group['zip'] if group['zip'] else 0.
+    return list(groups.values())
+
+
+def sort_rows(rows, sort_by='name'):
+    if sort_by == 'name': return sorted(rows, key=lambda r: r['name'])
+    return sorted(rows, key=lambda r: r[sort_by], reverse=True)
+
+
+def format_bytes(n):
+    for unit in ['B', 'kB', 'MB', 'GB']:
+        if abs(n) < 1024. or unit == 'GB': break
+        n /= 1024.
+    return '{:.1f} {}'.format(n, unit)
+
+
+def print_rows(rows, indent='', total_zip=None):
+    for row in rows:
+        print(
+            '{indent}  {name:<70} {zip:>10} {tot:>10} {ratio:>6.2f} {baskets:>8} {per_event:>10} {frac:>6.1%}'
+            .format(
+                indent=indent, name=row['name'], zip=format_bytes(row['zip']),
+                tot=format_bytes(row['tot']), ratio=row['ratio'], baskets=row['baskets'],
+                per_event=format_bytes(row['per_event']),
+                frac=row['zip'] / total_zip if total_zip else 0.
+                )
+            )
+
+
+def iter_trees_recursively(node, directory='', sort_by='name', group_by='branch', top=None, quiet=False):
+    """
+    Prints the branches of every TTree below `node`, and returns the rows
+    (one dict per branch, or per group with `group_by`) of all trees.
+    """
+    all_rows = []
     listofkeys = node.GetListOfKeys()
     n_keys = listofkeys.GetEntries()
     for i_key in range(n_keys):
@@ -24,8 +123,11 @@ def iter_trees_recursively(node, directory=''):
         if classname == 'TDirectoryFile':
             dirname = key.GetName()
             lower_node = node.Get(dirname)
-            print('\033[31mTDirectory {0}\033[0m'.format(dirname))
-            iter_trees_recursively(lower_node, directory=dirname)
+            if not quiet: print('\033[31mTDirectory {0}\033[0m'.format(dirname))
+            all_rows.extend(iter_trees_recursively(
+                lower_node, directory=osp.join(directory, dirname),
+                sort_by=sort_by, group_by=group_by, top=top, quiet=quiet
+                ))
             continue
         elif not classname == 'TTree':
             continue
@@ -34,25 +136,38 @@ def iter_trees_recursively(node, directory=''):
         n_entries = tree.GetEntries()
         listofbranches = tree.GetListOfBranches()
         n_branches = listofbranches.GetEntries()
+        tree_path = osp.join(directory, treename)
+        rows = [branch_row(tree_path, listofbranches[i], n_entries) for i in range(n_branches)]
+        rows = sort_rows(group_rows(rows, group_by), sort_by)
+        all_rows.extend(rows)
+        if quiet: continue
         indent = '  ' if directory else ''
+        total_zip = tree.GetZipBytes()
         print(
-            '\033[31m{indent}TTree {0} ({1} entries)\033[0m'
-            .format(treename, n_entries, indent=indent)
+            '\033[31m{indent}TTree {0} ({1} entries, {2} compressed, {3} uncompressed)\033[0m'
+            .format(treename, n_entries, format_bytes(total_zip), format_bytes(tree.GetTotBytes()), indent=indent)
             )
-        for i_branch in range(n_branches):
-            branch = listofbranches[i_branch]
-            print(
-                '{indent}  {branch_name}'
-                .format(indent=indent, branch_name=branch.GetName())
-                )
+        print(
+            '{indent}  {0:<70} {1:>10} {2:>10} {3:>6} {4:>8} {5:>10} {6:>6}'
+            .format('branch' if group_by == 'branch' else group_by, 'zip', 'tot', 'ratio', 'baskets', 'per event', 'frac', indent=indent)
+            )
+        print_rows(rows[:top] if top else rows, indent, total_zip)
+    return all_rows
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('rootfile', type=str, help='Path to a root file')
+    parser.add_argument('--sort', type=str, default='name', choices=SORT_KEYS, help='Sort branches by this column (sizes descending)')
+    parser.add_argument('--group-by', type=str, default='branch', choices=GROUP_KEYS, help='Sum the branches per part of the CMS product label')
+    parser.add_argument('--top', type=int, default=None, help='Only print the first N branches per tree')
+    parser.add_argument('--json', type=str, default=None, help='Write all rows to this JSON file')
     args = parser.parse_args()
     try:
         tfile = ROOT.TFile.Open(args.rootfile)
-        iter_trees_recursively(tfile)
+        rows = iter_trees_recursively(tfile, sort_by=args.sort, group_by=args.group_by, top=args.top)
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(rows, f, indent=2)
     finally:
         # Always try to close
         try:
@@ -61,4 +176,4 @@ def main():
             pass
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
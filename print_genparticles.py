@@ -1,16 +1,10 @@
 from __future__ import print_function
-from contextlib import contextmanager
 
 import ROOT
 from DataFormats.FWLite import Events, Handle
 
-@contextmanager
-def open_root(rootfile, mode='read'):
-    try:
-        tfile = ROOT.TFile.Open(rootfile, mode)
-        yield tfile
-    finally:
-        tfile.Close()
+import rootio
+import event_index
 
 def repr_genparticle(p):
     return (
@@ -26,13 +20,14 @@ def repr_genparticle(p):
             )
         )
 
-def print_gen_particles(rootfile):
-    with open_root(rootfile) as f:
-        t = f.Get('Events')
-
-        for _ in t:
-            genparticles_vector = t.recoGenParticles_genParticles__GEN.product()            
-            for p in genparticles_vector:
+def print_gen_particles(rootfile, n=None, entries=None):
+    branch = 'recoGenParticles_genParticles__GEN'
+    with rootio.open_root(rootfile) as f:
+        tree = f.Get('Events')
+        rootio.prepare_tree(tree, [branch])
+        for event in rootio.iter_events(tree, n=n, entries=entries):
+            print('entry %s' % event.entry)
+            for p in event.product(branch):
                 print(repr_genparticle(p))
 
 
@@ -40,5 +35,10 @@ if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('rootfile', type=str)
+    parser.add_argument('-n', '--nevents', type=int, default=None)
+    event_index.add_arguments(parser)
     args = parser.parse_args()
-    print_gen_particles(args.rootfile)
+    print_gen_particles(
+        args.rootfile, n=args.nevents,
+        entries=event_index.entries_from_args(args.rootfile, args)
+        )
@@ -1,16 +1,14 @@
 from __future__ import print_function
-from contextlib import contextmanager
+from collections import Counter
+import numpy as np
 
 import ROOT
 from DataFormats.FWLite import Events, Handle
 
-@contextmanager
-def open_root(rootfile, mode='read'):
-    try:
-        tfile = ROOT.TFile.Open(rootfile, mode)
-        yield tfile
-    finally:
-        tfile.Close()
+import columns
+import column_cache
+import event_index
+import fanout
 
 def repr_hgcrechit(h):
     s = (
@@ -24,82 +22,180 @@ def repr_hgcrechit(h):
 def hash_hgcrechit(h):
     return hash((h.id().rawId(), h.energy(), h.time()))
 
-def print_reco(rootfile, n=1):
-    with open_root(rootfile) as f:
-        tree = f.Get('Events')
-        i = 0
-        for _ in tree:
-            i += 1
-            print('event %s' % i)
-
-            def get(branch):
-                return [i for i in getattr(tree, branch).product()]
-
-
-            ee_rechits = get('HGCRecHitsSorted_HGCalRecHit_HGCEERecHits_RECO')
-
+def repr_sc(simclusters, i):
+    return (
+        '<SimCluster particleId={} pdgId={:} energy={:.3f} nrechits={}>'
+        .format(
+            simclusters['particle_id'][i], simclusters['pdgid'][i],
+            simclusters['energy'][i], simclusters['n_rechits'][i]
+            )
+        )
 
-            print(f'{len(ee_rechits)} ee rechits')
-            print(f'{len(get("PCaloHits_g4SimHits_HGCHitsEE_SIM"))} ee simhits')
-            print(f'{sum(h.time() >= 0. for h in ee_rechits)} ee hits with t>0')
+# Rechit collections that simcluster hits are matched against
+SUBDETS = ['ee', 'hef', 'heb']
+
+def match_simclusters(simclusters, rechits, subdets=SUBDETS):
+    """
+    Matches the hits of all simclusters to the rechits of all subdetectors
+    at once, on sorted rawId arrays.
+    `rechits` maps subdetector -> `columns.hgcrechits` columns.
+    Returns a dict of arrays:
+    - per hit: `hit_subdet` (index into `subdets`, -1 if unmatched) and
+      `hit_rechit_energy` (0 if unmatched)
+    - per simcluster: `n_hits`, `n_matched`, `n_unmatched`, `sim_energy`,
+      `matched_energy`, `matched_energy_fraction` (of the simhit energy)
+    - per simcluster and subdetector: `n_matched_subdet`, `matched_energy_subdet`
+    """
+    n_clusters = len(simclusters['particle_id'])
+    n_subdets = len(subdets)
+    rechit_ids = np.concatenate([rechits[s]['raw_id'] for s in subdets])
+    rechit_energy = np.concatenate([rechits[s]['energy'] for s in subdets])
+    rechit_subdet = np.concatenate([np.full(len(rechits[s]['raw_id']), i) for i, s in enumerate(subdets)])
+
+    hit_ids = simclusters['hit_id']
+    hit_cluster = simclusters['hit_cluster']
+    hit_energy = simclusters['hit_energy']
+    if len(rechit_ids):
+        order = np.argsort(rechit_ids, kind='stable')
+        sorted_ids = rechit_ids[order]
+        pos = order[np.minimum(np.searchsorted(sorted_ids, hit_ids), len(sorted_ids)-1)]
+        matched = rechit_ids[pos] == hit_ids
+        hit_subdet = np.where(matched, rechit_subdet[pos], -1)
+        hit_rechit_energy = np.where(matched, rechit_energy[pos], 0.)
+    else:
+        matched = np.zeros(len(hit_ids), dtype=bool)
+        hit_subdet = np.full(len(hit_ids), -1)
+        hit_rechit_energy = np.zeros(len(hit_ids))
+
+    def per_cluster(weights=None):
+        return np.bincount(hit_cluster, weights=weights, minlength=n_clusters)
+
+    def per_cluster_subdet(weights):
+        flat = hit_cluster[matched] * n_subdets + hit_subdet[matched]
+        return (
+            np.bincount(flat, weights=weights, minlength=n_clusters*n_subdets)
+            .reshape(n_clusters, n_subdets)
+            )
 
-            # print('CaloParticles:')
-            # for p in get('CaloParticles_mix_MergedCaloTruth_'):
-            #     print('event_id={} trackId={}'.format(p.eventId().rawId(), p.particleId()))
+    n_hits = per_cluster()
+    n_matched = per_cluster(matched.astype(np.float64)).astype(np.int64)
+    sim_energy = per_cluster(hit_energy)
+    matched_energy = per_cluster(np.where(matched, hit_energy, 0.))
+    return dict(
+        hit_subdet = hit_subdet,
+        hit_rechit_energy = hit_rechit_energy,
+        n_hits = n_hits,
+        n_matched = n_matched,
+        n_unmatched = n_hits - n_matched,
+        sim_energy = sim_energy,
+        matched_energy = matched_energy,
+        matched_energy_fraction = np.divide(
+            matched_energy, sim_energy, out=np.zeros(n_clusters), where=sim_energy > 0.
+            ),
+        n_matched_subdet = per_cluster_subdet(None).astype(np.int64),
+        matched_energy_subdet = per_cluster_subdet(hit_energy[matched]),
+        )
 
 
-            def repr_sc(h):
-                s = (
-                    '<SimCluster particleId={} pdgId={:} energy={:.3f} nrechits={}>'
-                    .format(
-                        h.particleId(), h.pdgId(), h.energy(), h.numberOfRecHits()
-                        )
+def print_matching(simclusters, match, subdets=SUBDETS, verbose=False):
+    hit_offsets = np.searchsorted(simclusters['hit_cluster'], np.arange(len(simclusters['particle_id'])+1))
+    hit_ids = simclusters['hit_id'].tolist()
+    hit_energy = simclusters['hit_energy'].tolist()
+    hit_subdet = match['hit_subdet'].tolist()
+    hit_rechit_energy = match['hit_rechit_energy'].tolist()
+    for i_sc in range(len(simclusters['particle_id'])):
+        print(
+            '{} matched={}/{} unmatched={} efrac={:.3f} {}'.format(
+                repr_sc(simclusters, i_sc),
+                match['n_matched'][i_sc], match['n_hits'][i_sc], match['n_unmatched'][i_sc],
+                match['matched_energy_fraction'][i_sc],
+                ' '.join(
+                    '{}={}'.format(s, n) for s, n in zip(subdets, match['n_matched_subdet'][i_sc].tolist())
                     )
-                return s
-
-            hit_set = { h.id().rawId() for h in ee_rechits }
-
-            # Also add the other HGC subsystems
-            for branch in [
-                # 'HGCRecHitsSorted_HGCalRecHit_HGCEERecHits_RECO',
-                'HGCRecHitsSorted_HGCalRecHit_HGCHEBRecHits_RECO',
-                'HGCRecHitsSorted_HGCalRecHit_HGCHEFRecHits_RECO',
-                # 'HGCRecHitsSorted_HGCalRecHit_HGCHFNoseRecHits_RECO',
-                ]:
-                hit_set.update((h.id().rawId() for h in get(branch)))
-
-            print()
-            n_rechits_total = 0
-            n_rechits_found = 0
-            for sc in get('SimClusters_mix_MergedCaloTruth_HLT'):
-                print(repr_sc(sc))
-                n_rechits_total += sc.numberOfRecHits()
-
-                for pair in sc.hits_and_energies():
-                    hit = pair.first
-                    print(f'  {hit=}')
-                    if hit in hit_set:
-                        n_rechits_found += 1
-
-
-            print(f'Counted {n_rechits_total} rechits in all simclusters')
-            print(f'{n_rechits_found}/{n_rechits_total} rechits were found in ee_rechits')
-
-
-
-            print('\nCaloParticles:')
-            for p in get('CaloParticles_mix_MergedCaloTruth_HLT'):
-                print('event_id={} trackId={}'.format(p.eventId().rawId(), p.particleId()))
-
-
-            if i >= n: return
-
+                )
+            )
+        if not verbose: continue
+        for j in range(hit_offsets[i_sc], hit_offsets[i_sc+1]):
+            if hit_subdet[j] < 0:
+                print(f'  hit={hit_ids[j]} e={hit_energy[j]:.4f} unmatched')
+            else:
+                print(f'  hit={hit_ids[j]} e={hit_energy[j]:.4f} {subdets[hit_subdet[j]]} rechit_e={hit_rechit_energy[j]:.4f}')
+
+    n_hits = int(match['n_hits'].sum())
+    n_matched = int(match['n_matched'].sum())
+    print(f'Counted {int(simclusters["n_rechits"].sum())} rechits in all simclusters')
+    print(f'{n_matched}/{n_hits} simcluster hits were found in the rechits, {n_hits-n_matched} unmatched')
+    sim_energy = match['sim_energy'].sum()
+    for i, s in enumerate(subdets):
+        energy = match['matched_energy_subdet'][:, i].sum()
+        print('  {:<4s} matched={:<8d} efrac={:.3f}'.format(
+            s, int(match['n_matched_subdet'][:, i].sum()), energy / sim_energy if sim_energy > 0. else 0.
+            ))
+
+
+EXTRACTORS = {
+    'ee_rechits' : ('HGCRecHitsSorted_HGCalRecHit_HGCEERecHits_RECO', columns.hgcrechits),
+    'heb_rechits' : ('HGCRecHitsSorted_HGCalRecHit_HGCHEBRecHits_RECO', columns.hgcrechits),
+    'hef_rechits' : ('HGCRecHitsSorted_HGCalRecHit_HGCHEFRecHits_RECO', columns.hgcrechits),
+    # 'hfnose_rechits' : ('HGCRecHitsSorted_HGCalRecHit_HGCHFNoseRecHits_RECO', columns.hgcrechits),
+    'ee_simhits' : ('PCaloHits_g4SimHits_HGCHitsEE_SIM', columns.size),
+    'simclusters' : ('SimClusters_mix_MergedCaloTruth_HLT', columns.simclusters),
+    'caloparticles' : ('CaloParticles_mix_MergedCaloTruth_HLT', columns.caloparticles),
+    }
+
+
+def print_reco(rootfile, n=1, cache=False, verbose=False, entries=None, summary_only=False):
+    """
+    Prints rechit counts, the simcluster to rechit matching and the
+    CaloParticles per event. Returns summed counts over the events.
+    """
+    summary = Counter()
+    events = column_cache.iter_events(rootfile, EXTRACTORS, n=n, cache=cache, entries=entries)
+    for i, (entry, event) in enumerate(events, 1):
+        simclusters = event['simclusters']
+        match = match_simclusters(simclusters, {s: event[s + '_rechits'] for s in SUBDETS})
+        summary['events'] += 1
+        summary['simclusters'] += len(simclusters['particle_id'])
+        summary['simcluster_hits'] += int(match['n_hits'].sum())
+        summary['matched_hits'] += int(match['n_matched'].sum())
+        for i_subdet, subdet in enumerate(SUBDETS):
+            summary['rechits_' + subdet] += len(event[subdet + '_rechits']['raw_id'])
+            summary['matched_hits_' + subdet] += int(match['n_matched_subdet'][:, i_subdet].sum())
+        if summary_only: continue
+
+        print('event %s (entry %s)' % (i, entry))
+
+        ee_rechits = event['ee_rechits']
+
+        print(f'{len(ee_rechits["raw_id"])} ee rechits')
+        print(f'{event["ee_simhits"]["size"][0]} ee simhits')
+        print(f'{np.count_nonzero(ee_rechits["time"] >= 0.)} ee hits with t>0')
+
+        # print('CaloParticles:')
+        # for p in get('CaloParticles_mix_MergedCaloTruth_'):
+        #     print('event_id={} trackId={}'.format(p.eventId().rawId(), p.particleId()))
+
+
+        print()
+        print_matching(simclusters, match, verbose=verbose)
+
+
+        print('\nCaloParticles:')
+        for event_id, particle_id in zip(
+            event['caloparticles']['event_id'].tolist(), event['caloparticles']['particle_id'].tolist()
+            ):
+            print('event_id={} trackId={}'.format(event_id, particle_id))
+    return summary
 
 
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument('rootfile', type=str)
+    parser.add_argument('rootfiles', type=str, nargs='+', help='ROOT files, globs or @filelists')
     parser.add_argument('-n', '--nevents', type=int, default=1)
+    parser.add_argument('--cache', action='store_true', help='Read the columns from (and fill) the sidecar column cache')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print every simcluster hit')
+    event_index.add_arguments(parser)
+    fanout.add_arguments(parser)
     args = parser.parse_args()
-    print_reco(args.rootfile, n=args.nevents)
+    fanout.main('print_reco', 'print_reco', args, dict(n=args.nevents, cache=args.cache, verbose=args.verbose))
@@ -1,18 +1,18 @@
 from __future__ import print_function
-from contextlib import contextmanager
+import sys
+from collections import Counter
 from itertools import chain
+import numpy as np
 
 
 import ROOT
 from DataFormats.FWLite import Events, Handle
 
-@contextmanager
-def open_root(rootfile, mode='read'):
-    try:
-        tfile = ROOT.TFile.Open(rootfile, mode)
-        yield tfile
-    finally:
-        tfile.Close()
+import columns
+import column_cache
+import event_index
+import fanout
+import simtree
 
 def repr_genparticle(p):
     return (
@@ -28,121 +28,88 @@ def repr_genparticle(p):
             )
         )
 
-class Track:
-    def __init__(self, track):
-        self.track = track
-        self.parent = None
-        self.children = []
-
-    @property
-    def id(self):
-        return self.track.trackId()
-
-    def add_child(self, child):
-        self.children.append(child)
-        child.parent = self
-    
-    def add_parent(self, parent):
-        parent.add_child(self)
-
-    @property
-    def is_root(self):
-        return self.parent is None
-
-    def __repr__(self):
-        t = self.track
-        mom = t.momentum()
-        return (
-            '<trackid={trackid:6d}'
-            ' pdgid={pdgid:<5d}'
-            ' E={e:{ff}}'
-            ' pt={pt:{ff}}'
-            ' eta={eta:{ff}}'
-            ' phi={phi:{ff}}'
-            ' crossed_b={crossed_boundary}'
-            '>'
-            .format(
-                trackid = t.trackId(),
-                pdgid = t.type(),
-                e=mom.E(),
-                pt=mom.Pt(),
-                eta=mom.Eta(),
-                phi=mom.Phi(),
-                crossed_boundary = int(t.crossedBoundary()),
-                ff='<7.2f'
-                )
-            )
-
-
-def dfs(track, depth=0):
-    yield track, depth
-    for child in track.children:
-        for _ in dfs(child, depth+1):
-            yield _
-
-def print_sim(rootfile, n=1):
-    with open_root(rootfile) as f:
-        tree = f.Get('Events')
-        i = 0
-        for _ in tree:
-            i += 1
-            print('event %s' % i)
-
-            def get(branch):
-                try:
-                    return getattr(tree, branch).product()
-                except AttributeError:
-                    try:
-                        return getattr(tree, branch + 'SIM').product()
-                    except AttributeError:
-                        return getattr(tree, branch + 'HLT').product()
-
-            # genparticles = [i for i in tree.recoGenParticles_genParticles__GEN.product()]
-            simtracks = [Track(i) for i in get('SimTracks_g4SimHits__')]
-            simtrack_ids = [t.id for t in simtracks]
-            simvertices = [i for i in get('SimVertexs_g4SimHits__')]
-
-            hitcount_per_track = {}
-            for t in simtracks:
-                parent_id = simvertices[t.track.vertIndex()].parentIndex()
-                if parent_id != -1:
-                    t.add_parent(simtracks[simtrack_ids.index(parent_id)])
-                hitcount_per_track[t.id] = 0
-
-            roots = [t for t in simtracks if t.is_root]
-
-            for branch in [
-                'PCaloHits_g4SimHits_HGCHitsEE_SIM',
-                'PCaloHits_g4SimHits_HGCHitsHEback_SIM',
-                'PCaloHits_g4SimHits_HGCHitsHEfront_SIM',
-                ]:
-                for hit in get(branch):
-                    trackid = hit.geantTrackId()
-                    hitcount_per_track[trackid] += 1
-
-            for root in roots:
-                for t, depth in dfs(root):
-                    print('  '*depth + f'{t} nhits={hitcount_per_track[t.id]}')
-
-
-            # hits = [h for h in get('PCaloHits_g4SimHits_HGCHitsEE_')]
-            # print('%s hits' % len(hits))
-
-            try:
-                print('\nCaloParticles:')
-                for p in get('CaloParticles_mix_MergedCaloTruth_'):
-                    print('event_id={} trackId={}'.format(p.eventId().rawId(), p.particleId()))
-            except AttributeError:
-                print('Could not print CaloParticles')
-
-            if i >= n: return
+def count_hits_per_track(track_ids, hit_trackids):
+    """
+    Number of hits per track (in the order of `track_ids`), matching
+    the geantTrackId of the hits to the track ids.
+    """
+    if len(track_ids) == 0: return np.zeros(0, dtype=np.int64)
+    order = np.argsort(track_ids)
+    sorted_ids = track_ids[order]
+    pos = np.minimum(np.searchsorted(sorted_ids, hit_trackids), len(track_ids)-1)
+    matched = sorted_ids[pos] == hit_trackids
+    return np.bincount(order[pos[matched]], minlength=len(track_ids))
+
+
+def sim_branch(name):
+    return [name + 'SIM', name + 'HLT']
+
+EXTRACTORS = {
+    'tracks' : (sim_branch('SimTracks_g4SimHits__'), columns.simtracks),
+    'vertices' : (sim_branch('SimVertexs_g4SimHits__'), columns.simvertices),
+    'hits_ee' : ('PCaloHits_g4SimHits_HGCHitsEE_SIM', columns.pcalohits),
+    'hits_heback' : ('PCaloHits_g4SimHits_HGCHitsHEback_SIM', columns.pcalohits),
+    'hits_hefront' : ('PCaloHits_g4SimHits_HGCHitsHEfront_SIM', columns.pcalohits),
+    'caloparticles' : (sim_branch('CaloParticles_mix_MergedCaloTruth_'), columns.caloparticles),
+    }
+
+
+def print_sim(rootfile, n=1, cache=False, entries=None, summary_only=False):
+    """
+    Prints the simtrack tree with hit counts, and the CaloParticles, per
+    event. Returns summed counts over the events.
+    """
+    summary = Counter()
+    events = column_cache.iter_events(
+        rootfile, EXTRACTORS, n=n, cache=cache, optional=['caloparticles'], entries=entries
+        )
+    for i, (entry, event) in enumerate(events, 1):
+        summary['events'] += 1
+
+        # genparticles = [i for i in tree.recoGenParticles_genParticles__GEN.product()]
+        simtracks = event['tracks']
+
+        hit_trackids = np.concatenate([
+            event[key]['geant_track_id'] for key in ['hits_ee', 'hits_heback', 'hits_hefront']
+            ])
+        hitcount_per_track = count_hits_per_track(simtracks['track_id'], hit_trackids)
+        summary['tracks'] += len(simtracks['track_id'])
+        summary['hits'] += len(hit_trackids)
+        summary['hits_on_tracks'] += int(hitcount_per_track.sum())
+        summary['caloparticles'] += len(event['caloparticles']['particle_id']) if 'caloparticles' in event else 0
+        if summary_only: continue
+
+        print('event %s (entry %s)' % (i, entry))
+        tracktree = simtree.SimTrackTree.from_columns(simtracks, event['vertices'])
+        format_simtrack = columns.simtrack_formatter(simtracks)
+        def format_track(j):
+            return f'{format_simtrack(j)} nhits={hitcount_per_track[j]}'
+        sys.stdout.flush()
+        simtree.write_tree(tracktree, format_track)
+
+
+        # hits = [h for h in get('PCaloHits_g4SimHits_HGCHitsEE_')]
+        # print('%s hits' % len(hits))
+
+        if 'caloparticles' in event:
+            print('\nCaloParticles:')
+            for event_id, particle_id in zip(
+                event['caloparticles']['event_id'].tolist(), event['caloparticles']['particle_id'].tolist()
+                ):
+                print('event_id={} trackId={}'.format(event_id, particle_id))
+        else:
+            print('Could not print CaloParticles')
+    return summary
 
 
 
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument('rootfile', type=str)
+    parser.add_argument('rootfiles', type=str, nargs='+', help='ROOT files, globs or @filelists')
     parser.add_argument('-n', '--nevents', type=int, default=1)
+    parser.add_argument('--cache', action='store_true', help='Read the columns from (and fill) the sidecar column cache')
+    event_index.add_arguments(parser)
+    fanout.add_arguments(parser)
     args = parser.parse_args()
-    print_sim(args.rootfile, n=args.nevents)
+    fanout.main('print_sim', 'print_sim', args, dict(n=args.nevents, cache=args.cache))
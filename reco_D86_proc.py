@@ -3,35 +3,34 @@ from pprint import pprint, pformat
 from time import strftime
 
 import common
+import pileup_catalog
+import drivers
 
 import FWCore.ParameterSet.Config as cms
 
 
-def reco(input_rootfiles, pu_rootfiles=None, n_events=1):
-    reco_driver = common.CMSDriver('reco', '--no_exec')
-    reco_driver.kwargs.update({
-        '-s'             : 'RAW2DIGI,L1Reco,RECO,RECOSIM,PAT,VALIDATION:@phase2Validation+@miniAODValidation,DQM:@phase2+@miniAODDQM',
-        '--conditions'   : 'auto:phase2_realistic_T21',
-        '--datatier'     : 'GEN-SIM-RECO,MINIAODSIM,DQMIO',
-        '-n'             : '10',
-        '--eventcontent' : 'FEVTDEBUGHLT,MINIAODSIM,DQM',
-        '--geometry'     : 'Extended2026D86',
-        '--era'          : 'Phase2C11I13M9',
-        '--pileup'       : 'AVE_200_BX_25ns',
-        '--pileup_input' : 'das:/RelValMinBias_14TeV/1/GEN-SIM',
-        })
+def reco(input_rootfiles, pu_rootfiles=None, n_events=1, output_file=None, seed=1, premix=False):
+    """
+    With `premix`, the input was digitized with a premixed pileup library
+    (digi_D86_proc.py premix=True), and `pu_rootfiles` are not used.
+    """
+    reco_driver = drivers.reco_d86_premix_driver() if premix else drivers.reco_d86_driver()
     common.logger.info('input_rootfiles: %s', input_rootfiles)
     common.logger.info('pu_rootfiles: %s', pu_rootfiles)
 
-    process = common.load_process_from_driver(reco_driver, 'reco_driver.py')
-    common.rng(process, 1)
+    process = common.load_process_from_driver(reco_driver, 'reco_premix_driver.py' if premix else 'reco_driver.py')
+    common.rng(process, seed)
     process.source.fileNames = cms.untracked.vstring(input_rootfiles)
     process.maxEvents.input = cms.untracked.int32(n_events)
     process.source.firstLuminosityBlock = cms.untracked.uint32(1)
-    process.mix.input.fileNames = cms.untracked.vstring(pu_rootfiles)
-    process.mix.input.nbPileupEvents.averageNumber = cms.double(4.)
-
-    output_file = 'file:{}_reco_D86_fine_n{}_{}.root'.format(common.guntype(input_rootfiles[0]), n_events, strftime('%b%d'))
+    if not premix:
+        process.mix.input.fileNames = cms.untracked.vstring(pu_rootfiles)
+        process.mix.input.nbPileupEvents.averageNumber = cms.double(4.)
+
+    if not output_file:
+        output_file = 'file:{}_reco_D86_fine_n{}_{}.root'.format(common.guntype(input_rootfiles[0]), n_events, strftime('%b%d'))
+    elif not output_file.startswith('file:'):
+        output_file = 'file:' + output_file
     common.logger.info('Output: %s', output_file)
     process.FEVTDEBUGHLToutput.fileName = cms.untracked.string(output_file)
 
@@ -80,10 +79,6 @@ def reco(input_rootfiles, pu_rootfiles=None, n_events=1):
         "keep *_AllSimTracksAndVerticesProducer_*_*",
         ])
 
-    # process.cfviewer = cms.EDAnalyzer("cfviewer")
-    # process.cfviewer_step = cms.Path(process.cfviewer)
-    # process.schedule.append(process.cfviewer_step)
-
     process.AllSimTracksAndVerticesProducer = cms.EDProducer("AllSimTracksAndVerticesProducer")
     process.AllSimTracksAndVerticesProducer_step = cms.Path(process.AllSimTracksAndVerticesProducer)
     process.schedule.append(process.AllSimTracksAndVerticesProducer_step)
@@ -93,8 +88,20 @@ def reco(input_rootfiles, pu_rootfiles=None, n_events=1):
 
 from FWCore.ParameterSet.VarParsing import VarParsing
 options = VarParsing('analysis')
-options.register('pu', '', VarParsing.multiplicity.list, VarParsing.varType.string, 'List of PU rootfiles')
+options.register('pu', '', VarParsing.multiplicity.list, VarParsing.varType.string, 'List of PU rootfiles or catalog:<directory> (see pileup_catalog.py)')
 options.register('n', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Number of events')
+options.register('out', '', VarParsing.multiplicity.singleton, VarParsing.varType.string, 'Output file (default: dated name)')
+options.register('seed', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Random seed')
+options.register('shard', 0, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Index of this shard')
+options.register('nShards', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Number of shards the n events are split over')
+options.register('premix', False, VarParsing.multiplicity.singleton, VarParsing.varType.bool, 'Input was digitized with a premixed pileup library')
+options.register('profileMixing', '', VarParsing.multiplicity.singleton, VarParsing.varType.string, 'Write a crossing frame profile (cfviewer) to this file')
+pileup_catalog.add_options(options)
+common.add_threading_options(options)
 options.parseArguments()
-process = reco(options.inputFiles, options.pu, n_events=options.n)
+process = reco(options.inputFiles, pileup_catalog.resolve(options.pu, options.scratch), n_events=options.n, output_file=options.out, seed=options.seed, premix=options.premix)
+threading = common.threading_from_options(process, options)
+if options.nShards > 1: common.shard(process, options.shard, options.nShards, options.n, options.seed)
+if options.profileMixing: common.add_mixing_profile(process, options.profileMixing)
 common.logger.info('Created process %s', process)
+common.check_threading(process, threading)
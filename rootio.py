@@ -0,0 +1,198 @@
+"""
+Lazy access to the products of an EDM Events tree.
+
+Looping `for _ in tree` or calling `tree.GetEntry(i)` reads every branch
+of the entry, while the inspection tools only use a handful of them. An
+`EventView` instead only loads the tree for the entry, and reads a branch
+when its product is first asked for; the product is memoized for the rest
+of the event. Branches that are never asked for are never read.
+
+    with rootio.open_root('reco.root') as f:
+        tree = f.Get('Events')
+        rootio.prepare_tree(tree, ['PCaloHits_g4SimHits_HGCHitsEE_SIM'])
+        for event in rootio.iter_events(tree, n=10):
+            print(event.size('PCaloHits_g4SimHits_HGCHitsEE_SIM'))
+
+`prepare_tree` disables all other branches and sets up a TTreeCache for
+the ones that are used; files are opened with asynchronous prefetching.
+"""
+from __future__ import print_function
+import os
+from contextlib import contextmanager
+
+import ROOT
+
+
+def enable_async_prefetching(enable=True):
+    """
+    Lets TFile prefetch the blocks of the TTreeCache in a separate thread.
+    Only affects files opened afterwards.
+    """
+    ROOT.gEnv.SetValue('TFile.AsyncPrefetching', 1 if enable else 0)
+
+
+@contextmanager
+def open_root(rootfile, mode='read', prefetch=None):
+    """
+    Opens a ROOT file. Asynchronous prefetching is on for reading, unless
+    `prefetch` is False or $PU_ASYNC_PREFETCH is 0.
+    """
+    if prefetch is None:
+        prefetch = mode == 'read' and os.environ.get('PU_ASYNC_PREFETCH', '1') != '0'
+    enable_async_prefetching(prefetch)
+    tfile = None
+    try:
+        tfile = ROOT.TFile.Open(rootfile, mode)
+        if not tfile or tfile.IsZombie():
+            raise Exception('Could not open {}'.format(rootfile))
+        yield tfile
+    finally:
+        if tfile: tfile.Close()
+
+
+def find_branch(tree, name):
+    """
+    Returns the TBranch `name` (EDM product branches have a trailing '.'),
+    or None.
+    """
+    return tree.GetBranch(name) or tree.GetBranch(name + '.') or None
+
+
+def resolve_branch(tree, branch):
+    """
+    Returns the first existing branch out of `branch`, which is a branch
+    name or a list of candidate names (e.g. the same product with the
+    SIM and HLT process names).
+    """
+    candidates = [branch] if isinstance(branch, str) else list(branch)
+    for name in candidates:
+        if find_branch(tree, name): return name
+    raise Exception('None of the branches {} exist'.format(', '.join(candidates)))
+
+
+def cache_size(tree, tbranches, min_bytes=8*1024**2, max_bytes=256*1024**2):
+    """
+    TTreeCache size that holds one cluster of baskets of `tbranches` (with
+    some headroom), so every cluster is read in one go.
+    Override with $PU_TREECACHE_MB.
+    """
+    if 'PU_TREECACHE_MB' in os.environ:
+        return int(float(os.environ['PU_TREECACHE_MB']) * 1024**2)
+    n_entries = max(int(tree.GetEntries()), 1)
+    bytes_per_entry = sum(b.GetZipBytes('*') for b in tbranches) / n_entries
+    auto_flush = int(tree.GetAutoFlush())
+    if auto_flush > 0:
+        cluster_entries = auto_flush
+    elif auto_flush < 0:
+        # Negative AutoFlush is the cluster size in bytes of the whole tree
+        cluster_entries = -auto_flush / max(tree.GetZipBytes() / n_entries, 1.)
+    else:
+        cluster_entries = n_entries
+    cluster_entries = min(max(cluster_entries, 1), n_entries)
+    return int(min(max(1.2 * bytes_per_entry * cluster_entries, min_bytes), max_bytes))
+
+
+def prepare_tree(tree, branches=None, learn_entries=10, size=None):
+    """
+    Sets up `tree` for reading only `branches` (names or lists of candidate
+    names, see `resolve_branch`):
+    - all other branches are disabled with SetBranchStatus
+    - a TTreeCache is sized for one cluster of the enabled branches
+      (see `cache_size`), and the branches are added to it
+
+    Without `branches`, nothing is disabled and the cache learns the
+    branches that are read in the first `learn_entries` entries.
+    Returns the cache size in bytes.
+    """
+    if branches is None:
+        tbranches = list(tree.GetListOfBranches())
+    else:
+        tbranches = [find_branch(tree, resolve_branch(tree, b)) for b in branches]
+        tree.SetBranchStatus('*', 0)
+        for tbranch in tbranches:
+            tree.SetBranchStatus(tbranch.GetName() + '*', 1)
+    if size is None: size = cache_size(tree, tbranches)
+    tree.SetCacheSize(size)
+    if branches is None:
+        tree.SetCacheLearnEntries(learn_entries)
+    else:
+        for tbranch in tbranches:
+            tree.AddBranchToCache(tbranch.GetName() + '*', True)
+        tree.StopCacheLearningPhase()
+    return size
+
+
+class EventView(object):
+    """
+    One entry of an Events tree. `product(branch)` reads the branch on first
+    use, and returns the same product for the rest of the event. `branch`
+    may be a list of candidate names (see `resolve_branch`).
+
+    Products are owned by the tree: once another entry is read, products
+    from the previous view are invalid.
+    """
+    def __init__(self, tree, entry, branches=None):
+        self.tree = tree
+        self.entry = entry
+        self.local_entry = tree.LoadTree(entry)
+        if self.local_entry < 0:
+            raise Exception('Could not load entry {} ({})'.format(entry, self.local_entry))
+        # name -> (resolved name, TBranch, tree number); shared between the views of one tree
+        self.branches = {} if branches is None else branches
+        self._products = {}
+
+    def __repr__(self):
+        return '<EventView entry={} read={}>'.format(self.entry, len(self._products))
+
+    def _branch(self, branch):
+        """
+        Returns (resolved name, TBranch). TBranches are looked up again
+        when a TChain moves on to the next file.
+        """
+        key = branch if isinstance(branch, str) else tuple(branch)
+        tree_number = self.tree.GetTreeNumber()
+        if key not in self.branches or self.branches[key][2] != tree_number:
+            name = resolve_branch(self.tree, branch)
+            self.branches[key] = (name, find_branch(self.tree, name), tree_number)
+        return self.branches[key][:2]
+
+    def has(self, branch):
+        try:
+            self._branch(branch)
+            return True
+        except Exception:
+            return False
+
+    def product(self, branch):
+        key = branch if isinstance(branch, str) else tuple(branch)
+        if key not in self._products:
+            name, tbranch = self._branch(branch)
+            if tbranch.GetEntry(self.local_entry) < 0:
+                raise Exception('Could not read branch {} for entry {}'.format(name, self.entry))
+            obj = getattr(self.tree, name)
+            # Products are stored in an edm::Wrapper; auxiliary branches such
+            # as EventAuxiliary are not
+            self._products[key] = obj.product() if hasattr(obj, 'product') else obj
+        return self._products[key]
+
+    __getitem__ = product
+
+    def size(self, branch):
+        """
+        Number of objects in the product, without converting it to a list.
+        """
+        return int(self.product(branch).size())
+
+
+def iter_events(tree, n=None, entries=None):
+    """
+    Yields an EventView for the first `n` entries (default: all), or for
+    the entries in `entries`.
+    """
+    if entries is None:
+        n_entries = int(tree.GetEntries())
+        if n is not None: n_entries = min(n, n_entries)
+        entries = range(n_entries)
+    branches = {}
+    for entry in entries:
+        yield EventView(tree, entry, branches)
@@ -3,6 +3,7 @@ import os, os.path as osp, importlib
 import FWCore.ParameterSet.Config as cms
 
 import common
+import pileup_catalog
 
 
 def sim(
@@ -92,8 +93,12 @@ def sim(
 
 from FWCore.ParameterSet.VarParsing import VarParsing
 options = VarParsing('analysis')
-options.register('pu', '', VarParsing.multiplicity.list, VarParsing.varType.string, 'List of PU rootfiles')
+options.register('pu', '', VarParsing.multiplicity.list, VarParsing.varType.string, 'List of PU rootfiles or catalog:<directory> (see pileup_catalog.py)')
 options.register('n', 1, VarParsing.multiplicity.singleton, VarParsing.varType.int, 'Number of events')
+pileup_catalog.add_options(options)
+common.add_threading_options(options)
 options.parseArguments()
-process = sim(options.inputFiles, pu_rootfiles=options.pu, n_events=options.n)
+process = sim(options.inputFiles, pu_rootfiles=pileup_catalog.resolve(options.pu, options.scratch), n_events=options.n)
+threading = common.threading_from_options(process, options)
 common.logger.info('Created process %s', process)
+common.check_threading(process, threading)
@@ -0,0 +1,158 @@
+"""
+Array-backed SimTrack parent/child hierarchy.
+
+A SimTrack points to its production vertex (`vertIndex()`), and a
+SimVertex points to its parent track by track id (`parentIndex()`). The
+tree resolves this to positions in the track list with one vectorized
+pass, instead of one Python object per track.
+"""
+from __future__ import print_function
+import sys
+import numpy as np
+
+
+class SimTrackTree(object):
+    """
+    Hierarchy of N tracks as flat arrays:
+    - `parent`: position of the parent track, -1 if there is none
+    - `children`, `offsets`: CSR layout; the children of track i are
+      `children[offsets[i]:offsets[i+1]]`, in track list order
+    - `roots`: positions of the tracks without parent
+    """
+    def __init__(self, parent):
+        self.parent = np.asarray(parent, dtype=np.int64)
+        n = len(self.parent)
+        has_parent = self.parent >= 0
+        child_positions = np.nonzero(has_parent)[0]
+        order = np.argsort(self.parent[child_positions], kind='stable')
+        self.children = child_positions[order]
+        self.offsets = np.zeros(n+1, dtype=np.int64)
+        np.cumsum(np.bincount(self.parent[has_parent], minlength=n), out=self.offsets[1:])
+        self.roots = np.nonzero(~has_parent)[0]
+
+    def __len__(self):
+        return len(self.parent)
+
+    def __repr__(self):
+        return '<SimTrackTree ntracks={} nroots={}>'.format(len(self), len(self.roots))
+
+    def children_of(self, i):
+        return self.children[self.offsets[i]:self.offsets[i+1]]
+
+    @classmethod
+    def from_arrays(
+        cls, track_ids, vert_index, vertex_parent_ids,
+        track_event_ids=None, vertex_event_ids=None
+        ):
+        """
+        Builds the tree from:
+        - `track_ids`: trackId() per track
+        - `vert_index`: vertIndex() per track
+        - `vertex_parent_ids`: parentIndex() per vertex (a track id, -1 if none)
+
+        Track ids are only unique within one (event, bunch crossing). For
+        tracks from several, e.g. the AllSimTracks of a crossing frame, also
+        pass the raw EncodedEventIds of the tracks and vertices; the parent
+        of a track is then looked up in the event of its production vertex.
+        """
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        vert_index = np.asarray(vert_index, dtype=np.int64)
+        vertex_parent_ids = np.asarray(vertex_parent_ids, dtype=np.int64)
+        n = len(track_ids)
+        if n == 0: return cls(np.zeros(0, dtype=np.int64))
+
+        has_vertex = (vert_index >= 0) & (vert_index < len(vertex_parent_ids))
+        safe_vert_index = np.where(has_vertex, vert_index, 0)
+        parent_ids = np.where(has_vertex, vertex_parent_ids[safe_vert_index], -1)
+
+        def key(event_ids, ids):
+            ids = ids.astype(np.uint64) & np.uint64(0xffffffff)
+            if event_ids is None: return ids
+            return (event_ids.astype(np.uint64) << np.uint64(32)) | ids
+
+        track_keys = key(
+            None if track_event_ids is None else np.asarray(track_event_ids, dtype=np.int64),
+            track_ids
+            )
+        parent_keys = key(
+            None if vertex_event_ids is None else np.asarray(vertex_event_ids, dtype=np.int64)[safe_vert_index],
+            parent_ids
+            )
+
+        order = np.argsort(track_keys, kind='stable')
+        sorted_keys = track_keys[order]
+        pos = np.minimum(np.searchsorted(sorted_keys, parent_keys), n-1)
+        found = (parent_ids != -1) & (sorted_keys[pos] == parent_keys)
+        return cls(np.where(found, order[pos], -1))
+
+    @classmethod
+    def from_columns(cls, tracks, vertices, use_event_ids=False):
+        """
+        Builds the tree from the columns of `columns.simtracks` and
+        `columns.simvertices`. Set `use_event_ids` for tracks from several
+        events.
+        """
+        if not use_event_ids:
+            return cls.from_arrays(tracks['track_id'], tracks['vert_index'], vertices['parent_index'])
+        return cls.from_arrays(
+            tracks['track_id'], tracks['vert_index'], vertices['parent_index'],
+            tracks['event_id'], vertices['event_id']
+            )
+
+
+def iter_preorder(tree, roots=None):
+    """
+    Yields (track position, depth) for all tracks below `roots` (default:
+    all roots of the tree), parents before children. Uses an explicit
+    stack, so the cost per track does not grow with depth and deep showers
+    cannot hit the recursion limit.
+    """
+    children = tree.children.tolist()
+    offsets = tree.offsets.tolist()
+    if roots is None: roots = tree.roots
+    stack = [(int(root), 0) for root in reversed(roots)]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        i, depth = pop()
+        yield i, depth
+        begin, end = offsets[i], offsets[i+1]
+        if begin != end:
+            extend((child, depth+1) for child in reversed(children[begin:end]))
+
+
+def iter_postorder(tree, roots=None):
+    """
+    Like `iter_preorder`, but yields children before their parent.
+    """
+    children = tree.children.tolist()
+    offsets = tree.offsets.tolist()
+    if roots is None: roots = tree.roots
+    stack = [(int(root), 0, False) for root in reversed(roots)]
+    pop = stack.pop
+    append = stack.append
+    extend = stack.extend
+    while stack:
+        i, depth, expanded = pop()
+        begin, end = offsets[i], offsets[i+1]
+        if expanded or begin == end:
+            yield i, depth
+            continue
+        append((i, depth, True))
+        extend((child, depth+1, False) for child in reversed(children[begin:end]))
+
+
+def write_tree(tree, format_track, out=None, order='pre', roots=None, indent='  ', chunk_size=4096):
+    """
+    Writes one line per track, `indent`*depth + format_track(position),
+    to `out` (default: stdout). Lines are joined and written in chunks.
+    """
+    if out is None: out = sys.stdout
+    traverse = dict(pre=iter_preorder, post=iter_postorder)[order]
+    lines = []
+    for i, depth in traverse(tree, roots):
+        lines.append(indent*depth + format_track(i) + '\n')
+        if len(lines) >= chunk_size:
+            out.write(''.join(lines))
+            del lines[:]
+    out.write(''.join(lines))
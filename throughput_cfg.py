@@ -0,0 +1,46 @@
+"""
+Throughput test of AllSimTracksAndVerticesProducer: mixes the pileup into
+the SimTracks and SimVertices of a DIGI file (no digitization) and runs
+the producer on the crossing frames. With producer=False only the mixing
+runs, as a baseline. The Timing service writes the event throughput to
+the framework job report; see bench_throughput.py for a scan over threads:
+
+    cmsRun -j report.xml throughput_cfg.py inputFiles=file:muon_digi.root pu=file:minbias.root nThreads=8
+"""
+import FWCore.ParameterSet.Config as cms
+from FWCore.ParameterSet.VarParsing import VarParsing
+
+import common
+import drivers
+import pileup_catalog
+
+options = VarParsing('analysis')
+options.register('pu', '', VarParsing.multiplicity.list, VarParsing.varType.string, 'List of PU rootfiles or catalog:<directory> (see pileup_catalog.py)')
+options.register('avgPU', 4., VarParsing.multiplicity.singleton, VarParsing.varType.float, 'Average number of pileup interactions per bunch crossing')
+options.register('producer', True, VarParsing.multiplicity.singleton, VarParsing.varType.bool, 'Run the producer (False: only the mixing)')
+pileup_catalog.add_options(options)
+common.add_threading_options(options)
+options.parseArguments()
+
+process = common.load_process_from_driver(drivers.reco_d86_driver(), 'reco_driver.py')
+common.rng(process, 1)
+threading = common.threading_from_options(process, options)
+process.source.fileNames = cms.untracked.vstring(options.inputFiles)
+process.maxEvents.input = cms.untracked.int32(options.maxEvents)
+process.mix.input.fileNames = cms.untracked.vstring(pileup_catalog.resolve(options.pu, options.scratch))
+process.mix.input.nbPileupEvents.averageNumber = cms.double(options.avgPU)
+# Only the crossing frames are needed
+process.mix.digitizers = cms.PSet()
+
+process.AllSimTracksAndVerticesProducer = cms.EDProducer("AllSimTracksAndVerticesProducer")
+if options.producer:
+    process.throughput_step = cms.Path(process.AllSimTracksAndVerticesProducer, cms.Task(process.mix))
+else:
+    process.throughput_step = cms.Path(process.mix)
+process.schedule = cms.Schedule(process.throughput_step)
+
+process.Timing = cms.Service("Timing", summaryOnly = cms.untracked.bool(True))
+process.MessageLogger.cerr.FwkReport.reportEvery = 100
+
+common.logger.info('Created process %s', process)
+common.check_threading(process, threading)
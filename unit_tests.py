@@ -3,7 +3,7 @@ from __future__ import print_function
 import common
 
 
-def test_cmsdriver():
+def make_test_driver():
     driver = common.CMSDriver('TTbar_14TeV_TuneCP5_cfi')
     driver.args.extend(['--no_exec'])
     driver.kwargs.update({
@@ -18,9 +18,476 @@ def test_cmsdriver():
         '--pileup'          : 'NoPileUp',
         '--python_filename' : 'test.py',
         })
+    return driver
+
+
+def test_cmsdriver():
+    driver = make_test_driver()
     print(driver)
     # common.run_driver_cmd(driver)
     process = common.load_process_from_driver(driver)
 
+
+def test_process_cache():
+    import FWCore.ParameterSet.Config as cms
+    driver = make_test_driver()
+    process = common.load_process_from_driver(driver)
+    process.maxEvents.input = cms.untracked.int32(5)
+    clone = common.load_process_from_driver(driver)
+    assert clone.maxEvents.input.value() == 10
+    assert common.clone_process(process).maxEvents.input.value() == 5
+
+
+def test_driver_cache_lru():
+    import tempfile, os
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = common.DriverCache(tmpdir, max_bytes=10**6, max_entries=2)
+        drivers = [common.CMSDriver('driver{}'.format(i)) for i in range(3)]
+        os.makedirs(cache.path)
+        for i, driver in enumerate(drivers):
+            with open(cache.config_path(driver), 'w') as f:
+                f.write('# config {}\n'.format(i))
+            os.utime(cache.config_path(driver), (i, i))
+        assert common.run_driver_cmd(drivers[0], cache=cache) == cache.config_path(drivers[0])
+        cache.evict()
+        assert cache.has(drivers[0])
+        assert not cache.has(drivers[1])
+        assert cache.has(drivers[2])
+
+
+def test_shard_range():
+    ranges = [common.shard_range(10, i, 3) for i in range(3)]
+    assert ranges == [(0, 4), (4, 3), (7, 3)]
+    assert common.shard_seed(1, 0, 'generator') != common.shard_seed(1, 1, 'generator')
+    assert common.shard_seed(1, 0, 'generator') == common.shard_seed(1, 0, 'generator')
+
+
+def test_shard_pool_source():
+    import FWCore.ParameterSet.Config as cms
+    n_events, n_shards = 10, 3
+    covered = []
+    for i_shard in range(n_shards):
+        process = cms.Process('TEST')
+        process.source = cms.Source('PoolSource', fileNames = cms.untracked.vstring('file:merged.root'))
+        process.maxEvents = cms.untracked.PSet(input = cms.untracked.int32(-1))
+        process.RandomNumberGeneratorService = cms.Service('RandomNumberGeneratorService')
+        common.shard(process, i_shard, n_shards, n_events)
+        # Lumis of the input must not be skipped
+        assert not hasattr(process.source, 'firstLuminosityBlock')
+        first = process.source.skipEvents.value()
+        covered.extend(range(first, first + process.maxEvents.input.value()))
+    assert covered == list(range(n_events))
+
+def test_executor():
+    executor = common.Executor(max_jobs=2)
+    jobs = [common.Job(['echo', str(i)]) for i in range(4)] + [common.Job(['false'])]
+    assert executor.run(jobs, stop_on_error=False) == [0, 0, 0, 0, 1]
+    assert [job.output for job in jobs[:4]] == [['{}\n'.format(i)] for i in range(4)]
+    assert all(job.resources['wall'] > 0. for job in jobs)
+    # I/O of a job includes its children, and reads served from the page cache
+    job = common.Job(['sh', '-c', 'head -c 100000 /dev/zero | cat > /dev/null'])
+    executor.run([job])
+    assert job.resources['read_bytes'] >= 100000 and job.resources['write_bytes'] >= 100000
+    assert len(common.format_resources(jobs).splitlines()) == 2 + len(jobs)
+    assert len(executor.finished) == 6
+    assert common.run_command(['echo', 'hi']) == (0, ['hi\n'])
+    try:
+        common.run_command(['false'])
+    except Exception:
+        pass
+    else:
+        raise AssertionError('run_command did not raise')
+
+
+def test_executor_many_jobs():
+    import os
+    # More jobs at a time than threads in the default pool of the loop
+    n_pool = min(32, (os.cpu_count() or 1) + 4)
+    executor = common.Executor(max_jobs=n_pool + 4)
+    jobs = [common.Job(['sleep', '2']) for i in range(n_pool)] + [common.Job(['sleep', '.2']) for i in range(4)]
+    assert executor.run(jobs) == [0] * len(jobs)
+    # Short jobs are reaped as soon as they exit, not after the long ones
+    assert max(job.resources['wall'] for job in jobs[n_pool:]) < 1.
+
+
+def test_executor_cancel():
+    import time
+    executor = common.Executor(max_jobs=2)
+    # A job that ignores SIGTERM is killed after the timeout
+    jobs = [common.Job(['sh', '-c', 'trap "" TERM; sleep 30']), common.Job(['sh', '-c', 'sleep .5; false'])]
+    t0 = time.monotonic()
+    try:
+        executor.run(jobs)
+    except Exception as e:
+        assert 'Status 1' in str(e)
+    else:
+        raise AssertionError('Failing job did not raise')
+    assert time.monotonic() - t0 < 15.
+    # Descendants of cancelled jobs are terminated too
+    jobs = [common.Job(['sh', '-c', 'sleep 30 & echo $!; wait']), common.Job(['sh', '-c', 'sleep .5; false'])]
+    try:
+        executor.run(jobs)
+    except Exception:
+        pass
+    grandchild = int(jobs[0].output[0])
+    time.sleep(.1)
+    try:
+        with open('/proc/{}/stat'.format(grandchild), 'r') as f:
+            assert f.read().split(')')[-1].split()[0] == 'Z'
+    except FileNotFoundError:
+        pass
+
+
+def test_pipeline_fingerprint():
+    import pipeline
+    p = pipeline.default_pipeline('muon', n_events=1, n_pu_events=2, seed=1)
+    names = [step.name for step in p.sorted_steps()]
+    assert names.index('minbias_gensim_n2') < names.index('muon_digi_n1') < names.index('muon_reco_n1')
+    other = pipeline.default_pipeline('muon', n_events=1, n_pu_events=2, seed=2)
+    assert p.steps[-1].fingerprint() != other.steps[-1].fingerprint()
+    assert p.steps[-1].fingerprint() == pipeline.default_pipeline('muon', 1, 2, 1).steps[-1].fingerprint()
+
+
+def test_pipeline_premix():
+    import pipeline
+    muon = {s.name: s for s in pipeline.default_pipeline('muon', 2, 10, n_premix_events=5).steps}
+    tau = {s.name: s for s in pipeline.default_pipeline('tau', 2, 10, n_premix_events=5).steps}
+    library = muon['premix_pu4.0_n5']
+    assert muon['muon_digi_n2'].pu == [library]
+    assert 'premix=True' in muon['muon_digi_n2'].cmd()
+    assert muon['muon_reco_n2'].pu == []
+    # One library for all signal samples
+    assert library.fingerprint() == tau['premix_pu4.0_n5'].fingerprint()
+
+
+def test_simtracktree():
+    import simtree
+    # Two events with overlapping track ids; vertex 0 of each event has no parent
+    track_ids = [1, 2, 3, 1, 2]
+    vert_index = [0, 1, 2, 3, 4]
+    vertex_parent_ids = [-1, 1, 2, -1, 1]
+    event_ids = [0, 0, 0, 1, 1]
+    tree = simtree.SimTrackTree.from_arrays(track_ids, vert_index, vertex_parent_ids, event_ids, event_ids)
+    assert list(tree.parent) == [-1, 0, 1, -1, 3]
+    assert list(tree.roots) == [0, 3]
+    assert list(tree.children_of(0)) == [1]
+    assert list(tree.children_of(2)) == []
+    assert list(tree.offsets) == [0, 1, 2, 2, 3, 3]
+
+
+def test_simtracktree_traversal():
+    import io
+    import simtree
+    tree = simtree.SimTrackTree([-1, 0, 0, 1, -1])
+    assert list(simtree.iter_preorder(tree)) == [(0, 0), (1, 1), (3, 2), (2, 1), (4, 0)]
+    assert list(simtree.iter_postorder(tree)) == [(3, 2), (1, 1), (2, 1), (0, 0), (4, 0)]
+    out = io.StringIO()
+    simtree.write_tree(tree, str, out)
+    assert out.getvalue() == '0\n  1\n    3\n  2\n4\n'
+    # Deeper than the recursion limit
+    n = 100000
+    chain = simtree.SimTrackTree([-1] + list(range(n-1)))
+    assert sum(1 for _ in simtree.iter_preorder(chain)) == n
+
+
+def test_columns():
+    import numpy as np
+    import columns
+    cols = columns.to_columns([1., 2.5, 2., 3.5], ['id', 'energy'], [np.uint32, np.float64])
+    assert cols['id'].dtype == np.uint32
+    assert list(cols['id']) == [1, 2]
+    assert list(cols['energy']) == [2.5, 3.5]
+    merged = columns.concatenate([
+        dict(particle_id=np.array([1, 2]), hit_id=np.array([10, 11, 12])),
+        dict(particle_id=np.array([3]), hit_id=np.array([13])),
+        ])
+    assert list(merged['offsets']) == [0, 2, 3]
+    assert list(merged['hit_offsets']) == [0, 3, 4]
+
+
+def test_column_cache():
+    import tempfile, os.path as osp
+    import numpy as np
+    import column_cache
+    with tempfile.TemporaryDirectory() as tmp:
+        rootfile = osp.join(tmp, 'test.root')
+        with open(rootfile, 'wb') as f: f.write(b'not really a root file')
+        cache = column_cache.ColumnCache(rootfile)
+        assert cache.path == rootfile + '.columns'
+        meta = cache.meta('SimTracks_g4SimHits__SIM', test_column_cache, 2)
+        assert cache.load('tracks', meta) is None
+        cache.store('tracks', meta, dict(track_id=np.array([1, 2, 3]), offsets=np.array([0, 1, 3])))
+        cols = cache.load('tracks', meta)
+        assert isinstance(cols['track_id'], np.memmap)
+        assert list(cols['track_id']) == [1, 2, 3]
+        # A matching entry (e.g. stored by a concurrent process) is kept, unless replaced
+        cache.store('tracks', meta, dict(track_id=np.array([4]), offsets=np.array([0, 1])))
+        assert list(cache.load('tracks', meta)['track_id']) == [1, 2, 3]
+        cache.store('tracks', meta, dict(track_id=np.array([4]), offsets=np.array([0, 1])), replace=True)
+        assert list(cache.load('tracks', meta)['track_id']) == [4]
+        with cache.lock(): pass
+        # Entries are invalidated by a different branch or a changed file
+        assert cache.load('tracks', cache.meta('SimTracks_g4SimHits__HLT', test_column_cache, 2)) is None
+        with open(rootfile, 'ab') as f: f.write(b'!')
+        assert cache.load('tracks', cache.meta('SimTracks_g4SimHits__SIM', test_column_cache, 2)) is None
+
+
+def test_match_simclusters():
+    import numpy as np
+    import print_reco
+    simclusters = dict(
+        particle_id=np.array([1, 2]), hit_cluster=np.array([0, 0, 0, 1]),
+        hit_id=np.array([5, 7, 9, 7], dtype=np.uint32), hit_energy=np.array([.1, .2, .3, .4]),
+        )
+    rechits = dict(
+        ee=dict(raw_id=np.array([9, 5], dtype=np.uint32), energy=np.array([1., 2.])),
+        hef=dict(raw_id=np.array([], dtype=np.uint32), energy=np.array([])),
+        heb=dict(raw_id=np.array([100], dtype=np.uint32), energy=np.array([3.])),
+        )
+    match = print_reco.match_simclusters(simclusters, rechits)
+    assert list(match['hit_subdet']) == [0, -1, 0, -1]
+    assert list(match['n_matched']) == [2, 0]
+    assert list(match['n_unmatched']) == [1, 1]
+    assert np.allclose(match['matched_energy_fraction'], [.4/.6, 0.])
+    assert match['n_matched_subdet'].tolist() == [[2, 0, 0], [0, 0, 0]]
+
+
+def test_eventview():
+    import rootio
+    reads = []
+    class Branch(object):
+        def __init__(self, name): self.name = name
+        def GetEntry(self, entry):
+            reads.append((self.name, entry))
+            return 1
+    class Vector(list):
+        def size(self): return len(self)
+    class Product(object):
+        def product(self): return Vector([1, 2, 3])
+    class Tree(object):
+        def GetEntries(self): return 2
+        def LoadTree(self, entry): return entry
+        def GetTreeNumber(self): return 0
+        def GetBranch(self, name): return Branch(name) if name in ['a.', 'b_HLT.'] else None
+        def __getattr__(self, name): return Product()
+    for event in rootio.iter_events(Tree()):
+        assert event.size('a') == 3
+        assert event.size(['b_SIM', 'b_HLT']) == 3
+        event.product('a')
+        assert not event.has('c')
+    assert reads == [('a.', 0), ('b_HLT.', 0), ('a.', 1), ('b_HLT.', 1)]
+
+
+def test_event_index():
+    import numpy as np
+    import event_index
+    assert event_index.parse_event('3471') == 3471
+    assert event_index.parse_event('1:12:45071') == (1, 12, 45071)
+    assert event_index.parse_range('100:110') == (100, 110)
+    assert event_index.parse_range(':5') == (0, 5)
+    assert event_index.parse_range('7:') == (7, None)
+    index = dict(run=np.array([1, 1, 2]), lumi=np.array([1, 2, 1]), event=np.array([10, 11, 10]))
+    assert event_index.find_entry(index, 2, 1, 10) == 2
+    assert event_index.select_entries('unused.root', ['4', '2'], '0:2') == [4, 2, 0, 1]
+    assert event_index.select_entries('unused.root') is None
+    # With missing_ok (multi-file runs), entries beyond a short file are dropped
+    n_entries = event_index.n_entries
+    event_index.n_entries = lambda rootfile: 3
+    try:
+        assert event_index.select_entries('short.root', ['4', '2'], '1:10', missing_ok=True) == [2, 1, 2]
+    finally:
+        event_index.n_entries = n_entries
+
+
+def test_fanout_inputs():
+    import tempfile, os.path as osp
+    import fanout
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [osp.join(tmp, name) for name in ['b.root', 'a.root', 'c.txt']]
+        for path in paths: open(path, 'w').close()
+        filelist = osp.join(tmp, 'files.txt')
+        with open(filelist, 'w') as f: f.write('# comment\n{}\n{}\n'.format(paths[2], paths[0]))
+        assert fanout.expand_inputs([osp.join(tmp, '*.root'), '@' + filelist]) == [paths[1], paths[0], paths[2]]
+        tasks = fanout.make_tasks(paths[:2], events=['3'])
+        assert tasks == [(paths[0], None, (['3'], None, True)), (paths[1], None, (['3'], None, True))]
+
+
+def test_compression_presets():
+    import FWCore.ParameterSet.Config as cms
+    assert common.compression_settings('archival') == 209
+    assert common.compression_settings('balanced') == 505
+    assert common.compression_settings('fast') == 404
+    output = cms.OutputModule('NanoAODOutputModule')
+    common.set_compression(output, 'fast')
+    assert output.compressionAlgorithm.value() == 'LZ4'
+    assert output.compressionLevel.value() == 4
+
+
+def test_threading():
+    import FWCore.ParameterSet.Config as cms
+    process = cms.Process('TEST')
+    settings = common.set_threading(process, 4, n_concurrent_lumis=2)
+    assert process.options.numberOfThreads.value() == 4
+    assert process.options.numberOfStreams.value() == 0
+    assert process.options.numberOfConcurrentLuminosityBlocks.value() == 2
+    assert 'eventSetup.numberOfConcurrentIOVs' not in settings
+    common.check_threading(process, settings)
+    # As in the step scripts: threading applied from the options when the
+    # process is made, checked at the end; a customisation in between that
+    # replaces process.options must not go unnoticed
+    from argparse import Namespace
+    options = Namespace(nThreads=4, nStreams=0, nConcurrentLumis=0, nConcurrentIOVs=0)
+    process = cms.Process('TEST')
+    settings = common.threading_from_options(process, options)
+    process.options = cms.untracked.PSet(numberOfThreads = cms.untracked.uint32(1))
+    try:
+        common.check_threading(process, settings)
+    except Exception as e:
+        assert 'numberOfThreads=1 (requested 4)' in str(e)
+    else:
+        assert False, 'Overridden threads not detected'
+
+
+def test_pileup_catalog():
+    import tempfile, os, os.path as osp
+    import pileup_catalog
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = osp.join(tmp, 'minbias')
+        os.makedirs(directory)
+        catalog = pileup_catalog.Catalog(directory)
+        for i, content in enumerate([b'first minbias file', b'second']):
+            path = osp.join(directory, 'minbias{}.root'.format(i))
+            with open(path, 'wb') as f: f.write(content)
+            catalog.files[osp.basename(path)] = dict(
+                size=len(content), mtime=os.stat(path).st_mtime, n_events=10, adler32=pileup_catalog.adler32(path)
+                )
+        catalog.save()
+        catalog = pileup_catalog.Catalog.load(directory)
+        assert catalog.n_events == 20 and catalog.verify() == []
+        assert pileup_catalog.resolve(['catalog:' + directory, 'file:other.root'], scratch='') == [
+            'file:' + osp.join(directory, 'minbias0.root'), 'file:' + osp.join(directory, 'minbias1.root'), 'file:other.root'
+            ]
+        scratch = osp.join(tmp, 'scratch')
+        staged = pileup_catalog.resolve(['catalog:' + directory], scratch=scratch)
+        staged_dir = pileup_catalog.scratch_dir(scratch, directory)
+        assert osp.basename(staged_dir).startswith('minbias_')
+        assert staged_dir != pileup_catalog.scratch_dir(scratch, osp.join(tmp, 'other', 'minbias'))
+        assert staged == ['file:' + osp.join(staged_dir, 'minbias{}.root'.format(i)) for i in range(2)]
+        with open(staged[0][len('file:'):], 'rb') as f: assert f.read() == b'first minbias file'
+        # A copy of the right size without a verified stamp is staged again
+        copy = staged[0][len('file:'):]
+        with open(copy, 'wb') as f: f.write(b'FIRST minbias file')
+        os.remove(copy + '.adler32')
+        catalog.stage(staged_dir)
+        with open(copy, 'rb') as f: assert f.read() == b'first minbias file'
+        # Copies staged from the command line are the ones jobs use
+        import subprocess, sys
+        cli_scratch = osp.join(tmp, 'cli_scratch')
+        subprocess.check_call([sys.executable, pileup_catalog.__file__, 'stage', directory, cli_scratch])
+        mtimes = [os.stat(osp.join(pileup_catalog.scratch_dir(cli_scratch, directory), name)).st_mtime_ns for name in catalog.files]
+        staged = pileup_catalog.resolve(['catalog:' + directory], scratch=cli_scratch)
+        assert [os.stat(path[len('file:'):]).st_mtime_ns for path in staged] == mtimes
+        # Corrupted files are caught
+        with open(osp.join(directory, 'minbias1.root'), 'wb') as f: f.write(b'SECOND')
+        assert catalog.verify() == ['minbias1.root']
+
+
+def test_bench_throughput_report():
+    import tempfile, os.path as osp
+    import bench_throughput
+    with tempfile.TemporaryDirectory() as tmp:
+        report = osp.join(tmp, 'report.xml')
+        with open(report, 'w') as f:
+            f.write(
+                '<FrameworkJobReport><PerformanceReport><PerformanceSummary Metric="Timing">'
+                '<Metric Name="EventThroughput" Value="12.5"/><Metric Name="TotalJobTime" Value="8"/>'
+                '<Metric Name="Label" Value="not a number"/>'
+                '</PerformanceSummary></PerformanceReport></FrameworkJobReport>'
+                )
+        assert bench_throughput.parse_job_report(report) == {'EventThroughput': 12.5, 'TotalJobTime': 8.}
+    # Threads and streams the job actually ran with
+    common.check_job_report_threading(dict(NumberOfThreads=4., NumberOfStreams=4.), 4)
+    try:
+        common.check_job_report_threading(dict(NumberOfThreads=1., NumberOfStreams=1.), 4)
+    except Exception as e:
+        assert 'NumberOfThreads=1 (requested 4)' in str(e)
+    else:
+        assert False, 'Wrong runtime threading not detected'
+    table = bench_throughput.format_results([
+        dict(threads=1, producer=False, throughput=10.), dict(threads=1, producer=True, throughput=8.),
+        ])
+    assert table.splitlines()[-1].split() == ['1', '10.00', '8.00', '25.000']
+
+
+def test_hierarchy_columns():
+    import io
+    import numpy as np
+    import simtree
+    import print_all_tracks_and_vertices as alltracks
+    # Signal event (raw event id 0) and one pileup event with overlapping track ids
+    tracks = dict(track_id=np.array([3, 1, 2, 1, 5]), vert_index=np.array([2, 0, 1, 3, 4]), event_id=np.array([0, 0, 0, 7, 7]))
+    vertices = dict(parent_index=np.array([-1, 1, 2, -1, 1]), event_id=np.array([0, 0, 0, 7, 7]))
+    resolved = alltracks.build_tree(tracks, vertices)
+    assert list(resolved.parent) == [2, -1, 1, -1, 3]
+    # The AllSimTracksParentIndex column the producer writes for this crossing frame
+    parent_column = alltracks.columns.ints([2, -1, 1, -1, 3])['values']
+    precomputed = alltracks.build_tree(tracks, vertices, parent_column)
+    # Both give the same tree, printed the same way
+    def write(tree, order):
+        out = io.StringIO()
+        simtree.write_tree(tree, lambda i: '{}:{}'.format(tracks['event_id'][i], tracks['track_id'][i]), out=out, order=order)
+        return out.getvalue()
+    for order in ['pre', 'post']:
+        assert write(precomputed, order) == write(resolved, order)
+    assert write(precomputed, 'pre') == '0:1\n  0:2\n    0:3\n7:1\n  7:5\n'
+
+
+def test_mixing_profile():
+    import FWCore.ParameterSet.Config as cms
+    process = cms.Process('TEST')
+    process.mix = cms.EDProducer(
+        'MixingModule',
+        mixObjects = cms.PSet(mixCH = cms.PSet(
+            subdets = cms.vstring('EcalHitsEB', 'HGCHitsEE', 'HGCHitsHEfront', 'HGCHitsHEback'),
+            crossingFrames = cms.untracked.vstring('HGCHitsEE'),
+            ))
+        )
+    process.schedule = cms.Schedule()
+    common.add_mixing_profile(process, 'profile.root')
+    assert list(process.mix.mixObjects.mixCH.crossingFrames) == ['HGCHitsEE', 'HGCHitsHEfront', 'HGCHitsHEback']
+    assert process.TFileService.fileName.value() == 'profile.root'
+    tags = [tag.getModuleLabel() + ':' + tag.getProductInstanceLabel() for tag in process.cfviewer.caloHitCrossingFrames]
+    assert tags == ['mix:g4SimHitsHGCHitsEE', 'mix:g4SimHitsHGCHitsHEfront', 'mix:g4SimHitsHGCHitsHEback']
+    assert process.cfviewer_step in process.schedule
+
+
+def test_print_branches():
+    import print_branches
+    label = print_branches.product_label('recoTracks_generalTracks_MVAValues_RECO.')
+    assert label == dict(type='recoTracks', module='generalTracks', instance='MVAValues', process='RECO', label='generalTracks:MVAValues')
+    assert print_branches.product_label('SimTracks_g4SimHits__SIM.')['label'] == 'g4SimHits'
+    assert print_branches.product_label('EventAuxiliary')['type'] == 'EventAuxiliary'
+    rows = []
+    for name, zip_bytes, tot_bytes in [
+        ('SimTracks_g4SimHits__SIM.', 100, 400),
+        ('SimVertexs_g4SimHits__SIM.', 50, 100),
+        ('PCaloHits_g4SimHits_HGCHitsEE_SIM.', 300, 600),
+        ('EventAuxiliary', 10, 10),
+        ]:
+        row = dict(tree='Events', name=name, zip=zip_bytes, tot=tot_bytes, ratio=tot_bytes/zip_bytes, baskets=1, per_event=zip_bytes/10.)
+        row.update(print_branches.product_label(name))
+        rows.append(row)
+    groups = {g['name']: g for g in print_branches.group_rows(rows, 'module')}
+    assert groups['g4SimHits']['zip'] == 450 and groups['g4SimHits']['tot'] == 1100
+    assert groups['g4SimHits']['n_branches'] == 3 and groups['g4SimHits']['ratio'] == 1100 / 450
+    # Branches without a product label stay on their own
+    assert groups['EventAuxiliary']['n_branches'] == 1
+    assert print_branches.group_rows(rows, 'branch') is rows
+    # Sizes sort descending and --top keeps the largest
+    top = print_branches.sort_rows(rows, 'zip')[:2]
+    assert [r['name'] for r in top] == ['PCaloHits_g4SimHits_HGCHitsEE_SIM.', 'SimTracks_g4SimHits__SIM.']
+    assert [r['name'] for r in print_branches.sort_rows(rows)][0] == 'EventAuxiliary'
+
+
 if __name__ == '__main__':
-    test_cmsdriver()
\ No newline at end of file
+    test_cmsdriver()